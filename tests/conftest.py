@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -37,3 +39,21 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def run_background_tasks_inline(settings):
+    # Тесты с transaction=True сразу выполняют on_commit, и фоновые потоки
+    # пишут в общую базу SQLite в памяти одновременно с тестом.
+    settings.BACKGROUND_WORKERS = 0
+
+
+def pytest_collection_modifyitems(items):
+    # Общий кэш лежит в своей базе (CACHE_DATABASE), и страницы обращаются
+    # к ней: тестам с базой открываем все базы проекта.
+    for item in items:
+        marker = item.get_closest_marker('django_db')
+        if marker is not None and 'databases' not in marker.kwargs:
+            item.add_marker(pytest.mark.django_db(
+                *marker.args, databases='__all__', **marker.kwargs),
+                append=False)
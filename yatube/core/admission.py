@@ -0,0 +1,108 @@
+import itertools
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+from . import metrics
+
+SHED_REASONS = ('queue_full', 'timeout')
+
+
+class AdmissionController:
+    """
+    Ограничивает число одновременно обрабатываемых запросов процесса.
+
+    У каждого класса запросов (ADMISSION_CLASSES) свой лимит, очередь
+    и время ожидания; кроме того, общий лимит ADMISSION_CONCURRENCY.
+    Освободившееся место получает ожидающий с наименьшим priority,
+    при равном — пришедший раньше. Если очередь класса полна или время
+    ожидания вышло, запрос отклоняется.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        self._active = Counter()
+        self._waiting = []
+        self._stats = Counter()
+
+    @staticmethod
+    def get_class(name):
+        return settings.ADMISSION_CLASSES[name]
+
+    def _total_active(self):
+        return sum(self._active.values())
+
+    def _can_start(self, name):
+        return (self._active[name] < self.get_class(name)['limit']
+                and self._total_active() < settings.ADMISSION_CONCURRENCY)
+
+    def _is_next(self, ticket):
+        # Первым проходит ожидающий с лучшим приоритетом из тех,
+        # кому хватает мест: дорогой запрос не задерживает дешёвые.
+        for other in sorted(self._waiting):
+            if self._can_start(other[2]):
+                return other is ticket
+        return False
+
+    def acquire(self, name):
+        config = self.get_class(name)
+        with self._condition:
+            if self._can_start(name) and not any(
+                    self._can_start(other[2]) for other in self._waiting):
+                return self._start(name)
+            waiting = sum(1 for other in self._waiting if other[2] == name)
+            if waiting >= config['queue']:
+                return self._shed(name, 'queue_full')
+            ticket = (config['priority'], next(self._sequence), name)
+            self._waiting.append(ticket)
+            self._count(name, 'queued')
+            deadline = time.monotonic() + config['timeout']
+            try:
+                while not self._is_next(ticket):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return self._shed(name, 'timeout')
+                    self._condition.wait(remaining)
+                return self._start(name)
+            finally:
+                self._waiting.remove(ticket)
+                self._condition.notify_all()
+
+    def _start(self, name):
+        self._active[name] += 1
+        self._count(name, 'admitted')
+        return True
+
+    def _shed(self, name, reason):
+        self._count(name, reason)
+        return False
+
+    def _count(self, name, result):
+        self._stats[(name, result)] += 1
+        metrics.inc('yatube_admission_total',
+                    (('class', name), ('result', result)))
+
+    def release(self, name):
+        with self._condition:
+            self._active[name] -= 1
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            stats = {}
+            for name in settings.ADMISSION_CLASSES:
+                stats[name] = {
+                    'active': self._active[name],
+                    'waiting': sum(
+                        1 for other in self._waiting if other[2] == name),
+                    'admitted': self._stats[(name, 'admitted')],
+                    'queued': self._stats[(name, 'queued')],
+                    'shed': {reason: self._stats[(name, reason)]
+                             for reason in SHED_REASONS},
+                }
+            return stats
+
+
+admission = AdmissionController()
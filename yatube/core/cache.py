@@ -0,0 +1,236 @@
+import math
+import random
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from . import metrics
+from .models import CacheVersion
+
+Entry = namedtuple('Entry', 'value expires delta')
+
+# Все кэши процесса, для страницы статистики
+registry = {}
+
+
+class TwoTierCache:
+    """
+    Двухуровневый кэш: LRU в памяти процесса перед общим бэкендом Django.
+
+    get_or_set() пересчитывает значение только в одном потоке процесса и
+    в одном процессе (блокировка через cache.add); остальные в это время
+    получают устаревшее значение или ждут результата. Срок жизни
+    вероятностно сокращается (XFetch): чем дольше пересчёт и ближе
+    истечение, тем вероятнее, что один из запросов обновит значение
+    заранее.
+
+    Ключи включают версию всего кэша и, если задана, версию области
+    (scope): invalidate(scope) делает устаревшими только значения этой
+    области, invalidate() — все. Версии хранятся в CacheVersion и
+    увеличиваются атомарно; процесс перечитывает их не чаще раза в
+    TWO_TIER_CACHE_LOCAL_TIMEOUT.
+    """
+    def __init__(self, name, alias='default', timeout=None):
+        self.name = name
+        self.alias = alias
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._local = OrderedDict()
+        self._flights = {}
+        self._versions = OrderedDict()
+        self._stats = dict.fromkeys(
+            ('local_hits', 'shared_hits', 'misses', 'stale', 'waits'), 0)
+        registry[name] = self
+
+    def _setting(self, name):
+        return getattr(settings, f'TWO_TIER_CACHE_{name.upper()}')
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+        metrics.inc('yatube_cache_requests_total',
+                    (('cache', self.name), ('result', stat)))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['local_size'] = len(self._local)
+        requests = stats['local_hits'] + stats['shared_hits'] + stats[
+            'misses']
+        shared_requests = requests - stats['local_hits']
+        stats['local_hit_rate'] = (
+            stats['local_hits'] / requests if requests else 0.0)
+        stats['shared_hit_rate'] = (
+            stats['shared_hits'] / shared_requests
+            if shared_requests else 0.0)
+        return stats
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+            self._versions.clear()
+
+    def _local_get(self, key, now):
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            entry, local_expires = item
+            if local_expires <= now:
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return entry
+
+    def _local_set(self, key, entry, now):
+        # В памяти процесса значение живёт не дольше local_timeout:
+        # так ограничено расхождение с другими процессами.
+        local_expires = min(entry.expires, now + self._setting(
+            'local_timeout'))
+        with self._lock:
+            self._local[key] = (entry, local_expires)
+            self._local.move_to_end(key)
+            while len(self._local) > self._setting('max_size'):
+                self._local.popitem(last=False)
+
+    def _version_name(self, scope):
+        return f'{self.name}:{scope}' if scope else self.name
+
+    def _remember_version(self, scope, version, now):
+        with self._lock:
+            self._versions[scope] = (
+                version, now + self._setting('local_timeout'))
+            self._versions.move_to_end(scope)
+            while len(self._versions) > self._setting('max_size'):
+                self._versions.popitem(last=False)
+
+    def _read_version(self, scope):
+        versions = CacheVersion.objects.filter(
+            name=self._version_name(scope))
+        version = versions.values_list('version', flat=True).first()
+        if version is None:
+            # Новая версия начинается с текущего времени в мс, чтобы не
+            # вернуться к номеру, под которым лежат старые значения.
+            version = CacheVersion.objects.get_or_create(
+                name=self._version_name(scope),
+                defaults={'version': int(time.time() * 1000)},
+            )[0].version
+        return version
+
+    def get_version(self, scope=''):
+        now = time.time()
+        with self._lock:
+            cached = self._versions.get(scope)
+            if cached is not None and cached[1] > now:
+                return cached[0]
+        version = self._read_version(scope)
+        self._remember_version(scope, version, now)
+        return version
+
+    def invalidate(self, *scopes):
+        """
+        Делает устаревшими во всех процессах значения областей scopes,
+        а без них — все значения этого кэша.
+        """
+        for scope in scopes or ('',):
+            CacheVersion.objects.filter(
+                name=self._version_name(scope)).update(
+                    version=F('version') + 1)
+            self._remember_version(scope, self._read_version(scope),
+                                   time.time())
+
+    def is_fresh(self, entry, now):
+        """Проверка XFetch: не пора ли пересчитать значение досрочно."""
+        jitter = -math.log(1.0 - random.random())
+        return now + entry.delta * self._setting('beta') * jitter < (
+            entry.expires)
+
+    def make_key(self, key, scope=''):
+        if not scope:
+            return f'{self.name}:{self.get_version()}:{key}'
+        return (f'{self.name}:{self.get_version()}:'
+                f'{scope}:{self.get_version(scope)}:{key}')
+
+    def get_or_set(self, key, compute, timeout=None, scope=''):
+        key = self.make_key(key, scope)
+        now = time.time()
+        entry = self._local_get(key, now)
+        if entry is not None and self.is_fresh(entry, now):
+            self._count('local_hits')
+            return entry.value
+        stale = entry
+        entry = self.shared.get(key)
+        if entry is not None and self.is_fresh(entry, now):
+            self._count('shared_hits')
+            self._local_set(key, entry, now)
+            return entry.value
+        self._count('misses')
+        return self._recompute(key, compute, timeout, stale or entry)
+
+    def _recompute(self, key, compute, timeout, stale):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = threading.Event()
+        if not leader:
+            if stale is not None:
+                self._count('stale')
+                return stale.value
+            # Значение уже считает другой поток процесса — ждём его.
+            self._count('waits')
+            flight.wait(self._setting('wait'))
+            entry = self._local_get(key, time.time())
+            if entry is not None:
+                return entry.value
+            return self._compute(key, compute, timeout).value
+
+        lock_key = f'{key}:lock'
+        locked = self.shared.add(lock_key, 1, self._setting('lock_timeout'))
+        try:
+            if not locked:
+                if stale is not None:
+                    self._count('stale')
+                    return stale.value
+                entry = self._wait_shared(key)
+                if entry is not None:
+                    self._local_set(key, entry, time.time())
+                    return entry.value
+            return self._compute(key, compute, timeout).value
+        finally:
+            if locked:
+                self.shared.delete(lock_key)
+            with self._lock:
+                del self._flights[key]
+            flight.set()
+
+    def _wait_shared(self, key):
+        # Значение считает другой процесс: опрашиваем общий кэш.
+        self._count('waits')
+        deadline = time.time() + self._setting('wait')
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = self.shared.get(key)
+            if entry is not None:
+                return entry
+        return None
+
+    def _compute(self, key, compute, timeout):
+        timeout = timeout or self.timeout or self._setting('timeout')
+        started = time.time()
+        value = compute()
+        now = time.time()
+        entry = Entry(value, now + timeout, now - started)
+        # В бэкенде запись живёт дольше срока: пока её пересчитывают,
+        # остальные запросы получают её как устаревшую.
+        self.shared.set(key, entry, timeout + self._setting('stale_timeout'))
+        self._local_set(key, entry, now)
+        return entry
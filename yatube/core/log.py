@@ -0,0 +1,216 @@
+"""
+Неблокирующее логирование в файлы JSON Lines.
+
+BoundedQueueHandler кладёт записи в ограниченную очередь и сразу
+возвращает управление; если очередь полна, запись отбрасывается и
+учитывается в счётчике. Фоновый поток забирает записи пачками и пишет
+каждую пачку в файл одной операцией, с ротацией по размеру. При выходе
+процесса logging.shutdown() вызывает flush() и очередь дописывается.
+"""
+import copy
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+from . import metrics
+
+# Поля LogRecord, которые не считаются дополнительными (extra)
+RECORD_FIELDS = frozenset(vars(logging.LogRecord(
+    '', 0, '', 0, '', (), None)).keys()) | {'message', 'asctime'}
+
+_handlers = weakref.WeakSet()
+
+# Сколько flush() ждёт места в очереди и поток записи, секунды
+FLUSH_TIMEOUT = 5
+
+
+class JSONFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON со всеми полями из extra."""
+    def format(self, record):
+        data = {
+            'time': datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_FIELDS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class BatchRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler, который пишет пачку записей одной операцией."""
+    def emit_batch(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        data = ''.join(lines)
+        with self.lock:
+            try:
+                if self.stream is None:
+                    self.stream = self._open()
+                if (self.maxBytes
+                        and self.stream.tell() + len(data) >= self.maxBytes
+                        and self.stream.tell()):
+                    self.doRollover()
+                self.stream.write(data)
+                self.stream.flush()
+            except Exception:
+                self.handleError(records[0])
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Обработчик для потоков запросов: только кладёт запись в очередь.
+
+    filename может содержать {pid}: у каждого процесса свой файл, иначе
+    воркеры мешали бы друг другу при ротации. Поток записи и очередь
+    создаются в процессе при первой записи, поэтому переживают fork().
+    """
+    def __init__(self, filename, max_bytes=0, backup_count=0,
+                 queue_size=10000, batch_size=500, flush_interval=1.0):
+        super().__init__(None)
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._reported = 0
+        self._dropped_lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        _handlers.add(self)
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            filename = self.filename.format(pid=os.getpid())
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            self.target = BatchRotatingFileHandler(
+                filename, maxBytes=self.max_bytes,
+                backupCount=self.backup_count, encoding='utf-8', delay=True)
+            self.target.setFormatter(self.formatter or JSONFormatter())
+            self.queue = queue.Queue(self.queue_size)
+            # Блокировка могла быть захвачена при fork(): берём новую.
+            self._dropped_lock = threading.Lock()
+            self.dropped = 0
+            self._reported = 0
+            self._thread = threading.Thread(
+                target=self._listen, name='log-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Склеиваем сообщение и трейсбек здесь: аргументы могут
+        # измениться, пока запись ждёт в очереди. Форматирование в JSON
+        # и запись на диск — в фоновом потоке.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Счётчик меняют потоки запросов и читает поток записи.
+            with self._dropped_lock:
+                self.dropped += 1
+            metrics.inc('yatube_log_records_dropped_total')
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+    def _listen(self):
+        while True:
+            batch = [self.queue.get()]
+            stop = batch[0] is None
+            # Копим пачку не дольше flush_interval от первой записи.
+            deadline = time.monotonic() + self.flush_interval
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get(
+                        timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                else:
+                    batch.append(record)
+            records = [record for record in batch if record is not None]
+            with self._dropped_lock:
+                dropped = self.dropped - self._reported
+                self._reported = self.dropped
+            if dropped:
+                records.append(self._drop_record(dropped))
+            if records:
+                self.target.emit_batch(records)
+            if stop:
+                return
+
+    def _drop_record(self, dropped):
+        record = logging.LogRecord(
+            'core.log', logging.WARNING, __file__, 0,
+            'Очередь логов переполнена, отброшено записей: %s',
+            (dropped,), None)
+        record.dropped = dropped
+        return record
+
+    def flush(self):
+        """
+        Дожидается записи всего, что уже в очереди, и останавливает поток
+        записи; следующая запись запустит его снова.
+        """
+        if self._pid != os.getpid():
+            return
+        with self._start_lock:
+            try:
+                self.queue.put(None, timeout=FLUSH_TIMEOUT)
+            except queue.Full:
+                # Поток записи не разбирает очередь: не ждём его. Следующая
+                # запись запустит новый поток с новой очередью.
+                self._pid = None
+                return
+            self._thread.join(timeout=FLUSH_TIMEOUT)
+            self.target.close()
+            self._pid = None
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+def shutdown():
+    """Дописывает очереди всех обработчиков процесса."""
+    for handler in list(_handlers):
+        handler.flush()
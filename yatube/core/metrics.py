@@ -0,0 +1,289 @@
+"""
+Метрики в текстовом формате Prometheus, общие для всех процессов.
+
+Каждый поток копит счётчики в своём словаре (шарде) без блокировок.
+Раз в METRICS_FLUSH_INTERVAL секунд процесс записывает сумму своих шардов
+в файл METRICS_DIR/<pid>.json (через переименование, атомарно). При
+выдаче /metrics файлы всех процессов складываются с шардами текущего
+процесса, а показатели процессов читаются из /proc для живых pid.
+"""
+import bisect
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# имя: (тип, описание, границы корзин гистограммы)
+FAMILIES = {
+    'django_http_requests_total': (
+        'counter', 'Запросы по представлению, методу и статусу', None),
+    'django_http_request_duration_seconds': (
+        'histogram', 'Время обработки запроса по представлению',
+        DEFAULT_BUCKETS),
+    'django_db_queries_total': (
+        'counter', 'Запросы к базе данных', None),
+    'django_db_query_duration_seconds_total': (
+        'counter', 'Суммарное время запросов к базе данных', None),
+    'django_template_render_duration_seconds': (
+        'histogram', 'Время отрисовки шаблона', DEFAULT_BUCKETS),
+    'yatube_cache_requests_total': (
+        'counter', 'Обращения к двухуровневому кэшу по результату', None),
+    'yatube_admission_total': (
+        'counter', 'Решения AdmissionMiddleware по классам', None),
+    'yatube_log_records_dropped_total': (
+        'counter', 'Записи лога, отброшенные при полной очереди', None),
+    'yatube_surrogate_purges_total': (
+        'counter', 'Запросы очистки ключей в кэширующем прокси', None),
+}
+
+PROCESS_HELP = {
+    'process_cpu_seconds_total': 'Процессорное время процесса',
+    'process_resident_memory_bytes': 'Резидентная память процесса',
+    'process_threads': 'Число потоков процесса',
+    'process_open_fds': 'Число открытых файловых дескрипторов',
+    'process_start_time_seconds': 'Время запуска процесса, Unix time',
+}
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _reset_after_fork():
+    # Счётчики мастера уже учтены в его файле, воркер начинает с нуля.
+    global _local, _shards, _shards_lock, _flush_lock, _last_flush
+    _local = threading.local()
+    _shards = []
+    _shards_lock = threading.Lock()
+    _flush_lock = threading.Lock()
+    _last_flush = time.monotonic()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_dir():
+    return settings.METRICS_DIR or os.path.join(
+        tempfile.gettempdir(), 'yatube-metrics')
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append(shard)
+        return shard
+
+
+def inc(name, labels=(), value=1.0):
+    """Увеличивает счётчик; labels — кортеж пар (имя, значение)."""
+    shard = _shard()
+    key = (name, labels)
+    shard[key] = shard.get(key, 0.0) + value
+
+
+def observe(name, labels, value):
+    """Добавляет наблюдение в гистограмму."""
+    buckets = FAMILIES[name][2]
+    index = bisect.bisect_left(buckets, value)
+    le = str(buckets[index]) if index < len(buckets) else '+Inf'
+    shard = _shard()
+    for key, amount in (
+        ((f'{name}_bucket', labels + (('le', le),)), 1.0),
+        ((f'{name}_sum', labels), value),
+        ((f'{name}_count', labels), 1.0),
+    ):
+        shard[key] = shard.get(key, 0.0) + amount
+
+
+def instrument_query(execute, sql, params, many, context):
+    """execute_wrapper, который ставится на каждое новое соединение."""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        labels = (('alias', context['connection'].alias),)
+        inc('django_db_queries_total', labels)
+        inc('django_db_query_duration_seconds_total', labels,
+            time.perf_counter() - started)
+
+
+def local_totals():
+    totals = defaultdict(float)
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        # dict() копирует словарь целиком под GIL, даже если поток
+        # в это время его меняет.
+        for key, value in dict(shard).items():
+            totals[key] += value
+    return totals
+
+
+def flush():
+    """Записывает счётчики процесса в его файл."""
+    directory = get_dir()
+    os.makedirs(directory, exist_ok=True)
+    samples = [[name, list(labels), value]
+               for (name, labels), value in local_totals().items()]
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as file:
+        json.dump(samples, file)
+    os.replace(tmp_path, os.path.join(directory, f'{os.getpid()}.json'))
+
+
+def maybe_flush():
+    global _last_flush
+    if time.monotonic() - _last_flush < settings.METRICS_FLUSH_INTERVAL:
+        return
+    # Пишет один поток; остальные не ждут его.
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _last_flush = time.monotonic()
+        flush()
+    finally:
+        _flush_lock.release()
+
+
+def clear_store():
+    """Удаляет файлы процессов; вызывается при старте сервера."""
+    directory = get_dir()
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directory, name))
+
+
+def collect():
+    """Сумма счётчиков всех процессов и список их pid."""
+    totals = local_totals()
+    pids = {os.getpid()}
+    directory = get_dir()
+    names = os.listdir(directory) if os.path.isdir(directory) else ()
+    for name in names:
+        pid, ext = os.path.splitext(name)
+        if ext != '.json' or not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            with open(os.path.join(directory, name)) as file:
+                samples = json.load(file)
+        except (OSError, ValueError):
+            continue
+        pids.add(int(pid))
+        for sample_name, labels, value in samples:
+            totals[(sample_name, tuple(map(tuple, labels)))] += value
+    return totals, pids
+
+
+def _read_proc(pid):
+    with open(f'/proc/{pid}/stat') as file:
+        # Имя процесса в скобках может содержать пробелы.
+        fields = file.read().rpartition(')')[2].split()
+    with open(f'/proc/{pid}/statm') as file:
+        resident = int(file.read().split()[1])
+    ticks = os.sysconf('SC_CLK_TCK')
+    with open('/proc/stat') as file:
+        boot_time = next(int(line.split()[1]) for line in file
+                         if line.startswith('btime'))
+    return {
+        'process_cpu_seconds_total': (
+            (int(fields[11]) + int(fields[12])) / ticks),
+        'process_resident_memory_bytes': resident * resource.getpagesize(),
+        'process_threads': int(fields[17]),
+        'process_open_fds': len(os.listdir(f'/proc/{pid}/fd')),
+        'process_start_time_seconds': boot_time + int(fields[19]) / ticks,
+    }
+
+
+def process_stats(pids):
+    """Показатели живых процессов; на не-Linux — только текущего."""
+    stats = {}
+    for pid in sorted(pids):
+        try:
+            stats[pid] = _read_proc(pid)
+        except (OSError, StopIteration):
+            if pid == os.getpid() and not os.path.exists('/proc'):
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                stats[pid] = {'process_cpu_seconds_total': (
+                    usage.ru_utime + usage.ru_stime)}
+    return stats
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _le_key(labels):
+    le = dict(labels)['le']
+    return float('inf') if le == '+Inf' else float(le)
+
+
+def _render_histogram(name, buckets, totals):
+    # В хранилище корзины не накопительные: каждое наблюдение лежит
+    # в одной корзине. Prometheus ждёт накопленные суммы.
+    series = defaultdict(dict)
+    for (sample, labels), value in totals.items():
+        if sample == f'{name}_bucket':
+            base = tuple(item for item in labels if item[0] != 'le')
+            series[base][_le_key(labels)] = value
+    for labels in sorted(series):
+        cumulative = 0.0
+        for le in (*buckets, float('inf')):
+            cumulative += series[labels].get(le, 0.0)
+            le_label = '+Inf' if le == float('inf') else str(le)
+            yield '{}_bucket{} {!r}'.format(
+                name, format_labels(labels + (('le', le_label),)),
+                cumulative)
+        for suffix in ('sum', 'count'):
+            yield '{}_{}{} {!r}'.format(
+                name, suffix, format_labels(labels),
+                totals.get((f'{name}_{suffix}', labels), 0.0))
+
+
+def _render_processes(stats):
+    for name, help_text in PROCESS_HELP.items():
+        kind = 'counter' if name.endswith('_total') else 'gauge'
+        yield f'# HELP {name} {help_text}'
+        yield f'# TYPE {name} {kind}'
+        for pid, values in stats.items():
+            if name in values:
+                yield '{}{} {!r}'.format(
+                    name, format_labels((('pid', pid),)), values[name])
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus 0.0.4."""
+    totals, pids = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in FAMILIES.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'histogram':
+            lines.extend(_render_histogram(name, buckets, totals))
+            continue
+        for (sample, labels), value in sorted(totals.items()):
+            if sample == name:
+                lines.append(f'{name}{format_labels(labels)} {value!r}')
+    lines.extend(_render_processes(process_stats(pids)))
+    return '\n'.join(lines) + '\n'
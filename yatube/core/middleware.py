@@ -0,0 +1,213 @@
+import logging
+import time
+import zlib
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import empty
+
+from . import metrics
+from .admission import admission
+
+access_logger = logging.getLogger('yatube.access')
+
+# При равном q предпочитаем gzip: его понимают все браузеры.
+SUPPORTED_ENCODINGS = ('gzip', 'deflate')
+
+
+def parse_accept_encoding(header):
+    """Разбирает Accept-Encoding в словарь {кодировка: q}."""
+    codings = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def choose_encoding(header):
+    codings = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = codings.get(encoding, codings.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def get_compressor(encoding, level):
+    # gzip — та же deflate-последовательность в gzip-обёртке,
+    # а HTTP "deflate" по RFC 7230 — это формат zlib.
+    wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+
+def compress_sequence(sequence, compressor):
+    # Сбрасываем буфер после каждого куска, чтобы клиент получал
+    # данные по мере генерации, а не после окончания ответа.
+    for item in sequence:
+        data = compressor.compress(item) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Сжимает ответы в gzip или deflate в зависимости от Accept-Encoding.
+    Потоковые ответы сжимаются по кускам, без буферизации всего тела.
+    """
+    def process_response(self, request, response):
+        if (not response.streaming
+                and len(response.content) < settings.COMPRESSION_MIN_LENGTH):
+            return response
+
+        if response.has_header('Content-Encoding'):
+            return response
+
+        content_type = response.get('Content-Type', '').lower()
+        if content_type.startswith(settings.COMPRESSION_SKIP_TYPES):
+            return response
+
+        # Vary нужен и несжатому ответу: иначе кэш страниц отдаст
+        # сохранённую копию клиенту с другим Accept-Encoding.
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        compressor = get_compressor(encoding, settings.COMPRESSION_LEVEL)
+        if response.streaming:
+            response.streaming_content = compress_sequence(
+                response.streaming_content, compressor)
+            del response['Content-Length']
+        else:
+            compressed_content = (compressor.compress(response.content)
+                                  + compressor.flush())
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response['Content-Length'] = str(len(response.content))
+
+        # Сжатое тело уже не совпадает побайтно с исходным, поэтому
+        # сильный ETag становится слабым (RFC 7232, раздел 2.1).
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+
+        return response
+
+
+def get_admission_class(request):
+    """Класс запроса для AdmissionMiddleware, см. ADMISSION_CLASSES."""
+    if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        return 'write'
+    match = request.resolver_match
+    routes = settings.ADMISSION_ROUTES
+    if match.view_name in routes:
+        return routes[match.view_name]
+    if match.namespace in routes:
+        return routes[match.namespace]
+    page = request.GET.get('page', '')
+    if page.isdigit() and int(page) > settings.ADMISSION_DEEP_PAGE:
+        return 'expensive'
+    return 'cheap'
+
+
+class AdmissionMiddleware(MiddlewareMixin):
+    """
+    Ограничивает одновременную обработку запросов по классам и сразу
+    отвечает 503 с Retry-After, когда мест и места в очереди нет.
+    Лимиты действуют в пределах процесса, то есть между потоками
+    одного воркера gthread (см. gunicorn.conf.py и ADMISSION_THREADS).
+    """
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        name = get_admission_class(request)
+        if not admission.acquire(name):
+            response = HttpResponse(
+                'Сервер перегружен, повторите запрос позже.',
+                status=503, content_type='text/plain; charset=utf-8')
+            response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER)
+            return response
+        request.admission_class = name
+        return None
+
+    def process_response(self, request, response):
+        name = getattr(request, 'admission_class', None)
+        if name is not None:
+            del request.admission_class
+            admission.release(name)
+        return response
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """
+    Считает запросы и время их обработки по имени представления.
+    Стоит первой в MIDDLEWARE, чтобы учитывать всю цепочку.
+    """
+    def process_request(self, request):
+        request.metrics_started = time.perf_counter()
+
+    def process_response(self, request, response):
+        started = getattr(request, 'metrics_started', None)
+        if started is None:
+            return response
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else '<unresolved>'
+        metrics.inc('django_http_requests_total', (
+            ('view', view), ('method', request.method),
+            ('status', str(response.status_code)),
+        ))
+        metrics.observe('django_http_request_duration_seconds',
+                        (('view', view),), time.perf_counter() - started)
+        metrics.maybe_flush()
+        return response
+
+
+class AccessLogMiddleware(MiddlewareMixin):
+    """Пишет в логгер yatube.access по записи на запрос с полями в extra."""
+    def process_request(self, request):
+        request.access_log_started = time.perf_counter()
+
+    def process_response(self, request, response):
+        started = getattr(request, 'access_log_started', None)
+        if started is None:
+            return response
+        match = getattr(request, 'resolver_match', None)
+        # Пользователя берём, только если его уже загрузили: ради лога
+        # лишний запрос к сессии и базе не делаем.
+        user = getattr(request, 'user', None)
+        if getattr(user, '_wrapped', None) is empty:
+            user = None
+        access_logger.info(
+            '%s %s %s', request.method, request.get_full_path(),
+            response.status_code,
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+                'duration_ms': round(
+                    (time.perf_counter() - started) * 1000, 2),
+                'size': (None if response.streaming
+                         else len(response.content)),
+                'user_id': user.pk if user is not None else None,
+                'remote_addr': request.META.get('REMOTE_ADDR'),
+            },
+        )
+        return response
@@ -0,0 +1,15 @@
+from django.db import models
+
+
+class CacheVersion(models.Model):
+    """
+    Версия области TwoTierCache. Увеличивается одним UPDATE с F() + 1,
+    поэтому одновременные сбросы не теряются (incr у DatabaseCache — это
+    чтение и запись). Лежит в базе кэша (core.routers.CacheRouter).
+    """
+    name = models.CharField(max_length=200, primary_key=True)
+    version = models.BigIntegerField()
+
+    class Meta:
+        verbose_name = 'Версия кэша'
+        verbose_name_plural = 'Версии кэша'
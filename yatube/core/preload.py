@@ -0,0 +1,119 @@
+import gc
+import os
+import resource
+import sys
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateSyntaxError, engines
+from django.urls import URLResolver, get_resolver
+from django.utils import translation
+from django.utils.module_loading import autodiscover_modules
+
+PRELOAD_MODULES = ('forms', 'signals', 'views')
+
+
+def warm_resolver(resolver):
+    # reverse_dict заполняется лениво, вложенные include — тоже.
+    resolver.reverse_dict
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            warm_resolver(pattern)
+
+
+def iter_template_loaders(loaders):
+    for loader in loaders:
+        # Кэширующий загрузчик оборачивает настоящие.
+        yield from iter_template_loaders(getattr(loader, 'loaders', ()))
+        if hasattr(loader, 'get_dirs'):
+            yield loader
+
+
+def iter_template_names(engine):
+    seen = set()
+    for loader in iter_template_loaders(engine.engine.template_loaders):
+        for directory in loader.get_dirs():
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    if not name.endswith(('.html', '.txt', '.xml')):
+                        continue
+                    path = os.path.join(root, name)
+                    template = os.path.relpath(path, directory)
+                    template = template.replace(os.sep, '/')
+                    if template not in seen:
+                        seen.add(template)
+                        yield template
+
+
+def warm_templates():
+    """
+    Компилирует все шаблоны проекта и приложений. Результат остаётся в
+    кэширующем загрузчике, который Django включает при DEBUG = False.
+    """
+    count = 0
+    for engine in engines.all():
+        for name in iter_template_names(engine):
+            try:
+                engine.get_template(name)
+            except TemplateSyntaxError:
+                # Например, шаблон с тегами неустановленного пакета.
+                continue
+            count += 1
+    return count
+
+
+def memory_usage():
+    """
+    Память процесса в байтах: rss — резидентная, pss — с долей разделяемых
+    страниц, shared — страницы, общие с другими процессами (в том числе
+    унаследованные от мастера и ещё не скопированные).
+    """
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as smaps:
+            for line in smaps:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty'):
+                    usage[key] = int(value.split()[0]) * 1024
+    except OSError:
+        # Не Linux: доступен только пик резидентной памяти.
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            rss *= 1024
+        return {'rss': rss, 'pss': None, 'shared': None}
+    return {
+        'rss': usage['Rss'],
+        'pss': usage['Pss'],
+        'shared': usage['Shared_Clean'] + usage['Shared_Dirty'],
+    }
+
+
+def preload():
+    """
+    Готовит процесс-мастер к fork(): импортирует модули приложений,
+    заполняет URL-резолвер и кэш шаблонов, загружает переводы, закрывает
+    соединения с БД и замораживает накопленные объекты для сборщика
+    мусора, чтобы воркеры делили эти страницы памяти с мастером.
+    Вызывается после get_wsgi_application() и до запуска воркеров.
+    Возвращает статистику для лога.
+    """
+    started = time.perf_counter()
+    autodiscover_modules(*PRELOAD_MODULES)
+    warm_resolver(get_resolver())
+    templates = warm_templates()
+    with translation.override(settings.LANGUAGE_CODE):
+        translation.gettext('')
+
+    # Соединения и потоки не переживают fork: воркеры откроют свои.
+    connections.close_all()
+
+    # Без freeze первая же сборка мусора в воркере прошла бы по всем
+    # унаследованным объектам и скопировала их страницы.
+    gc.collect()
+    gc.freeze()
+    return {
+        'templates': templates,
+        'frozen': gc.get_freeze_count(),
+        'seconds': time.perf_counter() - started,
+    }
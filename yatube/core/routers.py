@@ -0,0 +1,35 @@
+from django.conf import settings
+
+# Модели DatabaseCache и версий TwoTierCache
+CACHE_MODELS = {('django_cache', 'cacheentry'), ('core', 'cacheversion')}
+
+
+def _is_cache_model(model):
+    return (model._meta.app_label, model._meta.model_name) in CACHE_MODELS
+
+
+class CacheRouter:
+    """
+    Общий кэш (DatabaseCache) и версии кэшей — в отдельной базе
+    CACHE_DATABASE: промахи, записи и блокировки кэша не пишут в базу
+    данных сайта. Остальные модели решают следующие роутеры.
+    """
+    def db_for_read(self, model, **hints):
+        if _is_cache_model(model):
+            return settings.CACHE_DATABASE
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if model_name is None:
+            # RunPython: в базе кэша — только миграции core; таблицу кэша
+            # создаёт createcachetable, который снова спрашивает роутер.
+            if db == settings.CACHE_DATABASE:
+                return app_label == 'core'
+            return None
+        if (app_label, model_name) in CACHE_MODELS:
+            return db == settings.CACHE_DATABASE
+        if db == settings.CACHE_DATABASE:
+            return False
+        return None
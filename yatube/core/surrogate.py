@@ -0,0 +1,115 @@
+"""
+Ключи (surrogate keys, cache tags) для кэширующего прокси и их очистка.
+
+Представления помечают ответ ключами всех показанных объектов и лент
+в заголовке SURROGATE_KEY_HEADER. При изменении данных purger копит
+ключи для очистки: всё, что пришло за SURROGATE_PURGE_DELAY секунд,
+уходит на SURROGATE_PURGE_URL одним запросом (до
+SURROGATE_PURGE_BATCH_SIZE ключей), повторы ключа отправляются один раз.
+"""
+import logging
+import os
+import threading
+import time
+import urllib.request
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def add_surrogate_keys(response, keys):
+    """Добавляет ключи к заголовку ответа, не повторяя уже записанные."""
+    separator = settings.SURROGATE_KEY_SEPARATOR
+    header = settings.SURROGATE_KEY_HEADER
+    existing = response.get(header, '')
+    merged = dict.fromkeys(
+        key.strip() for key in existing.split(separator) if key.strip())
+    merged.update(dict.fromkeys(keys))
+    if merged:
+        response[header] = separator.join(merged)
+    return response
+
+
+class Purger:
+    """
+    Очередь ключей для очистки в прокси с фоновым потоком отправки.
+    Поток создаётся в процессе при первой очистке, поэтому переживает
+    fork(); flush() отправляет накопленное сразу из вызывающего потока.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._keys = set()
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._condition = threading.Condition()
+            self._keys = set()
+            threading.Thread(target=self._run, name='surrogate-purge',
+                             daemon=True).start()
+            self._pid = os.getpid()
+
+    def purge(self, keys):
+        if not settings.SURROGATE_PURGE_URL:
+            return
+        if self._pid != os.getpid():
+            self._start()
+        with self._condition:
+            self._keys.update(keys)
+            self._condition.notify()
+
+    def _run(self):
+        condition = self._condition
+        while True:
+            with condition:
+                while not self._keys:
+                    condition.wait()
+            # Ключи, пришедшие за время задержки, уйдут тем же запросом.
+            time.sleep(settings.SURROGATE_PURGE_DELAY)
+            self.flush()
+
+    def _take(self):
+        with self._condition:
+            keys, self._keys = self._keys, set()
+        return sorted(keys)
+
+    def flush(self):
+        """Отправляет все накопленные ключи; возвращает их число."""
+        keys = self._take()
+        size = settings.SURROGATE_PURGE_BATCH_SIZE
+        for start in range(0, len(keys), size):
+            self.send(keys[start:start + size])
+        return len(keys)
+
+    def send(self, keys):
+        request = urllib.request.Request(
+            settings.SURROGATE_PURGE_URL,
+            method=settings.SURROGATE_PURGE_METHOD,
+            headers={
+                **settings.SURROGATE_PURGE_HEADERS,
+                settings.SURROGATE_KEY_HEADER:
+                    settings.SURROGATE_KEY_SEPARATOR.join(keys),
+            },
+        )
+        try:
+            with urllib.request.urlopen(
+                    request, timeout=settings.SURROGATE_PURGE_TIMEOUT):
+                pass
+        except OSError:
+            # Не повторяем: в худшем случае страница живёт до конца TTL.
+            logger.warning('Не удалось очистить в прокси ключей: %s',
+                           len(keys), exc_info=True)
+            metrics.inc('yatube_surrogate_purges_total',
+                        (('result', 'error'),))
+            return False
+        metrics.inc('yatube_surrogate_purges_total', (('result', 'ok'),))
+        return True
+
+
+purger = Purger()
@@ -0,0 +1,95 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS,
+                thread_name_prefix='yatube-worker',
+            )
+    return _executor
+
+
+def _get_slots():
+    # Очередь ThreadPoolExecutor не ограничена: задачи сверх
+    # BACKGROUND_QUEUE_SIZE (выполняемые и ждущие) не ставим вовсе.
+    global _slots
+    with _executor_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(
+                settings.BACKGROUND_WORKERS + settings.BACKGROUND_QUEUE_SIZE)
+    return _slots
+
+
+def _reset_after_fork():
+    # Потоки пула не копируются в дочерний процесс: создадим пул заново.
+    global _executor, _executor_lock, _slots
+    _executor = None
+    _slots = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _run(func, args, kwargs, slots):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой',
+                         func.__name__)
+        raise
+    finally:
+        # У каждого потока своё соединение с БД — закрываем его сами,
+        # request_finished здесь никто не пошлёт.
+        connections.close_all()
+        slots.release()
+
+
+def submit(func, *args, **kwargs):
+    """
+    Выполняет func в пуле фоновых потоков процесса.
+    При BACKGROUND_WORKERS = 0 задача выполняется сразу, в текущем потоке.
+    Если очередь пула заполнена, задача отбрасывается и считается в
+    yatube_background_tasks_dropped_total; тогда возвращает None.
+    """
+    if not settings.BACKGROUND_WORKERS:
+        func(*args, **kwargs)
+        return None
+    slots = _get_slots()
+    if not slots.acquire(blocking=False):
+        metrics.inc('yatube_background_tasks_dropped_total')
+        return None
+    try:
+        return get_executor().submit(_run, func, args, kwargs, slots)
+    except Exception:
+        slots.release()
+        raise
+
+
+def submit_on_commit(func, *args, **kwargs):
+    """
+    Ставит задачу в пул после фиксации текущей транзакции, чтобы воркер
+    увидел записанные данные. Без пула выполняет её сразу.
+    """
+    if not settings.BACKGROUND_WORKERS:
+        func(*args, **kwargs)
+        return
+    transaction.on_commit(lambda: submit(func, *args, **kwargs))
@@ -0,0 +1,35 @@
+import time
+
+from django.template.backends.django import DjangoTemplates
+
+from . import metrics
+
+
+class InstrumentedTemplate:
+    """Обёртка шаблона, которая замеряет время render()."""
+    def __init__(self, template):
+        self._wrapped = template
+
+    def __getattr__(self, name):
+        # template, origin и прочее — как у обёрнутого шаблона бэкенда.
+        return getattr(self._wrapped, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self._wrapped.render(context, request)
+        finally:
+            metrics.observe(
+                'django_template_render_duration_seconds',
+                (('template', self.origin.template_name or ''),),
+                time.perf_counter() - started,
+            )
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Бэкенд DjangoTemplates с метриками времени отрисовки."""
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
@@ -0,0 +1,125 @@
+import threading
+import time
+
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import resolve, reverse
+
+from ..admission import AdmissionController, admission
+from ..middleware import get_admission_class
+from . import urls
+
+CLASSES = {
+    'cheap': {'priority': 0, 'limit': 1, 'queue': 2, 'timeout': 1.0},
+    'expensive': {'priority': 1, 'limit': 1, 'queue': 1, 'timeout': 0.05},
+    'write': {'priority': 2, 'limit': 1, 'queue': 0, 'timeout': 1.0},
+}
+
+
+@override_settings(ADMISSION_CLASSES=CLASSES, ADMISSION_CONCURRENCY=1)
+class AdmissionControllerTest(TestCase):
+    def setUp(self):
+        self.controller = AdmissionController()
+
+    def test_queue_full(self):
+        """При полной очереди запрос отклоняется сразу."""
+        self.assertTrue(self.controller.acquire('write'))
+        self.assertFalse(self.controller.acquire('write'))
+        self.controller.release('write')
+        self.assertEqual(
+            self.controller.stats()['write']['shed']['queue_full'], 1)
+
+    def test_timeout(self):
+        """Запрос отклоняется, если место не освободилось вовремя."""
+        self.controller.acquire('cheap')
+        self.assertFalse(self.controller.acquire('expensive'))
+        stats = self.controller.stats()['expensive']
+        self.assertEqual((stats['queued'], stats['shed']['timeout']), (1, 1))
+        self.assertEqual(stats['waiting'], 0)
+
+    def test_cheap_first(self):
+        """Освободившееся место достаётся дешёвому запросу."""
+        order = []
+
+        def request(name):
+            if self.controller.acquire(name):
+                order.append(name)
+                self.controller.release(name)
+
+        self.controller.acquire('write')
+        threads = []
+        for name in ('expensive', 'cheap'):
+            thread = threading.Thread(target=request, args=(name,))
+            thread.start()
+            threads.append(thread)
+            time.sleep(0.01)
+        self.controller.release('write')
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order[0], 'cheap')
+
+
+class AdmissionMiddlewareTest(TestCase):
+    databases = '__all__'
+
+    def test_classes(self):
+        """Класс запроса зависит от метода, маршрута и номера страницы."""
+        factory = RequestFactory()
+        cases = (
+            (factory.get('/'), 'cheap'),
+            (factory.get('/?page=1000'), 'expensive'),
+            (factory.get(reverse('posts:follow_index')), 'expensive'),
+            (factory.post(reverse('posts:create')), 'write'),
+        )
+        for request, expected in cases:
+            with self.subTest(path=request.get_full_path()):
+                request.resolver_match = resolve(request.path_info)
+                self.assertEqual(get_admission_class(request), expected)
+
+    def test_shed_response(self):
+        """Без свободных мест отдаётся 503 с Retry-After."""
+        classes = dict(CLASSES, cheap={
+            'priority': 0, 'limit': 0, 'queue': 0, 'timeout': 0})
+        with override_settings(ADMISSION_CLASSES=classes,
+                               ADMISSION_RETRY_AFTER=3):
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+
+    def test_slot_released(self):
+        """После ответа место освобождается."""
+        self.client.get(reverse('posts:index'))
+        self.assertEqual(admission.stats()['cheap']['active'], 0)
+
+
+@override_settings(ROOT_URLCONF='core.tests.urls', ADMISSION_CLASSES=dict(
+    CLASSES, cheap={'priority': 0, 'limit': 1, 'queue': 1, 'timeout': 5.0}))
+class ConcurrentRequestsTest(SimpleTestCase):
+    def wait_for(self, name, state, count):
+        for _ in range(500):
+            if admission.stats()[name][state] == count:
+                return
+            time.sleep(0.01)
+        self.fail(f'{name}: {state} != {count}')
+
+    def test_queue_and_shed(self):
+        """Одновременные запросы через middleware ждут в очереди или 503."""
+        statuses = []
+        urls.release.clear()
+        threads = [
+            threading.Thread(target=lambda: statuses.append(
+                Client().get('/slow/').status_code))
+            for _ in range(2)
+        ]
+        threads[0].start()
+        self.wait_for('cheap', 'active', 1)
+        threads[1].start()
+        self.wait_for('cheap', 'waiting', 1)
+        # Место занято, очередь полна — третий запрос отклоняется сразу.
+        response = Client().get('/slow/')
+        urls.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(statuses, [200, 200])
+        self.assertEqual(admission.stats()['cheap']['active'], 0)
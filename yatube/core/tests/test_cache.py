@@ -0,0 +1,138 @@
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..cache import Entry, TwoTierCache
+
+User = get_user_model()
+
+
+class TwoTierCacheTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.cache = TwoTierCache('test')
+        self.calls = 0
+
+    def compute(self, value='value', delay=0):
+        def compute():
+            self.calls += 1
+            time.sleep(delay)
+            return value
+        return compute
+
+    def test_tiers(self):
+        """Значение берётся сначала из памяти процесса, затем из бэкенда."""
+        self.assertEqual(self.cache.get_or_set('key', self.compute()),
+                         'value')
+        self.cache.get_or_set('key', self.compute())
+        self.cache.clear_local()
+        self.cache.get_or_set('key', self.compute())
+        self.assertEqual(self.calls, 1)
+        stats = self.cache.stats()
+        self.assertEqual(
+            (stats['misses'], stats['local_hits'], stats['shared_hits']),
+            (1, 1, 1))
+        self.assertAlmostEqual(stats['local_hit_rate'], 1 / 3)
+        self.assertAlmostEqual(stats['shared_hit_rate'], 1 / 2)
+
+    def test_invalidate(self):
+        """После invalidate() значение пересчитывается."""
+        self.cache.get_or_set('key', self.compute('old'))
+        self.cache.invalidate()
+        self.assertEqual(
+            self.cache.get_or_set('key', self.compute('new')), 'new')
+
+    def test_invalidate_scope(self):
+        """invalidate(scope) сбрасывает только значения этой области."""
+        for scope in ('first', 'second'):
+            self.cache.get_or_set('key', self.compute(scope), scope=scope)
+        self.cache.invalidate('first')
+        self.assertEqual(self.cache.get_or_set(
+            'key', self.compute('new'), scope='first'), 'new')
+        self.assertEqual(self.cache.get_or_set(
+            'key', self.compute('new'), scope='second'), 'second')
+        self.assertEqual(self.calls, 3)
+
+    @override_settings(TWO_TIER_CACHE_LOCAL_TIMEOUT=0)
+    def test_invalidations_not_lost(self):
+        """Каждый сброс увеличивает версию в базе, а не в копии процесса."""
+        other = TwoTierCache('test')
+        version = self.cache.get_version('scope')
+        other.invalidate('scope')
+        self.cache.invalidate('scope')
+        self.assertEqual(other.get_version('scope'), version + 2)
+
+    @override_settings(TWO_TIER_CACHE_LOCAL_TIMEOUT=0)
+    def test_shared_between_processes(self):
+        """Значения и версии лежат в общем бэкенде, а не в памяти процесса."""
+        # Второй экземпляр — как кэш другого воркера: своя память процесса.
+        other = TwoTierCache('test')
+        self.cache.get_or_set('key', self.compute('old'))
+        self.assertEqual(other.get_or_set('key', self.compute()), 'old')
+        other.invalidate()
+        self.assertEqual(
+            self.cache.get_or_set('key', self.compute('new')), 'new')
+        self.assertEqual(self.calls, 2)
+        table = settings.CACHES['default']['LOCATION']
+        with connections[settings.CACHE_DATABASE].cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            self.assertGreater(cursor.fetchone()[0], 0)
+
+    # Транзакция теста держит блокировку таблиц кэша в тестовой базе
+    # в памяти, и потоки не могли бы их читать; здесь проверяется только
+    # работа потоков одного процесса, до общего бэкенда. Версию потоки
+    # берут из памяти процесса.
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_single_flight(self):
+        """Одновременные промахи пересчитывают значение один раз."""
+        self.cache.get_version()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                self.cache.get_or_set('key', self.compute(delay=0.1))))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 8)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_while_locked(self):
+        """Пока значение считает другой процесс, отдаётся устаревшее."""
+        key = self.cache.make_key('key')
+        cache.set(key, Entry('old', time.time() - 1, 0.1))
+        cache.add(f'{key}:lock', 1)
+        self.assertEqual(self.cache.get_or_set('key', self.compute()), 'old')
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(self.cache.stats()['stale'], 1)
+
+    @override_settings(TWO_TIER_CACHE_BETA=1.0)
+    def test_early_expiration(self):
+        """Долгий пересчёт близко к истечению срока запускается досрочно."""
+        now = time.time()
+        entry = Entry('value', now + 1, 5)
+        with mock.patch('core.cache.random.random', return_value=0.5):
+            self.assertFalse(self.cache.is_fresh(entry, now))
+            self.assertTrue(
+                self.cache.is_fresh(entry._replace(delta=0.01), now))
+
+    def test_stats_view(self):
+        """Статистика кэшей доступна только персоналу."""
+        url = reverse('stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url)
+        self.assertIn('test', response.json()['caches'])
@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ..log import BatchRotatingFileHandler, BoundedQueueHandler, JSONFormatter
+
+
+class BoundedQueueHandlerTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = os.path.join(directory.name, 'test.{pid}.jsonl')
+        self.logger = logging.getLogger('core.tests.log')
+        self.logger.propagate = False
+        self.addCleanup(setattr, self.logger, 'propagate', True)
+
+    def make_handler(self, **kwargs):
+        handler = BoundedQueueHandler(self.filename, **kwargs)
+        handler.setFormatter(JSONFormatter())
+        self.logger.addHandler(handler)
+        self.addCleanup(handler.close)
+        self.addCleanup(self.logger.removeHandler, handler)
+        return handler
+
+    def read(self):
+        with open(self.filename.format(pid=os.getpid())) as file:
+            return [json.loads(line) for line in file]
+
+    def test_json_lines(self):
+        """Записи попадают в файл строками JSON с полями extra."""
+        handler = self.make_handler(flush_interval=0.01)
+        self.logger.warning('Пост %s', 42, extra={'view': 'posts:index'})
+        try:
+            raise ValueError('ошибка')
+        except ValueError:
+            self.logger.exception('Сбой')
+        handler.flush()
+        first, second = self.read()
+        self.assertEqual(first['message'], 'Пост 42')
+        self.assertEqual(first['view'], 'posts:index')
+        self.assertEqual(first['level'], 'WARNING')
+        self.assertIn('ValueError: ошибка', second['exception'])
+
+    def test_drops_when_full(self):
+        """При полной очереди записи отбрасываются, а не ждут диска."""
+        handler = self.make_handler(queue_size=2, batch_size=1)
+        release = threading.Event()
+        emit_batch = BatchRotatingFileHandler.emit_batch
+
+        def slow_emit_batch(target, records):
+            release.wait()
+            emit_batch(target, records)
+
+        with mock.patch.object(BatchRotatingFileHandler, 'emit_batch',
+                               slow_emit_batch):
+            for number in range(10):
+                self.logger.warning('Запись %s', number)
+            self.assertGreaterEqual(handler.dropped, 7)
+            release.set()
+            handler.flush()
+        records = self.read()
+        dropped = [record['dropped'] for record in records
+                   if 'dropped' in record]
+        self.assertEqual(dropped, [handler.dropped])
+        self.assertEqual(len(records) - 1 + handler.dropped, 10)
+
+    def test_drops_counted_across_threads(self):
+        """Отброшенные записи из разных потоков учитываются без потерь."""
+        handler = self.make_handler(queue_size=1, batch_size=1)
+        release = threading.Event()
+        emit_batch = BatchRotatingFileHandler.emit_batch
+
+        def slow_emit_batch(target, records):
+            release.wait()
+            emit_batch(target, records)
+
+        def work():
+            for number in range(500):
+                self.logger.warning('Запись %s', number)
+
+        with mock.patch.object(BatchRotatingFileHandler, 'emit_batch',
+                               slow_emit_batch):
+            threads = [threading.Thread(target=work) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            release.set()
+            handler.flush()
+        records = self.read()
+        dropped = sum(record.get('dropped', 0) for record in records)
+        self.assertEqual(dropped, handler.dropped)
+        self.assertEqual(
+            len([record for record in records if 'dropped' not in record])
+            + dropped, 2000)
+
+    def test_flush_does_not_hang_on_full_queue(self):
+        """flush() не ждёт без конца, если поток записи завис."""
+        handler = self.make_handler(queue_size=1, batch_size=1)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        emit_batch = BatchRotatingFileHandler.emit_batch
+
+        def stuck_emit_batch(target, records):
+            release.wait()
+            emit_batch(target, records)
+
+        with mock.patch.object(BatchRotatingFileHandler, 'emit_batch',
+                               stuck_emit_batch), \
+                mock.patch('core.log.FLUSH_TIMEOUT', 0.1):
+            for number in range(3):
+                self.logger.warning('Запись %s', number)
+            flusher = threading.Thread(target=handler.flush)
+            flusher.start()
+            flusher.join(timeout=2)
+            self.assertFalse(flusher.is_alive())
@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import threading
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import metrics
+
+
+class MetricsTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        settings_override = override_settings(
+            METRICS_DIR=self.directory.name, METRICS_TOKEN='secret')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def total(self, name, labels=()):
+        return metrics.collect()[0].get((name, labels), 0.0)
+
+    def test_thread_shards(self):
+        """Счётчики потоков складываются без потерь."""
+        labels = (('test', 'threads'),)
+        before = self.total('django_db_queries_total', labels)
+
+        def work():
+            for _ in range(1000):
+                metrics.inc('django_db_queries_total', labels)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            self.total('django_db_queries_total', labels) - before, 4000)
+
+    def test_other_processes(self):
+        """Счётчики других процессов читаются из их файлов."""
+        labels = (('test', 'files'),)
+        metrics.inc('django_db_queries_total', labels, 2)
+        metrics.flush()
+        with open(os.path.join(self.directory.name, '1.json'), 'w') as file:
+            json.dump([['django_db_queries_total', [['test', 'files']], 3]],
+                      file)
+        self.assertEqual(self.total('django_db_queries_total', labels), 5)
+        self.assertTrue(os.path.exists(os.path.join(
+            self.directory.name, f'{os.getpid()}.json')))
+
+    def test_histogram(self):
+        """Корзины гистограммы выводятся накопленными."""
+        labels = (('template', 'test "quoted".html'),)
+        for value in (0.001, 0.02, 100):
+            metrics.observe(
+                'django_template_render_duration_seconds', labels, value)
+        text = metrics.render()
+        name = 'django_template_render_duration_seconds'
+        label = 'template="test \\"quoted\\".html"'
+        self.assertIn(f'{name}_bucket{{{label},le="0.005"}} 1.0', text)
+        self.assertIn(f'{name}_bucket{{{label},le="0.025"}} 2.0', text)
+        self.assertIn(f'{name}_bucket{{{label},le="+Inf"}} 3.0', text)
+        self.assertIn(f'{name}_count{{{label}}} 3.0', text)
+
+    def test_endpoint(self):
+        """Метрики запросов, базы и процесса отдаются по /metrics."""
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        self.assertIn('no-store', response['Cache-Control'])
+        text = response.content.decode()
+        self.assertIn('django_http_requests_total{view="posts:index",'
+                      'method="GET",status="200"}', text)
+        self.assertIn('django_db_queries_total{alias="default"}', text)
+        self.assertIn('django_template_render_duration_seconds_count'
+                      '{template="posts/index.html"}', text)
+        self.assertIn(f'process_resident_memory_bytes{{pid="{os.getpid()}"}}',
+                      text)
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer wrong'}):
+            with self.subTest(headers=headers):
+                response = self.client.get(reverse('metrics'), **headers)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('no-store', response['Cache-Control'])
@@ -0,0 +1,91 @@
+import gzip
+import zlib
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from ..middleware import CompressionMiddleware, choose_encoding
+
+CONTENT = 'Тестовый текст поста. ' * 100
+
+
+class CompressionMiddlewareTest(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = CompressionMiddleware()
+
+    def process(self, response, accept_encoding='gzip, deflate'):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return self.middleware.process_response(request, response)
+
+    def test_choose_encoding(self):
+        """Кодировка выбирается с учётом q-значений."""
+        cases = (
+            ('gzip, deflate', 'gzip'),
+            ('deflate', 'deflate'),
+            ('gzip;q=0.5, deflate', 'deflate'),
+            ('gzip;q=0, *', 'deflate'),
+            ('br', None),
+            ('', None),
+        )
+        for header, expected in cases:
+            with self.subTest(header=header):
+                self.assertEqual(choose_encoding(header), expected)
+
+    def test_gzip_response(self):
+        """Ответ сжимается в gzip и выставляет нужные заголовки."""
+        response = self.process(HttpResponse(CONTENT))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(
+            gzip.decompress(response.content).decode(), CONTENT)
+        self.assertEqual(
+            response['Content-Length'], str(len(response.content)))
+
+    def test_deflate_response(self):
+        """Ответ сжимается в deflate, если клиент не принимает gzip."""
+        response = self.process(HttpResponse(CONTENT), 'deflate')
+        self.assertEqual(response['Content-Encoding'], 'deflate')
+        self.assertEqual(zlib.decompress(response.content).decode(), CONTENT)
+
+    def test_streaming_response(self):
+        """Потоковый ответ сжимается по кускам."""
+        chunks = [CONTENT.encode()] * 3
+        response = self.process(StreamingHttpResponse(iter(chunks)))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        parts = list(response.streaming_content)
+        self.assertGreater(len(parts), len(chunks))
+        self.assertEqual(gzip.decompress(b''.join(parts)), b''.join(chunks))
+
+    def test_skip_short_and_compressed(self):
+        """Короткие и уже сжатые ответы отдаются как есть."""
+        short = self.process(HttpResponse('коротко'))
+        self.assertFalse(short.has_header('Content-Encoding'))
+        image = self.process(
+            HttpResponse(CONTENT, content_type='image/png'))
+        self.assertFalse(image.has_header('Content-Encoding'))
+        encoded = HttpResponse(CONTENT)
+        encoded['Content-Encoding'] = 'br'
+        self.assertEqual(self.process(encoded)['Content-Encoding'], 'br')
+
+    def test_unsupported_encoding_sets_vary(self):
+        """Без поддерживаемой кодировки ответ не сжат, но Vary выставлен."""
+        response = self.process(HttpResponse(CONTENT), 'br')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_etag_becomes_weak(self):
+        """Сильный ETag после сжатия становится слабым."""
+        response = HttpResponse(CONTENT)
+        response['ETag'] = '"abc"'
+        self.assertEqual(self.process(response)['ETag'], 'W/"abc"')
+
+    @override_settings(COMPRESSION_LEVEL=1)
+    def test_compression_level(self):
+        """Уровень сжатия берётся из настроек."""
+        response = self.process(HttpResponse(CONTENT))
+        self.assertEqual(
+            gzip.decompress(response.content).decode(), CONTENT)
@@ -0,0 +1,34 @@
+import gc
+import os
+
+from django.template import engines
+from django.test import SimpleTestCase
+
+from ..preload import iter_template_names, memory_usage, preload
+from ..tasks import get_executor
+
+
+class PreloadTest(SimpleTestCase):
+    def test_preload(self):
+        """Предзагрузка компилирует шаблоны и замораживает объекты."""
+        self.addCleanup(gc.unfreeze)
+        stats = preload()
+        names = set(iter_template_names(engines['django']))
+        self.assertIn('posts/index.html', names)
+        self.assertIn('admin/base.html', names)
+        self.assertGreater(stats['templates'], 0)
+        self.assertGreater(stats['frozen'], 0)
+        self.assertEqual(gc.get_freeze_count(), stats['frozen'])
+
+    def test_memory_usage(self):
+        """Резидентная память процесса положительна."""
+        self.assertGreater(memory_usage()['rss'], 0)
+
+    def test_executor_recreated_after_fork(self):
+        """В дочернем процессе пул фоновых потоков создаётся заново."""
+        executor = get_executor()
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0 if get_executor() is not executor else 1)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
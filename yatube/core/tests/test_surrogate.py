@@ -0,0 +1,158 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from posts import signals
+from posts.models import Group, Post, User
+from posts.registry import group_registry
+
+from ..surrogate import Purger, add_surrogate_keys
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.server.purges.append(self.headers['Surrogate-Key'].split())
+        self.send_response(200)
+        self.end_headers()
+        self.server.received.set()
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInProxyMixin:
+    """Локальный заменитель прокси: запоминает ключи запросов очистки."""
+    def start_proxy(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), ProxyHandler)
+        server.purges = []
+        server.received = threading.Event()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        settings_override = override_settings(
+            SURROGATE_PURGE_URL='http://127.0.0.1:{}/purge'.format(
+                server.server_address[1]))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        return server
+
+
+@override_settings(SURROGATE_PURGE_DELAY=60, SURROGATE_PURGE_BATCH_SIZE=3)
+class PurgerTest(StandInProxyMixin, SimpleTestCase):
+    def test_keys_merged_in_header(self):
+        """Ключи дописываются к заголовку без повторов."""
+        response = add_surrogate_keys(HttpResponse(), ['a', 'b'])
+        add_surrogate_keys(response, ['b', 'c'])
+        self.assertEqual(response['Surrogate-Key'], 'a b c')
+
+    def test_purges_coalesced_and_batched(self):
+        """Повторы ключей склеиваются, отправка — пачками."""
+        proxy = self.start_proxy()
+        purger = Purger()
+        purger.purge(['post-1', 'feed-index'])
+        purger.purge(['post-2', 'feed-index', 'post-1', 'group-cats'])
+        self.assertEqual(purger.flush(), 4)
+        self.assertEqual(proxy.purges, [
+            ['feed-index', 'group-cats', 'post-1'],
+            ['post-2'],
+        ])
+        self.assertEqual(purger.flush(), 0)
+
+    @override_settings(SURROGATE_PURGE_DELAY=0.05)
+    def test_background_flush(self):
+        """Ключи, пришедшие за время задержки, уходят одним запросом."""
+        proxy = self.start_proxy()
+        purger = Purger()
+        purger.purge(['post-1'])
+        purger.purge(['post-2'])
+        self.assertTrue(proxy.received.wait(5))
+        self.assertEqual(proxy.purges, [['post-1', 'post-2']])
+
+    def test_proxy_unavailable(self):
+        """Недоступный прокси не ломает запись: ошибка только в лог."""
+        with override_settings(SURROGATE_PURGE_URL='http://127.0.0.1:9/'):
+            purger = Purger()
+            purger.purge(['post-1'])
+            with self.assertLogs('core.surrogate', 'WARNING'):
+                purger.flush()
+
+
+@override_settings(SURROGATE_PURGE_DELAY=60)
+class SurrogateKeysTest(StandInProxyMixin, TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+            description='Тестовое описание')
+
+    def setUp(self):
+        group_registry.clear()
+        self.proxy = self.start_proxy()
+        self.purger = Purger()
+        patcher = mock.patch.object(signals, 'purger', self.purger)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pages_carry_keys(self):
+        """Страницы помечены ключами лент и показанных объектов."""
+        post = Post.objects.create(
+            text='Тестовый текст', author=self.user, group=self.group)
+        post_keys = {f'post-{post.pk}', f'author-{self.user.pk}',
+                     'group-test-slug'}
+        cases = (
+            (reverse('posts:index'), {'feed-index'}),
+            (reverse('posts:group_list', args=(self.group.slug,)),
+             {'feed-group-test-slug'}),
+            (reverse('posts:profile', args=(self.user.username,)),
+             {f'feed-author-{self.user.pk}'}),
+            (reverse('posts:post_detail', args=(post.pk,)), set()),
+        )
+        for url, feed_keys in cases:
+            with self.subTest(url=url):
+                keys = set(self.client.get(url)['Surrogate-Key'].split())
+                self.assertLessEqual(post_keys | feed_keys, keys)
+
+    @override_settings(BACKGROUND_WORKERS=0)
+    def test_saves_purge_pages(self):
+        """Сохранение поста и группы очищает их страницы в прокси."""
+        post = Post.objects.create(
+            text='Тестовый текст', author=self.user, group=self.group)
+        post.text = 'Новый текст'
+        post.save()
+        self.group.description = 'Новое описание'
+        self.group.save()
+        self.purger.flush()
+        self.assertEqual(len(self.proxy.purges), 1)
+        self.assertEqual(set(self.proxy.purges[0]), {
+            f'post-{post.pk}', 'feed-index', 'feed-follow', 'feed-trending',
+            f'feed-author-{self.user.pk}', 'feed-group-test-slug',
+            'group-test-slug', 'groups',
+        })
+
+    @override_settings(BACKGROUND_WORKERS=0)
+    def test_group_change_purges_both_groups(self):
+        """Перенос поста в другую группу очищает ленты обеих групп."""
+        other = Group.objects.create(
+            title='Другая группа', slug='other-slug',
+            description='Тестовое описание')
+        created = Post.objects.create(
+            text='Тестовый текст', author=self.user, group=self.group)
+        self.purger.flush()
+        self.proxy.purges.clear()
+        post = self.user.posts.get(pk=created.pk)
+        post.group = other
+        post.save()
+        self.purger.flush()
+        self.assertLessEqual(
+            {'feed-group-test-slug', 'feed-group-other-slug'},
+            set(self.proxy.purges[0]))
@@ -0,0 +1,31 @@
+import threading
+
+from django.test import SimpleTestCase, override_settings
+
+from .. import metrics, tasks
+
+
+@override_settings(BACKGROUND_WORKERS=1, BACKGROUND_QUEUE_SIZE=1)
+class SubmitTest(SimpleTestCase):
+    def setUp(self):
+        tasks._reset_after_fork()
+        self.addCleanup(tasks._reset_after_fork)
+
+    def dropped(self):
+        return metrics.local_totals().get(
+            ('yatube_background_tasks_dropped_total', ()), 0.0)
+
+    def test_full_queue_drops(self):
+        """Задачи сверх очереди пула отбрасываются и считаются."""
+        release = threading.Event()
+        before = self.dropped()
+        running = tasks.submit(release.wait)
+        queued = tasks.submit(lambda: None)
+        self.assertIsNone(tasks.submit(lambda: None))
+        self.assertEqual(self.dropped() - before, 1)
+        release.set()
+        running.result(timeout=5)
+        queued.result(timeout=5)
+        # Выполненные задачи освобождают место в очереди.
+        tasks.submit(lambda: None).result(timeout=5)
+        self.assertEqual(self.dropped() - before, 1)
@@ -0,0 +1,17 @@
+import threading
+
+from django.http import HttpResponse
+from django.urls import path
+
+# Медленное представление отвечает, когда тест установит release.
+release = threading.Event()
+
+
+def slow(request):
+    release.wait(5)
+    return HttpResponse('Готово')
+
+
+urlpatterns = [
+    path('slow/', slow, name='slow'),
+]
@@ -1,4 +1,14 @@
+import hmac
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotFound, JsonResponse
 from django.shortcuts import render
+from django.views.decorators.cache import never_cache
+
+from . import metrics
+from .admission import admission
+from .cache import registry
 
 
 def page_not_found(request, exception):
@@ -9,3 +19,26 @@ def page_not_found(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def stats(request):
+    # Счётчики свои у каждого процесса: отвечает тот, кто принял запрос.
+    return JsonResponse({
+        'caches': {name: cache.stats() for name, cache in registry.items()},
+        'admission': admission.stats(),
+    })
+
+
+@never_cache
+def prometheus_metrics(request):
+    # За прокси все запросы приходят с его адреса, поэтому доступ — только
+    # по токену. Без METRICS_TOKEN метрики не отдаются; ответ, в том числе
+    # 404, прокси не кэширует (never_cache).
+    expected = f'Bearer {settings.METRICS_TOKEN}'
+    given = request.META.get('HTTP_AUTHORIZATION', '')
+    if not settings.METRICS_TOKEN or not hmac.compare_digest(
+            given.encode(), expected.encode()):
+        return HttpResponseNotFound()
+    return HttpResponse(metrics.render(),
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,84 @@
+"""
+Настройки gunicorn: gunicorn -c gunicorn.conf.py yatube.wsgi
+
+Приложение загружается и прогревается в мастере до fork(), поэтому
+воркеры стартуют с готовыми модулями, URL-резолвером и шаблонами и делят
+эти страницы памяти с мастером. Для каждого воркера в лог пишется RSS
+после запуска и время первого запроса.
+
+Воркеры — gthread: запросы одного воркера обрабатываются в нескольких
+потоках, и только между ними действуют лимиты AdmissionMiddleware.
+Число потоков (GUNICORN_THREADS) читают и настройки Django.
+"""
+import multiprocessing
+import os
+import time
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS',
+                             multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+preload_app = True
+
+
+def on_starting(server):
+    # Счётчики прошлого запуска не должны смешиваться с новыми.
+    from core.metrics import clear_store
+
+    clear_store()
+
+
+def when_ready(server):
+    # Вызывается в мастере после загрузки приложения и до запуска воркеров.
+    from core.preload import memory_usage, preload
+
+    stats = preload()
+    usage = memory_usage()
+    server.log.info(
+        'Предзагрузка: %s шаблонов, %s объектов заморожено за %.0f мс, '
+        'RSS мастера %s КБ', stats['templates'], stats['frozen'],
+        stats['seconds'] * 1000, usage['rss'] // 1024)
+
+
+def post_fork(server, worker):
+    from core.preload import memory_usage
+
+    worker.first_request_started = None
+    worker.first_request_logged = False
+    usage = memory_usage()
+    server.log.info(
+        'Воркер %s запущен: RSS %s КБ, PSS %s КБ, разделяемая %s КБ',
+        worker.pid, usage['rss'] // 1024, (usage['pss'] or 0) // 1024,
+        (usage['shared'] or 0) // 1024)
+
+
+def pre_request(worker, req):
+    if worker.first_request_started is None:
+        worker.first_request_started = time.perf_counter()
+
+
+def post_request(worker, req, environ, resp):
+    if worker.first_request_logged:
+        return
+    from core.preload import memory_usage
+
+    worker.first_request_logged = True
+    elapsed = time.perf_counter() - worker.first_request_started
+    usage = memory_usage()
+    worker.log.info(
+        'Воркер %s: первый запрос %s за %.1f мс, RSS %s КБ, PSS %s КБ',
+        worker.pid, req.path, elapsed * 1000, usage['rss'] // 1024,
+        (usage['pss'] or 0) // 1024)
+
+
+def worker_exit(server, worker):
+    # Дописываем накопленные просмотры и очередь логов до выхода воркера.
+    from core.log import shutdown
+    from posts.trending import view_buffer
+
+    try:
+        view_buffer.flush()
+    except Exception:
+        server.log.exception('Не удалось записать просмотры постов')
+    shutdown()
@@ -1,17 +1,206 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.auth.admin import UserAdmin
+from django.db.models import Q
+from django.urls import reverse
+from django.utils.html import format_html
 
-from .models import Group, Post
+from core.tasks import submit_on_commit
+
+from .bulk import claimable, run_job, start_job
+from .deletion import delete_groups, delete_users
+from .forms import GroupLookupWidget
+from .models import ArchivedPost, BulkJob, Follow, Group, Post, User
+from .sharding import sharded
+
+
+def chunked_delete_action(task, description):
+    def action(modeladmin, request, queryset):
+        pks = list(queryset.values_list('pk', flat=True))
+        submit_on_commit(task, pks)
+        modeladmin.message_user(
+            request,
+            f'Запущено удаление порциями, объектов: {len(pks)}. '
+            'Ход выполнения пишется в журнал.',
+        )
+
+    action.short_description = description
+    action.__name__ = f'chunked_{task.__name__}'
+    return action
+
+
+class ChunkedDeleteMixin:
+    """
+    Удаление со страницы объекта тоже идёт порциями в фоне, а обычное
+    действие delete_selected (всё в одной транзакции) убрано. Страница
+    подтверждения не обходит связанные строки, а показывает их число
+    (related_counts).
+    """
+    chunked_delete = None
+
+    def related_counts(self, objs):
+        """{название: число} строк, которые удалятся вместе с objs."""
+        return {}
+
+    def get_deleted_objects(self, objs, request):
+        objs = list(objs)
+        opts = self.model._meta
+        model_count = {opts.verbose_name_plural: len(objs),
+                       **self.related_counts(objs)}
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(opts.verbose_name)
+        return [str(obj) for obj in objs], model_count, perms_needed, []
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def delete_model(self, request, obj):
+        submit_on_commit(self.chunked_delete, [obj.pk])
+        self.message_user(
+            request, 'Удаление порциями запущено в фоне. '
+            'Ход выполнения пишется в журнал.')
+
+
+class BulkJobActionForm(ActionForm):
+    target_group = forms.ModelChoiceField(
+        Group.objects.all(),
+        required=False,
+        label='Группа',
+        widget=GroupLookupWidget(),
+    )
+
+
+def background_action(action, description):
+    """Действие админки, которое выполняет BulkJob.action в фоне."""
+    def run(modeladmin, request, queryset):
+        target_group = None
+        if action != BulkJob.DELETE_POSTS:
+            field = BulkJobActionForm.base_fields['target_group']
+            try:
+                target_group = field.clean(request.POST.get('target_group'))
+            except forms.ValidationError as error:
+                modeladmin.message_user(request, ' '.join(error.messages),
+                                        level=messages.ERROR)
+                return
+            if target_group is None:
+                modeladmin.message_user(
+                    request, 'Выберите группу, в которую переносить посты.',
+                    level=messages.ERROR)
+                return
+        job = start_job(action, queryset.values_list('pk', flat=True),
+                        request.user, target_group)
+        modeladmin.message_user(request, format_html(
+            'Запущено в фоне: <a href="{}">{}</a>, выбрано: {}.',
+            reverse('admin:posts_bulkjob_change', args=(job.pk,)),
+            job, job.total,
+        ))
+
+    run.short_description = description
+    run.__name__ = f'{action}_in_background'
+    return run
+
+
+class BulkJobAdminMixin:
+    action_form = BulkJobActionForm
+
+    class Media:
+        js = ('js/group_lookup.js',)
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(BulkJobAdminMixin, admin.ModelAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
     list_editable = ('group',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
+    actions = (
+        background_action(BulkJob.MOVE_POSTS,
+                          'Перенести выбранные посты в группу (в фоне)'),
+        background_action(BulkJob.DELETE_POSTS,
+                          'Удалить выбранные посты (в фоне)'),
+    )
+
+    def get_actions(self, request):
+        # delete_selected удаляет всё одной транзакцией и только в шарде
+        # default — вместо него удаление в фоне.
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
 
 
 @admin.register(Group)
-class GroupAdmin(admin.ModelAdmin):
+class GroupAdmin(ChunkedDeleteMixin, BulkJobAdminMixin, admin.ModelAdmin):
     list_display = ('title', 'slug', 'description')
+    chunked_delete = staticmethod(delete_groups)
+    actions = (
+        chunked_delete_action(
+            delete_groups, 'Удалить выбранные группы порциями'),
+        background_action(BulkJob.MOVE_GROUP_POSTS,
+                          'Перенести все посты выбранных групп (в фоне)'),
+    )
+
+
+def resume_jobs(modeladmin, request, queryset):
+    # Задачи, которые ещё выполняет живой обработчик, не трогаем.
+    pks = list(queryset.filter(claimable()).values_list('pk', flat=True))
+    for pk in pks:
+        submit_on_commit(run_job, pk)
+    modeladmin.message_user(request, f'Запущено заново: {len(pks)}.')
+
+
+resume_jobs.short_description = 'Продолжить незавершённые'
+
+
+@admin.register(BulkJob)
+class BulkJobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'status', 'progress', 'created_by',
+                    'created', 'finished')
+    list_filter = ('status', 'action')
+    # Список выбранных id бывает очень длинным — в форме он не нужен.
+    exclude = ('selection',)
+    readonly_fields = ('action', 'status', 'target_group', 'total', 'done',
+                       'progress', 'error', 'created_by', 'created',
+                       'finished')
+    actions = (resume_jobs,)
+
+    def has_add_permission(self, request):
+        return False
+
+    def progress(self, job):
+        if not job.total:
+            return '—'
+        return f'{job.done} из {job.total} ({job.done * 100 // job.total}%)'
+
+    progress.short_description = 'Ход выполнения'
+
+
+@admin.register(Follow)
+class FollowAdmin(admin.ModelAdmin):
+    list_display = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class ChunkedDeleteUserAdmin(ChunkedDeleteMixin, UserAdmin):
+    chunked_delete = staticmethod(delete_users)
+    actions = (chunked_delete_action(
+        delete_users, 'Удалить выбранных пользователей порциями'),)
+
+    def related_counts(self, objs):
+        # По одному COUNT на таблицу, посты — в каждом шарде.
+        return {
+            Post._meta.verbose_name_plural:
+                sharded(Post.objects.filter(author__in=objs)).count(),
+            ArchivedPost._meta.verbose_name_plural:
+                ArchivedPost.objects.filter(author__in=objs).count(),
+            Follow._meta.verbose_name_plural: Follow.objects.filter(
+                Q(user__in=objs) | Q(author__in=objs)).count(),
+        }
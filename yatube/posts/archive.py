@@ -0,0 +1,125 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+
+from core.cache import TwoTierCache
+
+from .models import ArchivedPost, Post
+from .sharding import find_post
+from .utils import posts_before
+
+# Число постов в архиве по условию ленты. Архив меняется только при
+# переносе постов и правках архивных строк — тогда кэш и сбрасывается.
+archive_counts = TwoTierCache('archive-counts',
+                              timeout=settings.ARCHIVE_COUNT_TIMEOUT)
+
+
+class ArchiveChain:
+    """
+    Лента из двух частей: сначала горячая таблица Post, затем архив.
+    Paginator'у нужны только count() и срезы; архив читается лишь тогда,
+    когда страница заходит за конец горячей части, а его размер берётся
+    из archive_counts по cache_key.
+    """
+    def __init__(self, hot, cold, cache_key):
+        self.hot = hot
+        self.cold = cold
+        self.cache_key = cache_key
+        self._hot_count = None
+
+    def hot_count(self):
+        if self._hot_count is None:
+            self._hot_count = self.hot.count()
+        return self._hot_count
+
+    def cold_count(self):
+        return archive_counts.get_or_set(self.cache_key, self.cold.count)
+
+    def before(self, pub_date, pk):
+        """Цепочка за постом (pub_date, pk); размер архива ей не нужен."""
+        return ArchiveChain(
+            posts_before(self.hot, pub_date, pk),
+            posts_before(self.cold, pub_date, pk),
+            cache_key=None,
+        )
+
+    def count(self):
+        return self.hot_count() + self.cold_count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = self.count() if index.stop is None else index.stop
+        hot_count = self.hot_count()
+        items = []
+        if start < hot_count:
+            items.extend(self.hot[start:min(stop, hot_count)])
+        if stop > hot_count:
+            cold = self.cold[max(start - hot_count, 0):stop - hot_count]
+            items.extend(archived.to_post() for archived in cold)
+        return items
+
+
+def feed(hot, **lookups):
+    cold = ArchivedPost.objects.filter(**lookups).select_related(
+        'author', 'group').order_by('-pub_date', '-pk')
+    cache_key = ','.join(
+        f'{name}={getattr(value, "pk", value)}'
+        for name, value in sorted(lookups.items())) or 'all'
+    return ArchiveChain(hot, cold, cache_key)
+
+
+def get_post_or_archived(post_id):
+    post = find_post(post_id)
+    if post is not None:
+        return post
+    archived = (ArchivedPost.objects.filter(pk=post_id)
+                .select_related('author', 'group').first())
+    if archived is None:
+        raise Http404('Пост не найден')
+    return archived.to_post()
+
+
+def archive_batch(cutoff, batch_size, using=None):
+    """Переносит в архив одну пачку постов старше cutoff из шарда using."""
+    using = using or settings.POST_SHARDS[0]
+    with transaction.atomic(), transaction.atomic(using=using):
+        posts = list(
+            Post.objects.using(using).filter(pub_date__lt=cutoff)
+            .order_by('pk')[:batch_size]
+        )
+        if not posts:
+            return 0
+        ArchivedPost.objects.bulk_create(
+            ArchivedPost.from_post(post) for post in posts)
+        Post.objects.using(using).filter(
+            pk__in=[post.pk for post in posts]).delete()
+    # bulk_create не шлёт сигналов.
+    archive_counts.invalidate()
+    return len(posts)
+
+
+def archive_posts(older_than=None, batch_size=None, pause=0, stdout=None):
+    """
+    Переносит старые посты в архив короткими транзакциями, делая паузу
+    между пачками, чтобы не держать блокировку записи SQLite.
+    """
+    older_than = older_than or settings.ARCHIVE_AFTER
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    cutoff = timezone.now() - older_than
+    total = 0
+    for using in settings.POST_SHARDS:
+        while True:
+            moved = archive_batch(cutoff, batch_size, using)
+            if not moved:
+                break
+            total += moved
+            if stdout is not None:
+                stdout.write(f'Перенесено в архив: {total}')
+            if pause:
+                time.sleep(pause)
+    return total
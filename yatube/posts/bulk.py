@@ -0,0 +1,195 @@
+"""
+Массовые действия админки в фоне (BulkJob).
+
+Действие в админке только записывает BulkJob с выбранными id и ставит
+run_job в пул фоновых задач. Задача обрабатывает выбранное пачками по
+BULK_JOB_CHUNK_SIZE: каждая пачка — короткая транзакция (перенос — один
+UPDATE), между пачками пауза BULK_JOB_PAUSE, чтобы запись SQLite
+доставалась и запросам сайта. После пачки счётчик done растёт, и ход
+выполнения виден в списке фоновых действий.
+
+Прерванную задачу (перезапуск процесса, ошибка) можно запустить ещё
+раз действием в админке: для выбранных постов она продолжит с первой
+необработанной пачки, а перенос постов групп переносит только то, что
+ещё осталось в исходных группах.
+
+Задачу выполняет только один процесс: run_job забирает её одним
+UPDATE по состоянию (claimable), а после каждой пачки обновляет
+heartbeat. Задача в состоянии «Выполняется», чей обработчик не
+отмечался дольше BULK_JOB_LEASE, считается брошенной и забирается
+заново; прежний обработчик, если он ещё жив, замечает это по
+heartbeat и останавливается.
+"""
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from core.surrogate import purger
+from core.tasks import submit_on_commit
+
+from .archive import archive_counts
+from .deletion import delete_post_chunk
+from .models import ActivityStats, ArchivedPost, BulkJob, Group, Post
+from .stats import reset as reset_stats
+from .utils import feed_cache, feed_scopes, post_purge_keys
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """Задачу забрал другой обработчик, пока этот считался упавшим."""
+
+
+def claimable():
+    """Задачи, которые можно (пере)запустить: новые, упавшие и брошенные."""
+    stale = timezone.now() - settings.BULK_JOB_LEASE
+    return (Q(status__in=(BulkJob.PENDING, BulkJob.FAILED))
+            | Q(status=BulkJob.RUNNING, heartbeat__lt=stale)
+            | Q(status=BulkJob.RUNNING, heartbeat__isnull=True))
+
+
+def start_job(action, pks, user, target_group=None):
+    """Записывает действие над выбранными pks и ставит его в фон."""
+    pks = list(pks)
+    job = BulkJob.objects.create(
+        action=action,
+        selection=json.dumps(pks),
+        target_group=target_group,
+        total=len(pks),
+        created_by=user,
+    )
+    submit_on_commit(run_job, job.pk)
+    return job
+
+
+def _chunks(job):
+    pks = json.loads(job.selection)
+    size = settings.BULK_JOB_CHUNK_SIZE
+    # Пачки до done уже обработаны при прошлом запуске.
+    for start in range(job.done, len(pks), size):
+        yield pks[start:start + size]
+
+
+def _owned(job):
+    """Задача, пока её heartbeat не сменил другой обработчик."""
+    return BulkJob.objects.filter(pk=job.pk, heartbeat=job.heartbeat)
+
+
+def _chunk_done(job, count, purge_keys):
+    heartbeat = timezone.now()
+    if not _owned(job).update(done=F('done') + count, heartbeat=heartbeat):
+        raise LeaseLost(job.pk)
+    job.heartbeat = heartbeat
+    purger.purge(purge_keys)
+    time.sleep(settings.BULK_JOB_PAUSE)
+
+
+def _target_keys(job):
+    if job.target_group is None:
+        return ['feed-index']
+    return ['feed-index', f'group-{job.target_group.slug}',
+            f'feed-group-{job.target_group.slug}']
+
+
+def delete_posts(job):
+    for pks in _chunks(job):
+        keys = set()
+        for alias in settings.POST_SHARDS:
+            with transaction.atomic(using=alias):
+                posts = Post.objects.using(alias).filter(pk__in=pks)
+                # Ключи собираем до удаления: после него не узнать ни
+                # автора, ни группу поста.
+                for post in posts.only('author_id', 'group_id'):
+                    keys.update(post_purge_keys(post))
+                delete_post_chunk(posts)
+        _chunk_done(job, len(pks), sorted(keys))
+
+
+def move_posts(job):
+    target_keys = _target_keys(job)
+    for pks in _chunks(job):
+        group_ids = {job.target_group_id}
+        scopes = set()
+        keys = set(target_keys)
+        for alias in settings.POST_SHARDS:
+            posts = Post.objects.using(alias).filter(pk__in=pks)
+            # Ключи собираем до UPDATE: страницы прежней группы и автора
+            # тоже показывали пост.
+            for post in posts.only('author_id', 'group_id'):
+                keys.update(post_purge_keys(post))
+                group_ids.add(post.group_id)
+                scopes.update(feed_scopes(post.author_id, post.group_id,
+                                          job.target_group_id))
+            posts.update(group=job.target_group)
+        # UPDATE не шлёт сигналов: кэш лент сбрасываем сами.
+        feed_cache.invalidate(*sorted(scopes))
+        # Статистика групп только прибавляет: пусть посчитается заново.
+        reset_stats(ActivityStats.GROUP, group_ids - {None})
+        _chunk_done(job, len(pks), sorted(keys))
+
+
+def move_group_posts(job):
+    group_ids = [pk for pk in json.loads(job.selection)
+                 if pk != job.target_group_id]
+    sources = [
+        *(Post.objects.using(alias).filter(group_id__in=group_ids)
+          for alias in settings.POST_SHARDS),
+        ArchivedPost.objects.filter(group_id__in=group_ids),
+    ]
+    # Посты, показанные на страницах, помечены ключом своей группы.
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        'slug', flat=True)
+    keys = [*_target_keys(job), *(f'group-{slug}' for slug in slugs)]
+    stats_ids = {*group_ids, job.target_group_id} - {None}
+    _owned(job).update(
+        total=job.done + sum(queryset.count() for queryset in sources))
+    size = settings.BULK_JOB_CHUNK_SIZE
+    for queryset in sources:
+        model = queryset.model.objects.using(queryset.db)
+        while True:
+            # id пачки читаем отдельно: IN с подзапросом с LIMIT MySQL
+            # не поддерживает.
+            pks = list(queryset.order_by('pk')
+                       .values_list('pk', flat=True)[:size])
+            if not pks:
+                break
+            moved = model.filter(pk__in=pks).update(group=job.target_group)
+            if queryset.model is ArchivedPost:
+                archive_counts.invalidate()
+            # Авторы перенесённых постов не известны: сбрасываем все ленты.
+            feed_cache.invalidate()
+            reset_stats(ActivityStats.GROUP, stats_ids)
+            _chunk_done(job, moved, keys)
+
+
+RUNNERS = {
+    BulkJob.DELETE_POSTS: delete_posts,
+    BulkJob.MOVE_POSTS: move_posts,
+    BulkJob.MOVE_GROUP_POSTS: move_group_posts,
+}
+
+
+def run_job(job_id):
+    heartbeat = timezone.now()
+    # Забираем задачу одним UPDATE: из двух запусков выполняет один.
+    claimed = BulkJob.objects.filter(claimable(), pk=job_id).update(
+        status=BulkJob.RUNNING, error='', heartbeat=heartbeat)
+    if not claimed:
+        return
+    job = BulkJob.objects.select_related('target_group').get(pk=job_id)
+    try:
+        RUNNERS[job.action](job)
+    except LeaseLost:
+        logger.warning('Фоновое действие %s продолжил другой обработчик',
+                       job.pk)
+        return
+    except Exception as error:
+        logger.exception('Фоновое действие %s завершилось ошибкой', job.pk)
+        _owned(job).update(status=BulkJob.FAILED, error=repr(error))
+        return
+    _owned(job).update(status=BulkJob.DONE, finished=timezone.now())
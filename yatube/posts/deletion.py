@@ -0,0 +1,128 @@
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import (ArchivedPost, Follow, Group, Post, PostBucket,
+                     PostScore, PostSignature, RelatedPost, TimelineEntry,
+                     User)
+from .sharding import author_shards
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def log_progress(stage, done, total):
+    logger.info('%s: %s из %s', stage, done, total)
+
+
+def process_in_chunks(queryset, action, stage, chunk_size=None,
+                      progress=log_progress):
+    """
+    Применяет action к queryset пачками по chunk_size строк, каждую пачку —
+    в своей короткой транзакции. action получает queryset одной пачки.
+    """
+    chunk_size = chunk_size or settings.DELETION_CHUNK_SIZE
+    total = queryset.count()
+    done = 0
+    while True:
+        with transaction.atomic(using=queryset.db):
+            pks = list(queryset.order_by('pk')
+                       .values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return done
+            action(queryset.model.objects.using(queryset.db)
+                   .filter(pk__in=pks))
+        done += len(pks)
+        progress(stage, done, total)
+
+
+def delete_chunk(queryset):
+    queryset.delete()
+
+
+@contextmanager
+def deleting_in_chunks():
+    """
+    Внутри блока сигнал post_delete не удаляет ссылки на каждый пост:
+    это делает delete_post_chunk один раз на пачку.
+    """
+    previous = getattr(_local, 'in_chunks', False)
+    _local.in_chunks = True
+    try:
+        yield
+    finally:
+        _local.in_chunks = previous
+
+
+def is_deleting_in_chunks():
+    return getattr(_local, 'in_chunks', False)
+
+
+def delete_post_chunk(queryset):
+    post_ids = list(queryset.values_list('pk', flat=True))
+    with deleting_in_chunks():
+        queryset.delete()
+    delete_post_references(post_ids)
+
+
+def delete_post_references(post_ids):
+    """
+    Удаляет записи лент, рейтинги, похожие посты и подписи постов. Они
+    лежат в default, а пост может быть в другом шарде, поэтому каскад их
+    не удаляет; при любом удалении поста это делает сигнал post_delete.
+    """
+    TimelineEntry.objects.filter(post_id__in=post_ids).delete()
+    PostScore.objects.filter(post_id__in=post_ids).delete()
+    RelatedPost.objects.filter(
+        Q(post_id__in=post_ids) | Q(related_id__in=post_ids)).delete()
+    PostBucket.objects.filter(post_id__in=post_ids).delete()
+    PostSignature.objects.filter(post_id__in=post_ids).delete()
+
+
+def delete_posts(queryset, chunk_size=None, progress=log_progress):
+    return process_in_chunks(queryset, delete_post_chunk, 'Посты',
+                             chunk_size, progress)
+
+
+def delete_user(user, chunk_size=None, progress=log_progress):
+    """Удаляет пользователя, предварительно удалив его данные пачками."""
+    for using in author_shards(user.pk):
+        delete_posts(Post.objects.using(using).filter(author=user),
+                     chunk_size, progress)
+    process_in_chunks(ArchivedPost.objects.filter(author=user),
+                      delete_chunk, 'Архив постов', chunk_size, progress)
+    process_in_chunks(TimelineEntry.objects.filter(user=user),
+                      delete_chunk, 'Лента', chunk_size, progress)
+    process_in_chunks(Follow.objects.filter(author=user),
+                      delete_chunk, 'Подписчики', chunk_size, progress)
+    process_in_chunks(Follow.objects.filter(user=user),
+                      delete_chunk, 'Подписки', chunk_size, progress)
+    user.delete()
+
+
+def delete_group(group, chunk_size=None, progress=log_progress):
+    """Отвязывает посты от группы пачками и затем удаляет группу."""
+    def detach(queryset):
+        queryset.update(group=None)
+
+    for using in settings.POST_SHARDS:
+        process_in_chunks(Post.objects.using(using).filter(group=group),
+                          detach, 'Посты группы', chunk_size, progress)
+    process_in_chunks(ArchivedPost.objects.filter(group=group), detach,
+                      'Архив группы', chunk_size, progress)
+    group.delete()
+
+
+def delete_users(pks):
+    for user in User.objects.filter(pk__in=pks):
+        delete_user(user)
+
+
+def delete_groups(pks):
+    for group in Group.objects.filter(pk__in=pks):
+        delete_group(group)
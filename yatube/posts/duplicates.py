@@ -0,0 +1,181 @@
+"""
+Поиск почти одинаковых постов (спам): MinHash и LSH.
+
+Текст разбивается на тройки слов подряд (шинглы). Подпись — минимумы
+DUPLICATE_BANDS * DUPLICATE_ROWS хеш-функций по шинглам: доля совпавших
+позиций двух подписей оценивает долю общих шинглов (сходство Жаккара).
+Подпись делится на полосы по DUPLICATE_ROWS значений, хеш полосы —
+корзина LSH. Посты со сходством s попадают хотя бы в одну общую корзину
+с вероятностью 1 - (1 - s ** rows) ** bands: при 16 x 8 это почти
+наверняка для s = 0.9 и редко для s < 0.6.
+
+Проверка нового текста — один запрос: подписи существующих постов из его
+корзин (индекс по bucket); повтором считается пост с оценкой сходства не
+ниже DUPLICATE_THRESHOLD. С шардами найденный пост проверяется ещё одним
+запросом к его шарду. Подписи и корзины обновляются при сохранении поста
+(signals), для уже опубликованных — командой index_duplicates. После
+смены DUPLICATE_* её нужно запустить заново.
+
+У длинного текста подписываются только DUPLICATE_MAX_SHINGLES шинглов с
+наименьшими хешами: выборка одинакова для всех текстов, поэтому доля
+совпавших позиций по-прежнему оценивает сходство, а время подписи не
+растёт с длиной текста. Подпись, посчитанную формой, сохранение поста
+берёт из Post.text_signature и не считает заново.
+"""
+import hashlib
+import heapq
+import random
+import re
+import struct
+import zlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .models import Post, PostBucket, PostSignature
+from .sharding import find_post, is_sharded
+
+WORD_RE = re.compile(r'\w+')
+
+PRIME = (1 << 61) - 1
+
+MASK = 0xFFFFFFFF
+
+
+@lru_cache(maxsize=None)
+def _hash_functions(count):
+    # Постоянное зерно: подписи сравнимы между процессами и запусками.
+    generator = random.Random(count)
+    return tuple((generator.randrange(1, PRIME), generator.randrange(PRIME))
+                 for _ in range(count))
+
+
+def shingles(text):
+    words = WORD_RE.findall(text.casefold().replace('ё', 'е'))
+    if not words:
+        return set()
+    size = settings.DUPLICATE_SHINGLE_WORDS
+    return {' '.join(words[start:start + size])
+            for start in range(max(len(words) - size + 1, 1))}
+
+
+def signature(text):
+    """MinHash-подпись текста или None для короткого и текста без слов."""
+    if len(text.strip()) < settings.DUPLICATE_MIN_LENGTH:
+        return None
+    hashes = heapq.nsmallest(
+        settings.DUPLICATE_MAX_SHINGLES,
+        {zlib.crc32(shingle.encode()) for shingle in shingles(text)})
+    if not hashes:
+        return None
+    count = settings.DUPLICATE_BANDS * settings.DUPLICATE_ROWS
+    return [min((a * value + b) % PRIME for value in hashes) & MASK
+            for a, b in _hash_functions(count)]
+
+
+def bucket_keys(values):
+    """Корзины подписи: знаковые 64-битные хеши полос с их номерами."""
+    rows = settings.DUPLICATE_ROWS
+    keys = []
+    for band in range(len(values) // rows):
+        data = struct.pack(f'<H{rows}I', band,
+                           *values[band * rows:(band + 1) * rows])
+        keys.append(int.from_bytes(
+            hashlib.blake2b(data, digest_size=8).digest(), 'little',
+            signed=True))
+    return keys
+
+
+def pack(values):
+    return struct.pack(f'<{len(values)}I', *values)
+
+
+def unpack(data):
+    data = bytes(data)
+    return struct.unpack(f'<{len(data) // 4}I', data)
+
+
+def similarity(first, second):
+    """Оценка сходства Жаккара по двум подписям."""
+    if len(first) != len(second):
+        return 0.0
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+def find_duplicate(text, exclude=None):
+    """Id поста, почти совпадающего с text, или None."""
+    values = signature(text)
+    if values is None:
+        return None
+    return lookup(values, exclude)
+
+
+def lookup(values, exclude=None):
+    """Id существующего поста с подписью, похожей на values, или None."""
+    candidates = PostBucket.objects.filter(bucket__in=bucket_keys(values))
+    if exclude is not None:
+        candidates = candidates.exclude(post_id=exclude)
+    rows = PostSignature.objects.filter(
+        post_id__in=candidates.values('post_id'))
+    if not is_sharded():
+        # Подпись, оставшаяся от удалённого поста, не в счёт.
+        rows = rows.annotate(
+            exists=Exists(Post.objects.filter(pk=OuterRef('post_id'))),
+        ).filter(exists=True)
+    for post_id, data in rows.values_list('post_id', 'signature').iterator():
+        if similarity(values, unpack(data)) < settings.DUPLICATE_THRESHOLD:
+            continue
+        # С шардами пост проверяется в своей базе: соединения нет.
+        if is_sharded() and find_post(
+                post_id, Post.objects.values('pk')) is None:
+            continue
+        return post_id
+    return None
+
+
+def _index(items):
+    # items: [(id поста, подпись или None), ...]; прежние подписи
+    # заменяются.
+    post_ids = [post_id for post_id, _ in items]
+    signatures, buckets = [], []
+    for post_id, values in items:
+        if values is None:
+            continue
+        signatures.append(PostSignature(post_id=post_id,
+                                        signature=pack(values)))
+        buckets.extend(PostBucket(post_id=post_id, bucket=key)
+                       for key in bucket_keys(values))
+    with transaction.atomic():
+        PostBucket.objects.filter(post_id__in=post_ids).delete()
+        PostSignature.objects.filter(post_id__in=post_ids).delete()
+        PostSignature.objects.bulk_create(signatures)
+        PostBucket.objects.bulk_create(buckets)
+    return len(signatures)
+
+
+def index_post(post):
+    text, values = post.text_signature or (None, None)
+    if text != post.text:
+        values = signature(post.text)
+    _index([(post.pk, values)])
+
+
+def index_posts(batch_size=None, stdout=None):
+    """Подписи всех опубликованных постов; возвращает число подписанных."""
+    batch_size = batch_size or settings.DUPLICATE_BATCH_SIZE
+    total = 0
+    for alias in settings.POST_SHARDS:
+        last_pk = 0
+        while True:
+            texts = list(Post.objects.using(alias).filter(pk__gt=last_pk)
+                         .order_by('pk').values_list('pk', 'text')
+                         [:batch_size])
+            if not texts:
+                break
+            total += _index([(pk, signature(text)) for pk, text in texts])
+            last_pk = texts[-1][0]
+            if stdout is not None:
+                stdout.write(f'{alias}: подписано постов {total}')
+    return total
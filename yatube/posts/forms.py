@@ -1,15 +1,56 @@
 from django import forms
+from django.urls import reverse_lazy
 
+from .duplicates import lookup, signature
 from .models import Post
+from .registry import group_registry
+
+
+class GroupLookupWidget(forms.Select):
+    """
+    Выбор группы без полного списка: в HTML попадает только выбранная
+    группа, остальные подгружает js/group_lookup.js из lookup_url.
+    """
+    empty_label = '---------'
+
+    def __init__(self, attrs=None, lookup_url=reverse_lazy(
+            'posts:group_lookup')):
+        super().__init__(attrs)
+        self.lookup_url = lookup_url
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-lookup-url'] = str(self.lookup_url)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        selected = [pk for pk in value if str(pk).isdigit()]
+        options = [self.create_option(
+            name, '', self.empty_label, not selected, 0)]
+        for index, pk in enumerate(selected, 1):
+            options.append(self.create_option(
+                name, pk, group_registry.label(int(pk)), True, index))
+        return [(None, [option], option['index']) for option in options]
 
 
 class PostForm(forms.ModelForm):
 
     class Meta:
         model = Post
-        fields = ('text', 'group',)
-        labels = {'text': 'текст', 'group': 'группа'}
+        fields = ('text', 'group', 'image',)
+        labels = {'text': 'текст', 'group': 'группа', 'image': 'картинка'}
         widgets = {
             'text': forms.Textarea(attrs={'class': 'form-control'}),
-            'group': forms.Select(attrs={'class': 'form-control'}),
+            # Проверка выбранной группы — один запрос по pk в queryset поля.
+            'group': GroupLookupWidget(attrs={'class': 'form-control'}),
         }
+
+    def clean_text(self):
+        text = self.cleaned_data['text']
+        values = signature(text)
+        self.instance.text_signature = (text, values)
+        if (values is not None
+                and lookup(values, exclude=self.instance.pk) is not None):
+            raise forms.ValidationError(
+                'Почти такой же пост уже опубликован', code='duplicate')
+        return text
@@ -0,0 +1,94 @@
+import hashlib
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from PIL import Image, ImageOps
+
+from core.surrogate import purger
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, где имя файла определяется его содержимым:
+    повторная загрузка той же картинки не создаёт копию на диске.
+    """
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+image_storage = ContentAddressedStorage()
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def post_image_path(instance, filename):
+    digest = content_hash(instance.image.file)
+    extension = os.path.splitext(filename)[1].lower()
+    return f'posts/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def thumbnail_name(image_name, size_name):
+    digest = os.path.splitext(os.path.basename(image_name))[0]
+    return f'thumbs/{size_name}/{digest[:2]}/{digest}.jpg'
+
+
+def thumbnail_urls(image_name):
+    # Только строковые операции: шаблон не трогает диск.
+    return {
+        size_name: image_storage.url(thumbnail_name(image_name, size_name))
+        for size_name in settings.POST_THUMBNAIL_SIZES
+    }
+
+
+def render_thumbnail(image, size):
+    thumbnail = ImageOps.fit(image, size, Image.LANCZOS)
+    if thumbnail.mode != 'RGB':
+        thumbnail = thumbnail.convert('RGB')
+    buffer = BytesIO()
+    thumbnail.save(buffer, 'JPEG', quality=settings.THUMBNAIL_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def generate_thumbnails(post_id):
+    """Готовит все размеры превью для картинки поста."""
+    from .models import Post
+    from .sharding import find_post, post_shards
+    from .utils import feed_cache, feed_scopes
+
+    post = find_post(post_id,
+                     Post.objects.values('image', 'author_id', 'group_id'))
+    image_name = post and post['image']
+    if not image_name:
+        return
+    with image_storage.open(image_name) as file:
+        image = Image.open(file)
+        image.load()
+    for size_name, size in settings.POST_THUMBNAIL_SIZES.items():
+        name = thumbnail_name(image_name, size_name)
+        if not image_storage.exists(name):
+            image_storage.save(name, render_thumbnail(image, size))
+    # Картинку могли заменить, пока мы работали, — тогда флаг не ставим.
+    for using in post_shards(post_id):
+        if Post.objects.using(using).filter(
+                pk=post_id, image=image_name).update(thumbnails_ready=True):
+            feed_cache.invalidate(
+                *feed_scopes(post['author_id'], post['group_id']))
+            purger.purge([f'post-{post_id}'])
+            return
@@ -0,0 +1,36 @@
+"""
+Адреса постов, групп и авторов для get_absolute_url().
+
+reverse() на каждый вызов обходит резолвер и проверяет аргументы.
+Здесь адрес вида с одним аргументом строится один раз на процесс
+и префикс скрипта — с заглушкой вместо аргумента. Дальше он собирается
+конкатенацией начала, экранированного значения и конца.
+"""
+from functools import lru_cache
+from urllib.parse import quote
+
+from django.urls import get_script_prefix, reverse
+from django.utils.http import RFC3986_SUBDELIMS
+
+# Подходит под конвертеры int, slug и str
+PLACEHOLDER = '7357'
+
+# Символы, которые reverse() оставляет в аргументах без экранирования
+SAFE_CHARS = RFC3986_SUBDELIMS + '/~:@'
+
+
+@lru_cache(maxsize=None)
+def _url_parts(name, script_prefix):
+    url = reverse(name, args=(PLACEHOLDER,))
+    prefix, _, suffix = url.rpartition(PLACEHOLDER)
+    return prefix, suffix
+
+
+def object_url(name, value):
+    """То же, что reverse(name, args=(value,)), без обхода резолвера."""
+    prefix, suffix = _url_parts(name, get_script_prefix())
+    return prefix + quote(str(value), safe=SAFE_CHARS) + suffix
+
+
+def author_url(user):
+    return object_url('posts:profile', user.username)
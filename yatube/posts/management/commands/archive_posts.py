@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from posts.archive import archive_posts
+
+
+class Command(BaseCommand):
+    help = 'Переносит старые посты в сжатый архив небольшими пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Возраст поста в днях (по умолчанию ARCHIVE_AFTER)',
+        )
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Пауза между пачками в секундах',
+        )
+
+    def handle(self, *args, **options):
+        older_than = (timedelta(days=options['days'])
+                      if options['days'] is not None else None)
+        total = archive_posts(
+            older_than=older_than,
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Готово, постов: {total}'))
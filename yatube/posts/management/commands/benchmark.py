@@ -0,0 +1,180 @@
+import os
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import engines
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from posts.duplicates import bucket_keys, index_post, lookup, signature
+from posts.models import Group, Post, PostBucket, PostSignature, User
+from posts.utils import WindowedPaginator
+
+FEED_LENGTHS = (10 ** 2, 10 ** 4, 10 ** 6, 10 ** 8)
+
+INDEX_SIZES = (10 ** 4, 10 ** 5, 10 ** 6)
+
+# Id несуществующих постов для подписей-заглушек
+FAKE_POST_ID = 10 ** 12
+
+FAKE_BATCH_SIZE = 10000
+
+FEED_SIZES = (10, 50, 100)
+
+# Лента до feed_posts: include карточки на каждый пост и {% url %}
+LEGACY_FEED = '''
+{% for post in posts %}
+  {% include card %}
+  {% if not forloop.last %}<hr>{% endif %}
+{% endfor %}
+'''
+
+LEGACY_CARD = '''
+<article>
+    <ul>
+        <li>
+          Автор: {{ author.get_full_name }}
+          {% if not profile_link %}
+            <a href="{% url 'posts:profile' post.author %}">
+              все посты пользователя</a>
+          {% endif %}
+        </li>
+        <li>
+          Дата публикации: {{ post.pub_date|date:"d E Y" }}
+        </li>
+      </ul>
+        {% if post.thumbnails_ready %}
+          <img class="card-img my-2" src="{{ post.thumbnails.card }}" alt="">
+        {% endif %}
+        <p>
+          {{ post.excerpt_html|safe }}
+        </p>
+        {% if post.is_truncated %}
+          <a href="{% url 'posts:post_detail' post.id %}">читать дальше</a>
+          <br>
+        {% endif %}
+      <a href="{% url 'posts:post_detail' post.id %}">подробная информация </a>
+      <br>
+      {% if not post.group and group_link %}
+        <a href="{% url 'posts:group_list' post.group.slug %}">
+          все записи группы</a>
+      {% endif %}
+</article>
+'''
+
+
+def timed(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - started) / repeat
+
+
+class Command(BaseCommand):
+    help = 'Замеры производительности отдельных частей проекта'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets', nargs='*', default=None,
+            help='Что замерять: ' + ', '.join(self.targets()),
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def targets(self):
+        return {
+            'paginator': self.bench_paginator,
+            'duplicates': self.bench_duplicates,
+            'feed': self.bench_feed,
+        }
+
+    def handle(self, *args, **options):
+        targets = self.targets()
+        for name in options['targets'] or targets:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            targets[name](options['repeat'])
+
+    def bench_paginator(self, repeat):
+        """Размер и время отрисовки пагинатора при разной длине ленты."""
+        for length in FEED_LENGTHS:
+            # range умеет len() и срезы, база для замера не нужна.
+            paginator = WindowedPaginator(range(length),
+                                          settings.POSTS_ON_PAGE)
+            for number in (1, paginator.num_pages // 2, paginator.num_pages):
+                page = paginator.page(number)
+                html, seconds = timed(
+                    lambda: render_to_string(
+                        'posts/includes/paginator.html', {'page_obj': page}),
+                    repeat,
+                )
+                self.stdout.write(
+                    f'{length:>10} постов, стр. {number:>8}: '
+                    f'{len(html.encode()):>6} байт, {seconds * 1000:.2f} мс'
+                )
+
+    def bench_duplicates(self, repeat):
+        """
+        Поиск повтора по готовой подписи при разном числе подписанных
+        постов (время подписи текста — отдельной строкой). Подписи
+        постов-заглушек случайные, как у несвязанных текстов; всё
+        записанное откатывается в конце.
+        """
+        text = ' '.join(f'слово{number}' for number in range(100))
+        values, seconds = timed(lambda: signature(text), repeat)
+        self.stdout.write(f'подпись текста: {seconds * 1000:.2f} мс')
+        duplicate = signature(text + ' ещё слово')
+        unrelated = signature(text.replace('слово', 'текст'))
+        size = len(values) * 4
+        bands = len(bucket_keys(values))
+        with transaction.atomic():
+            index_post(Post(pk=FAKE_POST_ID, text=text))
+            indexed = 0
+            for total in INDEX_SIZES:
+                while indexed < total:
+                    post_ids = range(
+                        FAKE_POST_ID + indexed + 1,
+                        FAKE_POST_ID + min(total, indexed + FAKE_BATCH_SIZE)
+                        + 1)
+                    PostSignature.objects.bulk_create(
+                        PostSignature(post_id=post_id,
+                                      signature=os.urandom(size))
+                        for post_id in post_ids)
+                    PostBucket.objects.bulk_create(
+                        PostBucket(post_id=post_id,
+                                   bucket=random.getrandbits(64) - (1 << 63))
+                        for post_id in post_ids for _ in range(bands))
+                    indexed += len(post_ids)
+                _, found = timed(lambda: lookup(duplicate), repeat)
+                _, missed = timed(lambda: lookup(unrelated), repeat)
+                self.stdout.write(
+                    f'{total:>10} постов: повтор {found * 1000:.3f} мс, '
+                    f'новый текст {missed * 1000:.3f} мс'
+                )
+            transaction.set_rollback(True)
+
+    def bench_feed(self, repeat):
+        """Отрисовка карточек ленты: include и {% url %} против feed_posts."""
+        engine = engines['django']
+        legacy = engine.from_string(LEGACY_FEED)
+        card = engine.from_string(LEGACY_CARD)
+        current = engine.from_string('{% load feed %}{% feed_posts posts %}')
+        author = User(pk=1, username='benchmark', first_name='Лев',
+                      last_name='Толстой')
+        group = Group(pk=1, title='Тестовая группа', slug='benchmark')
+        for size in FEED_SIZES:
+            posts = [
+                Post(pk=number, author=author, group=group,
+                     pub_date=timezone.now(), is_truncated=True,
+                     excerpt_html='<p>Начало текста поста</p>')
+                for number in range(1, size + 1)
+            ]
+            _, before = timed(
+                lambda: legacy.render({'posts': posts, 'card': card}), repeat)
+            _, after = timed(lambda: current.render({'posts': posts}), repeat)
+            self.stdout.write(
+                f'{size:>4} постов: include {before * 1000:.2f} мс, '
+                f'feed_posts {after * 1000:.2f} мс '
+                f'({before / after:.1f}x)'
+            )
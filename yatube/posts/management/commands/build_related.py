@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts.related import build_related
+
+
+class Command(BaseCommand):
+    help = 'Обновляет индекс похожих постов: новые посты или все заново'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересобрать индекс и соседей всех постов',
+        )
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        total = build_related(
+            full=options['full'],
+            batch_size=options['batch_size'],
+            stdout=self.stdout,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Готово, постов: {total}'))
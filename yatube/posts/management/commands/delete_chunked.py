@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.deletion import delete_group, delete_user
+from posts.models import Group, User
+
+
+class Command(BaseCommand):
+    help = ('Удаляет пользователя или группу, обрабатывая связанные '
+            'записи пачками в коротких транзакциях')
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--user', help='Имя пользователя')
+        target.add_argument('--group', help='Slug группы')
+        parser.add_argument('--chunk-size', type=int, default=None)
+
+    def progress(self, stage, done, total):
+        self.stdout.write(f'{stage}: {done} из {total}')
+
+    def handle(self, *args, **options):
+        try:
+            if options['user']:
+                target = User.objects.get(username=options['user'])
+                delete_user(target, options['chunk_size'], self.progress)
+            else:
+                target = Group.objects.get(slug=options['group'])
+                delete_group(target, options['chunk_size'], self.progress)
+        except (User.DoesNotExist, Group.DoesNotExist):
+            raise CommandError('Объект для удаления не найден')
+        self.stdout.write(self.style.SUCCESS(f'Удалено: {target}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.duplicates import index_posts
+
+
+class Command(BaseCommand):
+    help = ('Считает подписи для поиска повторов у уже опубликованных '
+            'постов; повторный запуск пересчитывает все')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        total = index_posts(batch_size=options['batch_size'],
+                            stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Готово, постов: {total}'))
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.models import User
+from posts.sharding import hash_shard, move_author, plan_rebalance
+
+
+class Command(BaseCommand):
+    help = ('Переносит посты авторов между шардами, не останавливая '
+            'запись. Без --author переносит всех, чьи посты лежат не в '
+            'их шарде, например после добавления шардов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--author', help='Имя пользователя')
+        parser.add_argument(
+            '--to', choices=settings.POST_SHARDS,
+            help='Шард для автора (по умолчанию — по хэшу id)',
+        )
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Пауза между пачками в секундах',
+        )
+
+    def handle(self, *args, **options):
+        if options['author']:
+            try:
+                author = User.objects.get(username=options['author'])
+            except User.DoesNotExist:
+                raise CommandError('Автор не найден')
+            plan = {author.pk: options['to'] or hash_shard(author.pk)}
+        elif options['to']:
+            raise CommandError('--to задаётся вместе с --author')
+        else:
+            plan = plan_rebalance()
+        total = 0
+        for author_id, target in plan.items():
+            moved = move_author(author_id, target, options['batch_size'],
+                                options['pause'])
+            self.stdout.write(
+                f'Автор {author_id}: перенесено в {target} постов: {moved}')
+            total += moved
+        self.stdout.write(self.style.SUCCESS(f'Готово, постов: {total}'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.trending import rebase
+
+
+class Command(BaseCommand):
+    help = 'Сдвигает начало отсчёта рейтингов «в тренде» на текущий момент'
+
+    def handle(self, *args, **options):
+        rebase()
+        self.stdout.write(self.style.SUCCESS('Рейтинги пересчитаны'))
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.text import backfill_rendered_text
+
+
+class Command(BaseCommand):
+    help = 'Заново сохраняет HTML-представления текста всех постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = sum(
+            backfill_rendered_text(Post, options['batch_size'],
+                                   stdout=self.stdout, using=alias)
+            for alias in settings.POST_SHARDS)
+        self.stdout.write(self.style.SUCCESS(f'Готово, постов: {total}'))
@@ -0,0 +1,177 @@
+import random
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from posts.models import Group, Post, User
+from posts.registry import group_registry
+from posts.sharding import bulk_create_posts
+from posts.text import normalize_title, render_text
+
+SYLLABLES = (
+    'ка', 'ло', 'ми', 'ра', 'то', 'не', 'пу', 'се', 'ви', 'до',
+    'жу', 'зо', 'ли', 'ма', 'но', 'ре', 'ту', 'фи', 'ша', 'ю',
+)
+VOCABULARY_SIZE = 5000
+
+
+def zipf_cum_weights(size, exponent, rng):
+    """Накопленные веса степенного распределения в случайном порядке."""
+    weights = [1 / (rank ** exponent) for rank in range(1, size + 1)]
+    rng.shuffle(weights)
+    return list(accumulate(weights))
+
+
+def make_vocabulary(rng):
+    return [
+        ''.join(rng.choices(SYLLABLES, k=rng.randint(1, 4)))
+        for _ in range(VOCABULARY_SIZE)
+    ]
+
+
+@contextmanager
+def explicit_pub_date():
+    # auto_now_add перезаписал бы сгенерированные даты текущим временем.
+    field = Post._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Создаёт воспроизводимый синтетический набор пользователей, '
+            'групп и постов с неравномерными распределениями')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed',
+                            help='Префикс имён пользователей и slug групп')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--author-skew', type=float, default=1.1,
+            help='Показатель степени для числа постов на автора')
+        parser.add_argument(
+            '--group-skew', type=float, default=1.3,
+            help='Показатель степени для популярности групп')
+        parser.add_argument(
+            '--no-group-share', type=float, default=0.2,
+            help='Доля постов без группы')
+        parser.add_argument(
+            '--text-mu', type=float, default=3.0,
+            help='Среднее логнормального распределения длины текста, слов')
+        parser.add_argument('--text-sigma', type=float, default=1.0)
+        parser.add_argument('--max-words', type=int, default=2000)
+        parser.add_argument('--days', type=int, default=365,
+                            help='На сколько дней назад растянуть посты')
+        parser.add_argument(
+            '--end', default=None,
+            help='Дата последнего поста, ГГГГ-ММ-ДД (по умолчанию сегодня)')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь')
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Данные с префиксом «{prefix}» уже есть, укажите другой '
+                '--prefix')
+
+        user_ids = self.create_users(prefix)
+        group_ids = self.create_groups(prefix)
+        self.create_posts(user_ids, group_ids)
+        self.stdout.write(self.style.SUCCESS('Готово'))
+
+    def batches(self, total):
+        batch_size = self.options['batch_size']
+        for start in range(0, total, batch_size):
+            yield range(start, min(start + batch_size, total))
+
+    def create_users(self, prefix):
+        # Один хеш на всех: PBKDF2 на миллион пользователей занял бы часы.
+        password = make_password('password', salt=f'{prefix}salt')
+        for batch in self.batches(self.options['users']):
+            User.objects.bulk_create(
+                User(username=f'{prefix}_{number:07d}', password=password)
+                for number in batch
+            )
+            self.stdout.write(f'Пользователи: {batch.stop}')
+        return list(
+            User.objects.filter(username__startswith=f'{prefix}_')
+            .order_by('username').values_list('pk', flat=True))
+
+    def create_groups(self, prefix):
+        for batch in self.batches(self.options['groups']):
+            Group.objects.bulk_create(
+                Group(
+                    title=f'Группа {number}',
+                    title_normalized=normalize_title(f'Группа {number}'),
+                    slug=f'{prefix}-group-{number}',
+                    description=f'Описание группы {number}',
+                )
+                for number in batch
+            )
+        # bulk_create не шлёт post_save, реестр групп сбрасываем сами.
+        group_registry.clear()
+        self.stdout.write(f'Группы: {self.options["groups"]}')
+        return list(
+            Group.objects.filter(slug__startswith=f'{prefix}-group-')
+            .order_by('pk').values_list('pk', flat=True))
+
+    def end_date(self):
+        if self.options['end']:
+            day = datetime.strptime(self.options['end'], '%Y-%m-%d').date()
+        else:
+            day = timezone.now().date()
+        return timezone.make_aware(datetime.combine(day, time.max),
+                                   timezone.utc)
+
+    def create_posts(self, user_ids, group_ids):
+        rng = self.rng
+        options = self.options
+        vocabulary = make_vocabulary(rng)
+        author_weights = zipf_cum_weights(
+            len(user_ids), options['author_skew'], rng)
+        group_weights = zipf_cum_weights(
+            len(group_ids), options['group_skew'], rng)
+        end = self.end_date()
+        span = timedelta(days=options['days']).total_seconds()
+
+        with explicit_pub_date():
+            for batch in self.batches(options['posts']):
+                authors = rng.choices(
+                    user_ids, cum_weights=author_weights, k=len(batch))
+                groups = (
+                    rng.choices(group_ids, cum_weights=group_weights,
+                                k=len(batch))
+                    if group_ids else [None] * len(batch)
+                )
+                posts = []
+                for author_id, group_id in zip(authors, groups):
+                    words = min(options['max_words'], max(1, int(
+                        rng.lognormvariate(options['text_mu'],
+                                           options['text_sigma']))))
+                    text = ' '.join(rng.choices(vocabulary, k=words))
+                    if rng.random() < options['no_group_share']:
+                        group_id = None
+                    post = Post(
+                        text=text,
+                        author_id=author_id,
+                        group_id=group_id,
+                        pub_date=end - timedelta(
+                            seconds=rng.random() * span),
+                        **render_text(text),
+                    )
+                    posts.append(post)
+                bulk_create_posts(posts)
+                self.stdout.write(f'Посты: {batch.stop}')
@@ -0,0 +1,81 @@
+from django.db import migrations, models
+from django.template.defaultfilters import linebreaks_filter, linebreaksbr
+from django.utils.text import Truncator
+
+BATCH_SIZE = 1000
+
+# Копия posts.text.render_text на момент миграции: код приложения может
+# измениться, а миграция должна заполнять поля так же, как при создании.
+EXCERPT_LENGTH = 300
+
+
+def render_text(text):
+    if len(text) <= EXCERPT_LENGTH:
+        excerpt = text
+    else:
+        excerpt = Truncator(text[:EXCERPT_LENGTH * 2]).chars(EXCERPT_LENGTH)
+    return {
+        'excerpt': excerpt,
+        'excerpt_html': linebreaks_filter(excerpt, autoescape=True),
+        'is_truncated': excerpt != text,
+        'text_html_br': linebreaksbr(text, autoescape=True),
+    }
+
+
+def forwards(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.using(schema_editor.connection.alias)
+    fields = ('excerpt', 'excerpt_html', 'is_truncated', 'text_html_br')
+    last_pk = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last_pk).order_by('pk')
+                     .only('pk', 'text')[:BATCH_SIZE])
+        if not batch:
+            return
+        for post in batch:
+            rendered = render_text(post.text)
+            for field in fields:
+                setattr(post, field, rendered[field])
+        posts.bulk_update(batch, fields)
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+    # Каждая пачка фиксируется отдельно, чтобы не держать блокировку
+    # записи на всё время заполнения.
+    atomic = False
+
+    replaces = [
+        ('posts', '0008_post_rendered_text'),
+        ('posts', '0009_backfill_rendered_text'),
+        ('posts', '0010_post_excerpt'),
+        ('posts', '0011_backfill_excerpt'),
+    ]
+
+    dependencies = [
+        ('posts', '0007_trending_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='text_html_br',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False, verbose_name='Начало текста'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='is_truncated',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
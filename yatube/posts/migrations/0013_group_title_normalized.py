@@ -0,0 +1,38 @@
+# Generated by Django 2.2.16 on 2026-10-19 09:34
+
+from django.db import migrations, models
+
+from posts.text import normalize_title
+
+BATCH_SIZE = 1000
+
+
+def fill_title_normalized(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    groups = Group.objects.order_by('pk').only('title')
+    last_pk = 0
+    while True:
+        batch = list(groups.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            return
+        for group in batch:
+            group.title_normalized = normalize_title(group.title)
+        Group.objects.bulk_update(batch, ['title_normalized'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_archived_post'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='title_normalized',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200, verbose_name='Название для поиска'),
+        ),
+        migrations.RunPython(fill_title_normalized,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.16 on 2026-10-19 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_sharding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('author', 'Автор'), ('group', 'Группа')], max_length=10, verbose_name='Чья статистика')),
+                ('object_id', models.PositiveIntegerField(verbose_name='ID автора/группы')),
+                ('watermark', models.DateTimeField(blank=True, null=True, verbose_name='Учтены посты до')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Постов')),
+                ('days', models.TextField(default='{}', verbose_name='Посты по дням')),
+                ('hours', models.TextField(default='[]', verbose_name='Посты по часам')),
+            ],
+            options={
+                'verbose_name': 'Статистика активности',
+                'verbose_name_plural': 'Статистика активности',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='activitystats',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_activity_stats'),
+        ),
+    ]
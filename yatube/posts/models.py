@@ -1,7 +1,13 @@
+import zlib
+
 from django.contrib.auth import get_user_model
 from django.db import models
 from django.conf import settings
 
+from .images import image_storage, post_image_path, thumbnail_urls
+from .links import object_url
+from .text import RENDERED_FIELDS, normalize_title, render_text
+
 User = get_user_model()
 
 
@@ -9,9 +15,11 @@ class Post(models.Model):
     text = models.TextField(verbose_name='Текст поста')
     pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='Дата публикации')
+    # Пост может лежать в другой базе, чем автор и группа (см. sharding).
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        db_constraint=False,
         related_name='posts',
         verbose_name='Автор',
     )
@@ -19,22 +27,112 @@ class Post(models.Model):
         'Group',
         blank=True,
         null=True,
-        on_delete=settings.THIRTY,
+        on_delete=models.SET_NULL,
+        db_constraint=False,
         related_name='posts',
         verbose_name='Группа',
     )
+    image = models.ImageField(
+        upload_to=post_image_path,
+        storage=image_storage,
+        blank=True,
+        verbose_name='Картинка',
+    )
+    thumbnails_ready = models.BooleanField(default=False, editable=False)
+    excerpt = models.TextField(blank=True, editable=False,
+                               verbose_name='Начало текста')
+    excerpt_html = models.TextField(blank=True, editable=False)
+    is_truncated = models.BooleanField(default=False, editable=False)
+    text_html_br = models.TextField(blank=True, editable=False)
+
+    # Экземпляры, собранные из ArchivedPost, только для чтения.
+    is_archived = False
+
+    # Значения полей, прочитанные из базы: с ними сравнивают save()
+    # и post_purge_keys (прежняя группа).
+    _loaded_values = {}
+
+    # (текст, MinHash-подпись), посчитанные PostForm при проверке на
+    # повтор: index_post не считает подпись второй раз.
+    text_signature = None
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ('-pub_date', 'author',)
+        indexes = (
+            # Порядок лент и курсор «Показать ещё» (posts.utils.before_q).
+            models.Index(fields=('-pub_date', '-id'), name='post_feed_idx'),
+        )
 
     def __str__(self):
         return self.text[:settings.THIRTY]
 
+    def get_absolute_url(self):
+        return object_url('posts:post_detail', self.pk)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        post = super().from_db(db, field_names, values)
+        post._loaded_values = dict(zip(field_names, values))
+        return post
+
+    def image_changed(self):
+        # Новая картинка ещё не записана в хранилище.
+        if self.image and not self.image._committed:
+            return True
+        # Картинку убрали или заменили другой, уже загруженной.
+        return ('image' in self._loaded_values
+                and (self.image.name or '')
+                != (self._loaded_values['image'] or ''))
+
+    def save(self, *args, **kwargs):
+        # Старые превью к новой картинке не относятся, пока воркер
+        # не сделает новые; без картинки превью нет вовсе.
+        update_fields = kwargs.get('update_fields')
+        if self.image_changed():
+            self.thumbnails_ready = False
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields = {
+                    *update_fields, 'thumbnails_ready'}
+        if self.pk is None:
+            from .sharding import allocate_post_id, is_sharded, post_shards
+
+            # Id нового поста задаёт шард, в который он будет записан;
+            # база, запомненная при присвоении автора и группы, не важна.
+            if is_sharded():
+                self.pk = allocate_post_id(self.author_id)
+                kwargs.update(using=post_shards(self.pk)[0],
+                              force_insert=True)
+        if update_fields is None or 'text' in update_fields:
+            self.render_text()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, *RENDERED_FIELDS}
+        super().save(*args, **kwargs)
+        self._loaded_values = {**self._loaded_values,
+                               'image': self.image.name,
+                               'group_id': self.group_id,
+                               'pub_date': self.pub_date}
+
+    def render_text(self):
+        # HTML считается один раз при записи, а не при каждом показе.
+        for field, value in render_text(self.text).items():
+            setattr(self, field, value)
+
+    @property
+    def thumbnails(self):
+        return thumbnail_urls(self.image.name)
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200, verbose_name='Создание группы')
+    title_normalized = models.CharField(
+        max_length=200,
+        db_index=True,
+        editable=False,
+        default='',
+        verbose_name='Название для поиска',
+    )
     slug = models.SlugField(unique=True, verbose_name='Параметр')
     description = models.TextField(verbose_name='Описание')
 
@@ -44,3 +142,404 @@ class Group(models.Model):
 
     def __str__(self):
         return self.title
+
+    def get_absolute_url(self):
+        return object_url('posts:group_list', self.slug)
+
+    def save(self, *args, **kwargs):
+        self.title_normalized = normalize_title(self.title)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'title' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'title_normalized'}
+        super().save(*args, **kwargs)
+
+
+class Follow(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='follower',
+        verbose_name='Подписчик',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='following',
+        verbose_name='Автор',
+    )
+
+    class Meta:
+        verbose_name = 'Подписка'
+        verbose_name_plural = 'Подписки'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'author'),
+                name='unique_follow',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user} -> {self.author}'
+
+
+class TimelineEntry(models.Model):
+    """Пост в ленте подписчика, разложенный при публикации."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    # Записи удаляются вместе с постом сигналом post_delete
+    # (deletion.delete_post_references): пост может лежать в другой базе.
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='unique_timeline_entry',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date'),
+                name='timeline_user_date_idx',
+            ),
+        )
+
+
+class PullAuthor(models.Model):
+    """
+    Автор со слишком большим числом подписчиков: его посты не
+    раскладываются по лентам, а подмешиваются при чтении.
+    """
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+
+    class Meta:
+        verbose_name = 'Автор без раскладки'
+        verbose_name_plural = 'Авторы без раскладки'
+
+
+class TrendingEpoch(models.Model):
+    """Момент, относительно которого считаются все рейтинги."""
+    started = models.DateTimeField(verbose_name='Начало отсчёта')
+
+    class Meta:
+        verbose_name = 'Начало отсчёта рейтинга'
+        verbose_name_plural = 'Начало отсчёта рейтинга'
+
+
+class PostScore(models.Model):
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        primary_key=True,
+        related_name='trending_score',
+        verbose_name='Пост',
+    )
+    score = models.FloatField(default=0, db_index=True,
+                              verbose_name='Рейтинг')
+
+    class Meta:
+        verbose_name = 'Рейтинг поста'
+        verbose_name_plural = 'Рейтинги постов'
+
+
+class GroupScore(models.Model):
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending_score',
+        verbose_name='Группа',
+    )
+    score = models.FloatField(default=0, db_index=True,
+                              verbose_name='Рейтинг')
+
+    class Meta:
+        verbose_name = 'Рейтинг группы'
+        verbose_name_plural = 'Рейтинги групп'
+
+
+class ArchivedPost(models.Model):
+    """Старый пост, перенесённый из Post; текст хранится сжатым zlib."""
+    id = models.IntegerField(primary_key=True, verbose_name='ID поста')
+    text_z = models.BinaryField(verbose_name='Сжатый текст')
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_posts',
+        verbose_name='Автор',
+    )
+    group = models.ForeignKey(
+        Group,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='archived_posts',
+        verbose_name='Группа',
+    )
+    image = models.CharField(max_length=255, blank=True,
+                             verbose_name='Картинка')
+    thumbnails_ready = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = 'Пост из архива'
+        verbose_name_plural = 'Архив постов'
+        ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('-pub_date',), name='archive_date_idx'),
+            models.Index(fields=('author', '-pub_date'),
+                         name='archive_author_date_idx'),
+            models.Index(fields=('group', '-pub_date'),
+                         name='archive_group_date_idx'),
+        )
+
+    def __str__(self):
+        return self.text[:settings.THIRTY]
+
+    def get_absolute_url(self):
+        return object_url('posts:post_detail', self.pk)
+
+    @property
+    def text(self):
+        return zlib.decompress(self.text_z).decode()
+
+    @classmethod
+    def from_post(cls, post):
+        return cls(
+            id=post.pk,
+            text_z=zlib.compress(post.text.encode(),
+                                 settings.ARCHIVE_ZLIB_LEVEL),
+            pub_date=post.pub_date,
+            author_id=post.author_id,
+            group_id=post.group_id,
+            image=post.image.name,
+            thumbnails_ready=post.thumbnails_ready,
+        )
+
+    def to_post(self):
+        """Несохраняемый Post для шаблонов, которые рассчитаны на Post."""
+        post = Post(
+            id=self.id,
+            text=self.text,
+            pub_date=self.pub_date,
+            author_id=self.author_id,
+            group_id=self.group_id,
+            image=self.image,
+            thumbnails_ready=self.thumbnails_ready,
+        )
+        for field in ('author', 'group'):
+            if ArchivedPost._meta.get_field(field).is_cached(self):
+                setattr(post, field, getattr(self, field))
+        post.render_text()
+        post.is_archived = True
+        return post
+
+
+class AuthorShard(models.Model):
+    """
+    Шард автора, отличный от вычисленного по хэшу; moving_from задан,
+    пока rebalance_posts переносит посты автора.
+    """
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    shard = models.CharField(max_length=100, verbose_name='Шард')
+    moving_from = models.CharField(max_length=100, blank=True,
+                                   verbose_name='Переносится из шарда')
+
+    class Meta:
+        verbose_name = 'Шард автора'
+        verbose_name_plural = 'Шарды авторов'
+
+
+class PostSequence(models.Model):
+    """Счётчик для id постов; процессы берут из него блоки id."""
+    next = models.BigIntegerField(verbose_name='Следующий номер')
+
+    class Meta:
+        verbose_name = 'Счётчик id постов'
+        verbose_name_plural = 'Счётчик id постов'
+
+
+class ActivityStats(models.Model):
+    """
+    Накопленная статистика публикаций автора или группы. Учтены посты
+    с pub_date не позже watermark; обновление читает только более новые.
+    """
+    AUTHOR = 'author'
+    GROUP = 'group'
+    KIND_CHOICES = (
+        (AUTHOR, 'Автор'),
+        (GROUP, 'Группа'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES,
+                            verbose_name='Чья статистика')
+    object_id = models.PositiveIntegerField(verbose_name='ID автора/группы')
+    watermark = models.DateTimeField(null=True, blank=True,
+                                     verbose_name='Учтены посты до')
+    total = models.PositiveIntegerField(default=0, verbose_name='Постов')
+    # JSON: {"ГГГГ-ММ-ДД": число постов} и список из 24 чисел по часам
+    days = models.TextField(default='{}', verbose_name='Посты по дням')
+    hours = models.TextField(default='[]', verbose_name='Посты по часам')
+
+    class Meta:
+        verbose_name = 'Статистика активности'
+        verbose_name_plural = 'Статистика активности'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('kind', 'object_id'),
+                name='unique_activity_stats',
+            ),
+        )
+
+
+class RelatedPost(models.Model):
+    """Похожий пост: соседи по TF-IDF, посчитанные posts.related заранее."""
+    # Как и записи ленты, удаляются сигналом (deletion.delete_post_references).
+    # Отдельный индекс не нужен: post — начало индекса (post, -score).
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='related_entries',
+        verbose_name='Пост',
+    )
+    related = models.ForeignKey(
+        Post,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+',
+        verbose_name='Похожий пост',
+    )
+    score = models.FloatField(verbose_name='Близость')
+
+    class Meta:
+        verbose_name = 'Похожий пост'
+        verbose_name_plural = 'Похожие посты'
+        indexes = (
+            models.Index(
+                fields=('post', '-score'),
+                name='related_post_score_idx',
+            ),
+        )
+
+
+class PostSignature(models.Model):
+    """MinHash-подпись текста поста для поиска почти одинаковых."""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        primary_key=True,
+        related_name='signature',
+        verbose_name='Пост',
+    )
+    signature = models.BinaryField(verbose_name='Подпись')
+
+    class Meta:
+        verbose_name = 'Подпись поста'
+        verbose_name_plural = 'Подписи постов'
+
+
+class PostBucket(models.Model):
+    """Корзина LSH: посты с совпавшей полосой подписи (posts.duplicates)."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='buckets',
+        verbose_name='Пост',
+    )
+    bucket = models.BigIntegerField(db_index=True, verbose_name='Корзина')
+
+    class Meta:
+        verbose_name = 'Корзина поста'
+        verbose_name_plural = 'Корзины постов'
+
+
+class BulkJob(models.Model):
+    """Массовое действие из админки, выполняемое в фоне пачками."""
+    DELETE_POSTS = 'delete_posts'
+    MOVE_POSTS = 'move_posts'
+    MOVE_GROUP_POSTS = 'move_group_posts'
+    ACTION_CHOICES = (
+        (DELETE_POSTS, 'Удаление постов'),
+        (MOVE_POSTS, 'Перенос постов в группу'),
+        (MOVE_GROUP_POSTS, 'Перенос всех постов групп'),
+    )
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES,
+                              verbose_name='Действие')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=PENDING, verbose_name='Состояние')
+    # JSON: id выбранных постов или групп
+    selection = models.TextField(default='[]', verbose_name='Выбранные')
+    target_group = models.ForeignKey(
+        Group,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name='Новая группа',
+    )
+    total = models.PositiveIntegerField(default=0, verbose_name='Всего')
+    done = models.PositiveIntegerField(default=0, verbose_name='Обработано')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_by = models.ForeignKey(
+        User,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name='Запустил',
+    )
+    created = models.DateTimeField(auto_now_add=True,
+                                   verbose_name='Запущено')
+    finished = models.DateTimeField(null=True, blank=True,
+                                    verbose_name='Завершено')
+    # Отметка живого обработчика: обновляется после каждой пачки. Задачу
+    # с отметкой старше BULK_JOB_LEASE можно забрать другим процессом.
+    heartbeat = models.DateTimeField(null=True, blank=True,
+                                     verbose_name='Последняя пачка')
+
+    class Meta:
+        verbose_name = 'Фоновое действие'
+        verbose_name_plural = 'Фоновые действия'
+        ordering = ('-created',)
+
+    def __str__(self):
+        return f'{self.get_action_display()} №{self.pk}'
@@ -0,0 +1,127 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Версия групп в общем кэше: меняется при каждом изменении группы
+VERSION_KEY = 'group_registry:version'
+
+
+class GroupRegistry:
+    """
+    Кэш групп в памяти процесса.
+
+    Пока групп не больше GROUP_CACHE_MAX_SIZE, все они загружаются одним
+    запросом. Если групп больше, реестр хранит только последние
+    запрошенные (LRU).
+    Сбрасывается сигналами при сохранении и удалении группы: clear()
+    записывает новую версию в общий кэш, а реестры остальных процессов
+    сверяются с ней не реже раза в GROUP_CACHE_CHECK_INTERVAL секунд.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._version = None
+        self._checked_at = None
+        self._loaded = False
+        self._complete = False
+        self._by_slug = OrderedDict()
+        self._by_pk = {}
+
+    def _reset(self, version):
+        with self._lock:
+            self._generation += 1
+            self._version = version
+            self._checked_at = time.monotonic()
+            self._loaded = False
+            self._complete = False
+            self._by_slug.clear()
+            self._by_pk.clear()
+
+    def clear(self):
+        # Случайная, а не увеличенная версия: у кэша нет атомарного incr,
+        # и два одновременных сброса не должны дать одно и то же значение.
+        version = uuid.uuid4().hex
+        cache.set(VERSION_KEY, version, None)
+        self._reset(version)
+
+    def _check_version(self):
+        checked_at = self._checked_at
+        if checked_at is not None and (time.monotonic() - checked_at
+                                       < settings.GROUP_CACHE_CHECK_INTERVAL):
+            return
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            # Версию вытеснили из кэша: начинаем новую.
+            cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(VERSION_KEY)
+        with self._lock:
+            if version == self._version:
+                self._checked_at = time.monotonic()
+                return
+        self._reset(version)
+
+    def _ensure_loaded(self):
+        self._check_version()
+        if self._loaded:
+            return
+        from .models import Group
+
+        generation = self._generation
+        max_size = settings.GROUP_CACHE_MAX_SIZE
+        groups = list(Group.objects.order_by('pk')[:max_size + 1])
+        with self._lock:
+            if generation != self._generation:
+                # Пока шёл запрос, группу изменили: данные уже устарели.
+                return
+            self._by_slug.clear()
+            self._by_pk.clear()
+            self._complete = len(groups) <= max_size
+            if self._complete:
+                for group in groups:
+                    self._by_slug[group.slug] = group
+                    self._by_pk[group.pk] = group
+            self._loaded = True
+
+    def _remember(self, group):
+        with self._lock:
+            self._by_slug[group.slug] = group
+            self._by_pk[group.pk] = group
+            while len(self._by_slug) > settings.GROUP_CACHE_MAX_SIZE:
+                _, evicted = self._by_slug.popitem(last=False)
+                self._by_pk.pop(evicted.pk, None)
+
+    def _lookup(self, **lookup):
+        from .models import Group
+
+        group = Group.objects.filter(**lookup).first()
+        if group is not None:
+            self._remember(group)
+        return group
+
+    def get_by_slug(self, slug):
+        self._ensure_loaded()
+        with self._lock:
+            group = self._by_slug.get(slug)
+            if group is not None and not self._complete:
+                self._by_slug.move_to_end(slug)
+        if group is not None or self._complete:
+            return group
+        return self._lookup(slug=slug)
+
+    def get_by_pk(self, pk):
+        self._ensure_loaded()
+        group = self._by_pk.get(pk)
+        if group is not None or self._complete:
+            return group
+        return self._lookup(pk=pk)
+
+    def label(self, pk):
+        group = self.get_by_pk(pk)
+        return str(group) if group is not None else ''
+
+
+group_registry = GroupRegistry()
@@ -0,0 +1,408 @@
+"""
+Похожие посты: соседи по TF-IDF текста, посчитанные заранее.
+
+Индекс (build_related) — отдельный файл SQLite RELATED_INDEX_PATH: для
+каждого слова число постов с ним (df) и веса слова в векторах постов,
+а также число постов и отметка watermark. Векторы — разреженные словари
+{слово: вес}, вес — (1 + log tf) * idf, нормированный по длине вектора,
+поэтому близость — скалярное произведение. Оно считается через обратный
+индекс (слово -> посты с весами): складываются только общие слова, а не
+все пары постов. Служебные слова (STOP_WORDS) и слова, которые есть
+больше чем в доле RELATED_MAX_DF постов, не учитываются, а из списка
+постов по слову берутся только RELATED_POSTINGS_WALKED с наибольшим весом:
+так работа на пост ограничена и не растёт с числом постов. Для каждого
+поста в RelatedPost пишутся RELATED_POSTS_STORED ближайших соседей.
+
+Полная сборка (--full) пишет новый файл индекса рядом с прежним: первый
+проход по постам считает df, второй — веса, затем соседи считаются и
+заменяются в базе пачками по RELATED_BATCH_SIZE постов с чтением списков
+слов из нового индекса. В памяти — только df слов и одна пачка. В конце
+новый файл подменяет прежний целиком.
+
+Без --full обрабатываются только посты новее watermark (отметка отстаёт
+от текущего времени на RELATED_INDEX_LAG, как в stats), и из индекса
+читаются только их слова. Соседи новых постов — среди всех постов, а сами
+они попадают в списки соседей старых постов, если ближе их худшего
+соседа. Веса старых постов при этом не пересчитываются; удалённый пост
+уходит из индекса, когда попадается среди соседей. Правки текста и посты
+задним числом учитывает только полная сборка — её стоит время от времени
+запускать.
+
+Страница поста читает готовый список одним запросом по индексу
+(post, -score).
+"""
+import heapq
+import math
+import os
+import re
+import sqlite3
+import tempfile
+from collections import Counter, defaultdict
+from contextlib import closing
+from datetime import datetime
+from itertools import islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.surrogate import purger
+
+from .models import Post, RelatedPost
+from .sharding import is_sharded, posts_in_bulk
+
+WORD_RE = re.compile(r'[^\W\d_]{3,}')
+
+# Служебные слова есть почти в каждом посте: близости они не добавляют,
+# а списки постов по ним самые длинные.
+STOP_WORDS = frozenset((
+    'без', 'был', 'была', 'были', 'было', 'быть', 'вас', 'вот', 'все',
+    'всех', 'где', 'даже', 'для', 'его', 'ему', 'если', 'есть', 'еще',
+    'или', 'как', 'когда', 'кто', 'мне', 'меня', 'может', 'нас', 'над',
+    'нее', 'ней', 'нет', 'них', 'она', 'они', 'оно', 'очень', 'под',
+    'после', 'при', 'про', 'себя', 'так', 'там', 'тем', 'тоже', 'только',
+    'том', 'тот', 'тут', 'уже', 'чем', 'через', 'что', 'чтобы', 'эта',
+    'эти', 'это', 'этот',
+))
+
+SCHEMA = """
+    CREATE TABLE meta (key TEXT PRIMARY KEY, value);
+    CREATE TABLE words (word TEXT PRIMARY KEY, df INTEGER NOT NULL);
+    CREATE TABLE documents (post_id INTEGER PRIMARY KEY, words TEXT NOT NULL);
+    CREATE TABLE postings (word TEXT NOT NULL, post_id INTEGER NOT NULL,
+                           weight REAL NOT NULL);
+    CREATE INDEX postings_word ON postings (word, weight DESC);
+    CREATE INDEX postings_post ON postings (post_id);
+"""
+
+# Не больше параметров в одном запросе к SQLite.
+INDEX_BATCH_SIZE = 500
+
+# Посты с наибольшим весом из списков слов, не больше limit на слово.
+POSTINGS_SQL = """
+    SELECT word, post_id, weight FROM (
+        SELECT word, post_id, weight, ROW_NUMBER() OVER (
+            PARTITION BY word ORDER BY weight DESC) AS position
+        FROM postings WHERE word IN ({})
+    ) WHERE position <= ?
+"""
+
+
+def tokenize(text):
+    """
+    Число вхождений слов текста: без регистра, «ё», коротких и служебных
+    слов.
+    """
+    return Counter(word for word in
+                   WORD_RE.findall(text.casefold().replace('ё', 'е'))
+                   if word not in STOP_WORDS)
+
+
+def idf_weights(frequencies, total):
+    """idf слов по числу постов с ними; слишком частые слова отбрасываются."""
+    limit = settings.RELATED_MAX_DF * total
+    return {word: math.log((1 + total) / (1 + count)) + 1
+            for word, count in frequencies.items() if count <= limit}
+
+
+def weigh(words, idf):
+    """Нормированный TF-IDF вектор поста {слово: вес}."""
+    vector = {word: (1 + math.log(count)) * idf[word]
+              for word, count in words.items() if word in idf}
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {word: weight / norm for word, weight in vector.items()}
+
+
+def invert(vectors, postings=None):
+    """Обратный индекс {слово: [(id поста, вес), ...]}."""
+    if postings is None:
+        postings = defaultdict(list)
+    for post_id, vector in vectors.items():
+        for word, weight in vector.items():
+            postings[word].append((post_id, weight))
+    return postings
+
+
+def cap_postings(postings):
+    """Оставляет в списке слова RELATED_POSTINGS_WALKED самых весомых."""
+    limit = settings.RELATED_POSTINGS_WALKED
+    for word, found in postings.items():
+        if len(found) > limit:
+            postings[word] = heapq.nlargest(limit, found, key=itemgetter(1))
+    return postings
+
+
+def neighbours(post_id, vectors, postings, limit=None):
+    """Ближайшие посты [(близость, id), ...] от ближайшего."""
+    limit = limit or settings.RELATED_POSTS_STORED
+    scores = defaultdict(float)
+    for word, weight in vectors[post_id].items():
+        for other_id, other_weight in postings[word]:
+            scores[other_id] += weight * other_weight
+    scores.pop(post_id, None)
+    return heapq.nlargest(
+        limit,
+        ((score, other_id) for other_id, score in scores.items()
+         if score >= settings.RELATED_MIN_SCORE))
+
+
+def _batches(items, batch_size):
+    items = sorted(items)
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _execute_in(index, sql, values, *params):
+    """
+    Запрос к индексу с «IN ({})» для values по частям; строки ответа.
+    params подставляются после values.
+    """
+    for batch in _batches(values, INDEX_BATCH_SIZE):
+        yield from index.execute(
+            sql.format(', '.join('?' * len(batch))), [*batch, *params])
+
+
+def _read_postings(index, words):
+    """Списки слов из индекса, по RELATED_POSTINGS_WALKED постов на слово."""
+    postings = defaultdict(list)
+    for word, post_id, weight in _execute_in(
+            index, POSTINGS_SQL, words, settings.RELATED_POSTINGS_WALKED):
+        postings[word].append((post_id, weight))
+    return postings
+
+
+def _existing(post_ids, batch_size):
+    found = set()
+    for batch in _batches(post_ids, batch_size):
+        for alias in settings.POST_SHARDS:
+            found.update(Post.objects.using(alias).filter(pk__in=batch)
+                         .values_list('pk', flat=True))
+    return found
+
+
+def _write(lists, batch_size):
+    """Заменяет соседей постов: lists = {id поста: [(близость, id), ...]}."""
+    for batch in _batches(lists, batch_size):
+        with transaction.atomic():
+            RelatedPost.objects.filter(post_id__in=batch).delete()
+            RelatedPost.objects.bulk_create(
+                RelatedPost(post_id=post_id, related_id=related_id,
+                            score=score)
+                for post_id in batch
+                for score, related_id in lists[post_id])
+
+
+def _forget(post_ids, batch_size):
+    for batch in _batches(post_ids, batch_size):
+        RelatedPost.objects.filter(post_id__in=batch).delete()
+        RelatedPost.objects.filter(related_id__in=batch).delete()
+
+
+def _merge_into_old(lists, added, batch_size):
+    # Новые посты — кандидаты в соседи старых, у которых они нашлись.
+    candidates = defaultdict(list)
+    for post_id, found in lists.items():
+        for score, other_id in found:
+            if other_id not in added:
+                candidates[other_id].append((score, post_id))
+    existing = defaultdict(list)
+    for batch in _batches(candidates, batch_size):
+        rows = RelatedPost.objects.filter(post_id__in=batch).values_list(
+            'post_id', 'score', 'related_id')
+        for post_id, score, related_id in rows:
+            existing[post_id].append((score, related_id))
+    for post_id, found in candidates.items():
+        lists[post_id] = heapq.nlargest(
+            settings.RELATED_POSTS_STORED, existing[post_id] + found)
+
+
+def _add_documents(index, documents, vectors):
+    index.executemany(
+        'INSERT INTO documents VALUES (?, ?)',
+        ((post_id, ' '.join(words)) for post_id, words in documents.items()))
+    index.executemany(
+        'INSERT INTO postings VALUES (?, ?, ?)',
+        ((word, post_id, weight) for post_id, vector in vectors.items()
+         for word, weight in vector.items()))
+
+
+def _remove_documents(index, post_ids):
+    frequencies = Counter()
+    for (words,) in _execute_in(
+            index, 'SELECT words FROM documents WHERE post_id IN ({})',
+            post_ids):
+        frequencies.update(words.split())
+    index.executemany('UPDATE words SET df = df - ? WHERE word = ?',
+                      ((count, word) for word, count in frequencies.items()))
+    for batch in _batches(post_ids, INDEX_BATCH_SIZE):
+        placeholders = ', '.join('?' * len(batch))
+        for table in ('documents', 'postings'):
+            index.execute(
+                f'DELETE FROM {table} WHERE post_id IN ({placeholders})',
+                batch)
+    return len(post_ids)
+
+
+def _read_meta(index):
+    meta = dict(index.execute('SELECT key, value FROM meta'))
+    return meta['total'], datetime.fromisoformat(meta['watermark'])
+
+
+def _write_meta(index, total, watermark):
+    index.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                      (('total', total), ('watermark', watermark.isoformat())))
+
+
+def _index_posts(index, batch_size):
+    # Первый проход — df слов, второй — веса по готовым idf. Второй
+    # читает тексты тех же постов, что и первый.
+    frequencies = Counter()
+    post_ids = []
+    for alias in settings.POST_SHARDS:
+        rows = (Post.objects.using(alias).values_list('pk', 'text')
+                .iterator(chunk_size=batch_size))
+        for chunk in _chunks(rows, batch_size):
+            documents = {post_id: tokenize(text) for post_id, text in chunk}
+            frequencies.update(
+                word for words in documents.values() for word in words)
+            index.executemany(
+                'INSERT INTO documents VALUES (?, ?)',
+                ((post_id, ' '.join(words))
+                 for post_id, words in documents.items()))
+            post_ids.extend(documents)
+    index.executemany('INSERT INTO words VALUES (?, ?)', frequencies.items())
+    idf = idf_weights(frequencies, len(post_ids))
+    for batch in _batches(post_ids, batch_size):
+        for alias in settings.POST_SHARDS:
+            rows = (Post.objects.using(alias).filter(pk__in=batch)
+                    .values_list('pk', 'text'))
+            index.executemany(
+                'INSERT INTO postings VALUES (?, ?, ?)',
+                ((word, post_id, weight) for post_id, text in rows
+                 for word, weight in weigh(tokenize(text), idf).items()))
+    return post_ids
+
+
+def _build_full(batch_size):
+    watermark = timezone.now() - settings.RELATED_INDEX_LAG
+    # Новый индекс пишется рядом и подменяет прежний целиком.
+    directory = os.path.dirname(settings.RELATED_INDEX_PATH) or '.'
+    descriptor, path = tempfile.mkstemp(dir=directory)
+    os.close(descriptor)
+    with closing(sqlite3.connect(path)) as index:
+        index.executescript(SCHEMA)
+        post_ids = _index_posts(index, batch_size)
+        for batch in _batches(post_ids, batch_size):
+            vectors = defaultdict(dict)
+            for post_id, word, weight in _execute_in(
+                    index, 'SELECT post_id, word, weight FROM postings '
+                    'WHERE post_id IN ({})', batch):
+                vectors[post_id][word] = weight
+            postings = _read_postings(
+                index, {word for vector in vectors.values()
+                        for word in vector})
+            # В базе соседи меняются короткими транзакциями по пачке.
+            _write({post_id: neighbours(post_id, vectors, postings)
+                    for post_id in batch}, batch_size)
+        stored = set(RelatedPost.objects.values_list('post_id', flat=True)
+                     .distinct())
+        _forget(stored - set(post_ids), batch_size)
+        _write_meta(index, len(post_ids), watermark)
+        index.commit()
+    os.replace(path, settings.RELATED_INDEX_PATH)
+    # Страницы постов обновятся в прокси по истечении TTL.
+    return post_ids, set(), post_ids
+
+
+def _new_posts(index, since, watermark):
+    found = {}
+    for alias in settings.POST_SHARDS:
+        found.update(Post.objects.using(alias)
+                     .filter(pub_date__gt=since, pub_date__lte=watermark)
+                     .values_list('pk', 'text'))
+    # Полная сборка могла уже взять посты новее своей отметки.
+    for (post_id,) in _execute_in(
+            index, 'SELECT post_id FROM documents WHERE post_id IN ({})',
+            found):
+        del found[post_id]
+    return {post_id: tokenize(text) for post_id, text in found.items()}
+
+
+def _build_new(index, batch_size):
+    total, since = _read_meta(index)
+    watermark = timezone.now() - settings.RELATED_INDEX_LAG
+    added = _new_posts(index, since, watermark)
+    added_frequencies = Counter(
+        word for words in added.values() for word in words)
+    frequencies = added_frequencies + Counter(dict(_execute_in(
+        index, 'SELECT word, df FROM words WHERE word IN ({})',
+        added_frequencies)))
+    total += len(added)
+    idf = idf_weights(frequencies, total)
+    vectors = {post_id: weigh(words, idf) for post_id, words in added.items()}
+    postings = cap_postings(invert(vectors, _read_postings(index, idf)))
+    removed = set()
+    while True:
+        lists = {post_id: neighbours(post_id, vectors, postings)
+                 for post_id in added}
+        related = {other_id for found in lists.values()
+                   for _, other_id in found} - added.keys()
+        missing = related - _existing(related, batch_size)
+        if not missing:
+            break
+        # Удалённые посты (их ссылки уже убрал сигнал) — прочь из индекса.
+        removed |= missing
+        for word in postings:
+            postings[word] = [(post_id, weight)
+                              for post_id, weight in postings[word]
+                              if post_id not in missing]
+    _merge_into_old(lists, added, batch_size)
+    _write(lists, batch_size)
+    purger.purge([f'post-{post_id}' for post_id in lists])
+    total -= _remove_documents(index, removed)
+    index.executemany(
+        'INSERT INTO words VALUES (?, ?) '
+        'ON CONFLICT (word) DO UPDATE SET df = df + excluded.df',
+        added_frequencies.items())
+    _add_documents(index, added, vectors)
+    _write_meta(index, total, watermark)
+    index.commit()
+    return added, removed, lists
+
+
+def build_related(full=False, batch_size=None, stdout=None):
+    """Обновляет индекс и соседей постов; возвращает число новых постов."""
+    batch_size = batch_size or settings.RELATED_BATCH_SIZE
+    if full or not os.path.exists(settings.RELATED_INDEX_PATH):
+        added, removed, lists = _build_full(batch_size)
+    else:
+        with closing(sqlite3.connect(settings.RELATED_INDEX_PATH)) as index:
+            added, removed, lists = _build_new(index, batch_size)
+    if stdout is not None:
+        stdout.write(f'Новых постов: {len(added)}, удалённых: '
+                     f'{len(removed)}, обновлено списков: {len(lists)}')
+    return len(added)
+
+
+def related_posts(post, limit=None):
+    """Похожие посты для страницы поста, от самого близкого."""
+    limit = limit or settings.RELATED_POSTS_SHOWN
+    entries = RelatedPost.objects.filter(post_id=post.pk).order_by('-score')
+    if is_sharded():
+        post_ids = list(entries.values_list('related_id', flat=True)[:limit])
+        posts = posts_in_bulk(
+            post_ids, Post.objects.defer('text', 'text_html_br'))
+        return [posts[pk] for pk in post_ids if pk in posts]
+    entries = (entries.select_related('related__author', 'related__group')
+               .defer('related__text', 'related__text_html_br')[:limit])
+    return [entry.related for entry in entries]
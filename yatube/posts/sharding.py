@@ -0,0 +1,379 @@
+"""
+Шардирование постов по автору.
+
+Посты лежат в одной из баз POST_SHARDS, всё остальное — в default. Шард
+автора вычисляется по crc32 от его id, если AuthorShard не задаёт другой
+(после rebalance_posts). Id новых постов выдаются блоками из PostSequence
+и содержат номер шарда, в котором пост создан: id = n * SHARD_SLOTS +
+номер. Поэтому пост по id читается из одного шарда, а остальные
+проверяются, только если его там нет (автора перенесли).
+
+Ленты (index, group_posts) читаются из всех шардов и сливаются
+по (pub_date, id). Соединения (select_related) между базами невозможны:
+авторы и группы для постов из шардов подставляются отдельно.
+
+С одним шардом (по умолчанию) всё работает как без шардирования.
+"""
+import heapq
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import F, Max
+
+from .models import AuthorShard, Post, PostSequence, User
+from .registry import group_registry
+from .utils import before_q
+
+# Больше шардов, чем SHARD_SLOTS, не бывает: номер шарда — остаток id.
+SHARD_SLOTS = 64
+
+_block = [0, 0]
+_block_lock = threading.Lock()
+
+_local = threading.local()
+
+
+def _reset_after_fork():
+    # Блок id, взятый мастером до fork(), не должен достаться всем воркерам.
+    global _block_lock
+    _block[:] = [0, 0]
+    _block_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@contextmanager
+def moving_posts():
+    """
+    Внутри блока посты не удаляются, а переезжают между шардами:
+    сигналы post_delete не трогают ссылки на них и статистику.
+    """
+    previous = getattr(_local, 'moving', False)
+    _local.moving = True
+    try:
+        yield
+    finally:
+        _local.moving = previous
+
+
+def is_moving_posts():
+    return getattr(_local, 'moving', False)
+
+
+def is_sharded():
+    return len(settings.POST_SHARDS) > 1
+
+
+def hash_shard(author_id):
+    shards = settings.POST_SHARDS
+    return shards[zlib.crc32(str(author_id).encode()) % len(shards)]
+
+
+def author_shards(author_id):
+    """Шарды с постами автора: первый — куда пишутся новые."""
+    if not is_sharded():
+        return [settings.POST_SHARDS[0]]
+    placement = (AuthorShard.objects.filter(author_id=author_id)
+                 .values_list('shard', 'moving_from').first())
+    if placement is None:
+        return [hash_shard(author_id)]
+    shard, moving_from = placement
+    return [shard, moving_from] if moving_from else [shard]
+
+
+def post_shards(post_id):
+    """Шарды в порядке поиска поста: сначала тот, где он создан."""
+    shards = settings.POST_SHARDS
+    home = int(post_id) % SHARD_SLOTS
+    if home >= len(shards):
+        return list(shards)
+    return [shards[home],
+            *(shard for shard in shards if shard != shards[home])]
+
+
+def _first_free_number():
+    last_ids = (Post.objects.using(alias).aggregate(last=Max('pk'))['last']
+                for alias in settings.POST_SHARDS)
+    return max(filter(None, last_ids), default=0) // SHARD_SLOTS + 1
+
+
+def _reserve_block(size=None):
+    size = size or settings.POST_ID_BLOCK_SIZE
+    while True:
+        try:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                sequence = PostSequence.objects.filter(pk=1)
+                if not sequence.update(next=F('next') + size):
+                    PostSequence.objects.create(
+                        pk=1, next=_first_free_number() + size)
+                end = sequence.values_list('next', flat=True).get()
+            return [end - size, end]
+        except IntegrityError:
+            # Счётчик только что создал другой процесс.
+            continue
+
+
+def allocate_post_id(author_id):
+    """Id для нового поста автора в его текущем шарде."""
+    shard_index = settings.POST_SHARDS.index(author_shards(author_id)[0])
+    with _block_lock:
+        if _block[0] >= _block[1]:
+            _block[:] = _reserve_block()
+        number = _block[0]
+        _block[0] += 1
+    return number * SHARD_SLOTS + shard_index
+
+
+def assign_post_ids(posts):
+    """
+    Задаёт id постам, создаваемым через bulk_create, одним блоком из
+    счётчика. Возвращает {шард: посты}: каждый пост — в шарде автора.
+    """
+    start, _ = _reserve_block(len(posts))
+    shards = {}
+    by_shard = {}
+    for number, post in enumerate(posts, start):
+        if post.author_id not in shards:
+            shards[post.author_id] = author_shards(post.author_id)[0]
+        shard = shards[post.author_id]
+        post.pk = (number * SHARD_SLOTS
+                   + settings.POST_SHARDS.index(shard))
+        by_shard.setdefault(shard, []).append(post)
+    return by_shard
+
+
+def bulk_create_posts(posts):
+    """
+    bulk_create для постов: с шардами каждый пост пишется в шард автора
+    с id из счётчика, по транзакции на шард.
+    """
+    if not is_sharded():
+        with transaction.atomic():
+            return Post.objects.bulk_create(posts)
+    # Автоинкремент шарда выдал бы id, которые счётчик выдаст снова.
+    for shard, shard_posts in assign_post_ids(posts).items():
+        with transaction.atomic(using=shard):
+            Post.objects.using(shard).bulk_create(shard_posts)
+    return posts
+
+
+def find_post(post_id, queryset=None):
+    """Первая строка queryset с pk=post_id из шардов или None."""
+    if queryset is None:
+        queryset = Post.objects.all()
+    for alias in post_shards(post_id):
+        row = queryset.using(alias).filter(pk=post_id).first()
+        if row is not None:
+            return row
+    return None
+
+
+def attach_related(posts):
+    """Подставляет авторов и группы постам, прочитанным без соединений."""
+    authors = User.objects.in_bulk({post.author_id for post in posts})
+    for post in posts:
+        if post.author_id in authors:
+            post.author = authors[post.author_id]
+        if post.group_id is not None:
+            post.group = group_registry.get_by_pk(post.group_id)
+    return posts
+
+
+class ShardedQuerySet:
+    """
+    Один запрос к постам, выполненный во всех шардах, для Paginator:
+    count() — сумма по шардам, срез — слияние отсортированных ответов
+    шардов (k-way merge) по (pub_date, id) от новых к старым. Для среза
+    [start:stop] каждый шард отдаёт первые stop пар (pub_date, id), а
+    полные строки читаются только для постов среза.
+    """
+    def __init__(self, queryset, shards=None):
+        self.queryset = queryset.select_related(None).order_by(
+            '-pub_date', '-pk')
+        self.shards = shards or settings.POST_SHARDS
+        self._count = None
+
+    def before(self, pub_date, pk):
+        """Те же шарды, посты за (pub_date, pk) — для курсора ленты."""
+        return ShardedQuerySet(self.queryset.filter(before_q(pub_date, pk)),
+                               self.shards)
+
+    def count(self):
+        if self._count is None:
+            self._count = sum(self.queryset.using(alias).count()
+                              for alias in self.shards)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:self.count()])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = self.count() if index.stop is None else index.stop
+        if stop <= start:
+            return []
+        parts = [
+            [(pub_date, pk, alias) for pub_date, pk in
+             self.queryset.using(alias).values_list('pub_date', 'pk')[:stop]]
+            for alias in self.shards
+        ]
+        page = list(islice(heapq.merge(*parts, reverse=True), start, stop))
+        found = {}
+        for alias in {alias for _, _, alias in page}:
+            found.update(self.queryset.using(alias).in_bulk(
+                [pk for _, pk, row_alias in page if row_alias == alias]))
+        return attach_related([found[pk] for _, pk, _ in page if pk in found])
+
+
+def sharded(queryset, shards=None):
+    """QuerySet постов, читаемый из шардов; без шардирования — он сам."""
+    if not is_sharded():
+        return queryset
+    return ShardedQuerySet(queryset, shards)
+
+
+def posts_in_bulk(post_ids, queryset=None):
+    """Посты по списку id из их шардов: {id: post}."""
+    if queryset is None:
+        queryset = Post.objects.all()
+    if not is_sharded():
+        return queryset.in_bulk(post_ids)
+    found = {}
+    for alias in settings.POST_SHARDS:
+        missing = [pk for pk in post_ids if pk not in found]
+        if not missing:
+            break
+        found.update(queryset.select_related(None).using(alias)
+                     .in_bulk(missing))
+    attach_related(list(found.values()))
+    return found
+
+
+def move_author(author_id, target, batch_size=None, pause=0, progress=None):
+    """
+    Переносит посты автора в шард target, не останавливая запись.
+
+    Сначала AuthorShard отмечает перенос: новые посты сразу пишутся
+    в target, а профиль читается из обоих шардов. Затем посты переносятся
+    пачками. Транзакции на две базы не бывает, поэтому пачка сначала
+    записывается в target (копия от прерванного запуска заменяется),
+    и только когда все её посты там есть, удаляется из старого шарда.
+    Перед удалением строки пачки перечитываются под блокировкой: пост,
+    изменённый после копирования, остаётся в старом шарде и копируется
+    следующей пачкой заново, а копия удалённого за это время — удаляется.
+    Оборвавшийся на любом шаге перенос повторяется той же командой.
+    """
+    batch_size = batch_size or settings.POST_SHARD_MOVE_BATCH_SIZE
+    sources = [alias for alias in author_shards(author_id)
+               if alias != target]
+    if not sources:
+        return 0
+    AuthorShard.objects.update_or_create(
+        author_id=author_id,
+        defaults={'shard': target, 'moving_from': sources[0]})
+    moved = 0
+    for source in sources:
+        while True:
+            posts = list(Post.objects.using(source)
+                         .filter(author_id=author_id)
+                         .order_by('pk')[:batch_size])
+            if not posts:
+                break
+            pks = [post.pk for post in posts]
+            copied = {post.pk: _row(post) for post in posts}
+            copies = Post.objects.using(target).filter(pk__in=pks)
+            with transaction.atomic(using=target), moving_posts():
+                copies.delete()
+                Post.objects.using(target).bulk_create(posts)
+            if copies.count() != len(pks):
+                raise IntegrityError(
+                    f'Посты автора {author_id} не записались в {target}')
+            with transaction.atomic(using=source), moving_posts():
+                originals = (Post.objects.using(source).filter(pk__in=pks)
+                             .select_for_update())
+                current = {post.pk: _row(post) for post in originals}
+                unchanged = [pk for pk, row in current.items()
+                             if row == copied[pk]]
+                Post.objects.using(source).filter(pk__in=unchanged).delete()
+            gone = [pk for pk in pks if pk not in current]
+            if gone:
+                with transaction.atomic(using=target), moving_posts():
+                    Post.objects.using(target).filter(pk__in=gone).delete()
+            moved += len(unchanged)
+            if progress is not None:
+                progress(moved)
+            if pause:
+                time.sleep(pause)
+    if target == hash_shard(author_id):
+        AuthorShard.objects.filter(author_id=author_id).delete()
+    else:
+        AuthorShard.objects.filter(author_id=author_id).update(
+            moving_from='')
+    return moved
+
+
+def _row(post):
+    # Значения всех полей: по ним видно, что пост правили во время переноса.
+    return tuple(field.value_to_string(post)
+                 for field in Post._meta.concrete_fields)
+
+
+def plan_rebalance():
+    """{автор: шард} для авторов, чьи посты лежат не в их шарде."""
+    pinned = dict(AuthorShard.objects.values_list('author_id', 'shard'))
+    plan = {}
+    for alias in settings.POST_SHARDS:
+        author_ids = (Post.objects.using(alias).order_by()
+                      .values_list('author_id', flat=True).distinct())
+        for author_id in author_ids:
+            target = pinned.get(author_id) or hash_shard(author_id)
+            if target != alias:
+                plan[author_id] = target
+    return plan
+
+
+class PostShardRouter:
+    """Посты читаются и пишутся в свой шард, остальные модели — в default."""
+    def db_for_read(self, model, **hints):
+        if model is not Post:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if isinstance(instance, Post) and instance._state.db:
+            return instance._state.db
+        if isinstance(instance, User) and instance.pk is not None:
+            return author_shards(instance.pk)[0]
+        return settings.POST_SHARDS[0]
+
+    def db_for_write(self, model, **hints):
+        if model is not Post:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if isinstance(instance, Post):
+            if instance._state.db:
+                return instance._state.db
+            if instance.pk is not None:
+                return post_shards(instance.pk)[0]
+            return author_shards(instance.author_id)[0]
+        return self.db_for_read(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if isinstance(obj1, Post) or isinstance(obj2, Post):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS or db not in settings.POST_SHARDS:
+            return None
+        return app_label == 'posts' and model_name == 'post'
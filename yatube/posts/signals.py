@@ -0,0 +1,145 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.surrogate import purger
+from core.tasks import submit_on_commit
+
+from .archive import archive_counts
+from .deletion import delete_post_references, is_deleting_in_chunks
+from .duplicates import index_post
+from .images import generate_thumbnails
+from .models import ActivityStats, ArchivedPost, Group, Post, User
+from .registry import group_registry
+from .sharding import is_moving_posts
+from .stats import reset as reset_stats
+from .timeline import fan_out
+from .trending import record_post_created
+from .utils import (feed_cache, feed_scopes, group_purge_keys,
+                    post_purge_keys)
+
+
+@receiver(post_save, sender=Post)
+def schedule_thumbnails(sender, instance, raw=False, **kwargs):
+    if raw or not instance.image or instance.thumbnails_ready:
+        return
+    submit_on_commit(generate_thumbnails, instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def schedule_fan_out(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        submit_on_commit(fan_out, instance.pk)
+        submit_on_commit(record_post_created, instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def update_duplicate_index(sender, instance, raw=False, update_fields=None,
+                           **kwargs):
+    if raw or (update_fields is not None and 'text' not in update_fields):
+        return
+    # Сразу, а не в фоне: следующий такой же пост уже должен находиться.
+    index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def delete_references(sender, instance, **kwargs):
+    # Так же и при каскаде от автора, и при удалении из админки или shell.
+    # Удаление порциями (posts.deletion) удаляет ссылки само, на пачку,
+    # а при переносе между шардами (move_author) пост остаётся.
+    if not is_deleting_in_chunks() and not is_moving_posts():
+        delete_post_references([instance.pk])
+
+
+@receiver(pre_delete, sender=User)
+def delete_posts_in_shards(sender, instance, using, **kwargs):
+    # Каскад удаляет посты только из базы пользователя, из остальных
+    # шардов — здесь; ссылки на посты удалит delete_references.
+    for alias in settings.POST_SHARDS:
+        if alias != using:
+            Post.objects.using(alias).filter(author_id=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=Group)
+def detach_posts_in_shards(sender, instance, using, **kwargs):
+    # То же для SET_NULL у группы.
+    for alias in settings.POST_SHARDS:
+        if alias != using:
+            Post.objects.using(alias).filter(group_id=instance.pk).update(
+                group=None)
+
+
+@receiver(post_save, sender=Post)
+def reset_stats_of_changed_post(sender, instance, created, raw=False,
+                                **kwargs):
+    if raw or created:
+        return
+    pub_date = instance._loaded_values.get('pub_date', instance.pub_date)
+    group_id = instance._loaded_values.get('group_id', instance.group_id)
+    since = min(pub_date, instance.pub_date)
+    if pub_date != instance.pub_date:
+        reset_stats(ActivityStats.AUTHOR, [instance.author_id], since)
+    if pub_date != instance.pub_date or group_id != instance.group_id:
+        reset_stats(ActivityStats.GROUP,
+                    {group_id, instance.group_id} - {None}, since)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=ArchivedPost)
+def reset_stats_of_deleted_post(sender, instance, **kwargs):
+    if is_moving_posts():
+        return
+    reset_stats(ActivityStats.AUTHOR, [instance.author_id],
+                instance.pub_date)
+    if instance.group_id is not None:
+        reset_stats(ActivityStats.GROUP, [instance.group_id],
+                    instance.pub_date)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_registry(sender, **kwargs):
+    # До фиксации другие потоки загрузили бы в реестр прежние строки.
+    transaction.on_commit(group_registry.clear)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=ArchivedPost)
+@receiver(post_delete, sender=ArchivedPost)
+def invalidate_post_feeds(sender, instance, raw=False, **kwargs):
+    # Только ленты, где пост есть или был (прежняя группа).
+    if not raw:
+        loaded = getattr(instance, '_loaded_values', {})
+        feed_cache.invalidate(*feed_scopes(
+            instance.author_id, instance.group_id, loaded.get('group_id')))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_feed_cache(sender, raw=False, **kwargs):
+    # Название группы показано в карточках всех лент.
+    if not raw:
+        feed_cache.invalidate()
+
+
+@receiver(post_save, sender=ArchivedPost)
+@receiver(post_delete, sender=ArchivedPost)
+def invalidate_archive_counts(sender, raw=False, **kwargs):
+    if not raw:
+        archive_counts.invalidate()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def purge_post_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        submit_on_commit(purger.purge, post_purge_keys(instance))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def purge_group_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        submit_on_commit(purger.purge, group_purge_keys(instance))
@@ -0,0 +1,140 @@
+"""
+Статистика публикаций автора или группы: посты по дням и неделям,
+активные часы и серии дней подряд с постами.
+
+Посты не читаются построчно: база сама группирует pub_date по дню
+и часу (GROUP BY), в Python приходит не больше 24 строк на день.
+Результат хранится в ActivityStats вместе с отметкой watermark, и при
+обновлении группируются только посты новее неё. Отметка отстаёт от
+текущего времени на ACTIVITY_STATS_LAG, чтобы не пропустить пост,
+который получил pub_date раньше, а зафиксирован позже чтения.
+
+Счётчики только прибавляются, поэтому удаление поста, перенос в другую
+группу и смена pub_date уже учтённого поста сбрасывают статистику
+(reset): следующее обновление посчитает её заново (signals, posts.bulk).
+"""
+import datetime
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+
+from .models import ActivityStats, ArchivedPost, Post
+from .sharding import author_shards
+
+HOURS = 24
+
+
+def _sources(kind, object_id):
+    if kind == ActivityStats.AUTHOR:
+        lookups = {'author_id': object_id}
+        shards = author_shards(object_id)
+    else:
+        lookups = {'group_id': object_id}
+        shards = settings.POST_SHARDS
+    return [
+        *(Post.objects.using(alias).filter(**lookups) for alias in shards),
+        ArchivedPost.objects.filter(**lookups),
+    ]
+
+
+def _bin(queryset, days, hours):
+    rows = (queryset.order_by()
+            .annotate(day=TruncDate('pub_date'), hour=ExtractHour('pub_date'))
+            .values_list('day', 'hour')
+            .annotate(count=Count('pk')))
+    for day, hour, count in rows:
+        days[day.isoformat()] += count
+        hours[hour] += count
+
+
+def refresh(kind, object_id):
+    """Досчитывает статистику постами новее watermark и возвращает её."""
+    stats, _ = ActivityStats.objects.get_or_create(
+        kind=kind, object_id=object_id)
+    watermark = timezone.now() - settings.ACTIVITY_STATS_LAG
+    if stats.watermark is not None and stats.watermark >= watermark:
+        return stats
+    days = Counter(json.loads(stats.days))
+    hours = json.loads(stats.hours) or [0] * HOURS
+    for queryset in _sources(kind, object_id):
+        queryset = queryset.filter(pub_date__lte=watermark)
+        if stats.watermark is not None:
+            queryset = queryset.filter(pub_date__gt=stats.watermark)
+        _bin(queryset, days, hours)
+    values = {
+        'watermark': watermark,
+        'total': sum(hours),
+        'days': json.dumps(dict(sorted(days.items()))),
+        'hours': json.dumps(hours),
+    }
+    # Если параллельный запрос уже сдвинул отметку, берём его результат,
+    # иначе посты между отметками учлись бы дважды.
+    if ActivityStats.objects.filter(
+            pk=stats.pk, watermark=stats.watermark).update(**values):
+        for field, value in values.items():
+            setattr(stats, field, value)
+        return stats
+    return ActivityStats.objects.get(pk=stats.pk)
+
+
+def reset(kind, object_ids, since=None):
+    """
+    Сбрасывает статистику, в которой учтены посты с pub_date не раньше
+    since (без since — любую): refresh посчитает её заново.
+    """
+    stats = ActivityStats.objects.filter(kind=kind, object_id__in=object_ids)
+    if since is not None:
+        stats = stats.filter(watermark__gte=since)
+    # Параллельный refresh со старой отметкой свой результат не запишет.
+    stats.update(watermark=None, total=0, days='{}', hours='[]')
+
+
+def _streaks(dates, today):
+    longest = current = run = 0
+    previous = None
+    for date in dates:
+        run = run + 1 if previous == date - datetime.timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = date
+    if previous is not None and today - previous <= datetime.timedelta(
+            days=1):
+        current = run
+    return longest, current
+
+
+def summarize(stats, today=None):
+    """Данные для страницы статистики."""
+    today = today or timezone.localdate()
+    days = {datetime.date.fromisoformat(day): count
+            for day, count in json.loads(stats.days).items()}
+    hours = json.loads(stats.hours) or [0] * HOURS
+    per_day = [
+        (day, days.get(day, 0))
+        for day in (today - datetime.timedelta(days=offset)
+                    for offset in range(settings.ACTIVITY_STATS_DAYS))
+    ]
+    monday = today - datetime.timedelta(days=today.weekday())
+    weeks = Counter()
+    for day, count in days.items():
+        weeks[day - datetime.timedelta(days=day.weekday())] += count
+    per_week = [
+        (week, weeks.get(week, 0))
+        for week in (monday - datetime.timedelta(weeks=offset)
+                     for offset in range(settings.ACTIVITY_STATS_WEEKS))
+    ]
+    busiest = max(hours) or 1
+    longest, current = _streaks(sorted(days), today)
+    return {
+        'total': stats.total,
+        'per_day': per_day,
+        'per_week': per_week,
+        'hours': [(hour, count, round(count * 100 / busiest))
+                  for hour, count in enumerate(hours)],
+        'longest_streak': longest,
+        'current_streak': current,
+        'updated': stats.watermark,
+    }
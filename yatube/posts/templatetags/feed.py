@@ -0,0 +1,46 @@
+from django import template
+from django.template.base import token_kwargs
+from django.utils.safestring import mark_safe
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/post_cart.html'
+
+SEPARATOR = '<hr>'
+
+
+class FeedPostsNode(template.Node):
+    """
+    Карточки постов ленты за один проход: шаблон карточки загружается
+    один раз на список, контекст (параметры карточки) — один на список,
+    а не {% include %} с поиском шаблона и своим контекстом на пост.
+    """
+    def __init__(self, posts, options):
+        self.posts = posts
+        self.options = options
+
+    def render(self, context):
+        card = context.template.engine.get_template(CARD_TEMPLATE)
+        options = {name: value.resolve(context)
+                   for name, value in self.options.items()}
+        cards = []
+        with context.push(**options):
+            for post in self.posts.resolve(context):
+                context['post'] = post
+                cards.append(card.render(context))
+        return mark_safe(SEPARATOR.join(cards))
+
+
+@register.tag
+def feed_posts(parser, token):
+    """{% feed_posts page_obj group_link=True %}"""
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} ожидает список постов')
+    remaining = bits[2:]
+    options = token_kwargs(remaining, parser)
+    if remaining:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]}: непонятные аргументы {remaining}')
+    return FeedPostsNode(parser.compile_filter(bits[1]), options)
@@ -0,0 +1,10 @@
+from django import template
+
+from ..trending import trending_groups as get_trending_groups
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/trending_groups.html')
+def trending_groups():
+    return {'groups': get_trending_groups()}
@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ..archive import archive_counts, archive_posts, feed
+from ..models import ArchivedPost, Group, Post, User
+from ..registry import group_registry
+from ..sharding import sharded
+
+HOT_POSTS = 7
+COLD_POSTS = 5
+
+
+class ArchiveTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for number in range(HOT_POSTS + COLD_POSTS):
+            Post.objects.create(
+                text=f'Тестовый пост {number}',
+                author=cls.user,
+                group=cls.group,
+            )
+        old_date = timezone.now() - settings.ARCHIVE_AFTER - timedelta(days=1)
+        cls.cold_ids = list(
+            cls.user.posts.order_by('pk').values_list('pk', flat=True)
+            [:COLD_POSTS])
+        for offset, pk in enumerate(cls.cold_ids):
+            cls.user.posts.filter(pk=pk).update(
+                pub_date=old_date - timedelta(minutes=offset))
+
+    def setUp(self):
+        group_registry.clear()
+
+    def tearDown(self):
+        # Откат транзакции теста не сбрасывает память процесса.
+        archive_counts.clear_local()
+
+    def test_cold_count_cached(self):
+        """Размер архива считается заново, только когда архив изменился."""
+        archive_posts()
+        self.assertEqual(feed(sharded(Post.objects.all())).count(),
+                         HOT_POSTS + COLD_POSTS)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(feed(sharded(Post.objects.all())).count(),
+                             HOT_POSTS + COLD_POSTS)
+        self.assertFalse(any('posts_archivedpost' in query['sql']
+                             for query in queries))
+        ArchivedPost.objects.get(pk=self.cold_ids[0]).delete()
+        self.assertEqual(feed(sharded(Post.objects.all())).count(),
+                         HOT_POSTS + COLD_POSTS - 1)
+
+    def test_archive_moves_old_posts(self):
+        """Старые посты переносятся в архив со сжатым текстом."""
+        moved = archive_posts(batch_size=2)
+        self.assertEqual(moved, COLD_POSTS)
+        self.assertFalse(
+            self.user.posts.filter(pk__in=self.cold_ids).exists())
+        archived = ArchivedPost.objects.get(pk=self.cold_ids[0])
+        self.assertEqual(archived.text, 'Тестовый пост 0')
+        self.assertNotIn('Тестовый'.encode(), bytes(archived.text_z))
+
+    def test_archived_post_detail(self):
+        """Страница поста находит пост в архиве."""
+        archive_posts()
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.cold_ids[0],)))
+        self.assertEqual(response.context['post'].text, 'Тестовый пост 0')
+        self.assertTrue(response.context['post'].is_archived)
+
+    def test_feeds_continue_into_archive(self):
+        """Ленты продолжаются архивом за концом горячей части."""
+        archive_posts()
+        for name, args in (
+            ('posts:index', None),
+            ('posts:group_list', (self.group.slug,)),
+            ('posts:profile', (self.user.username,)),
+        ):
+            with self.subTest(name=name):
+                url = reverse(name, args=args)
+                first = self.client.get(url).context['page_obj']
+                second = self.client.get(url + '?page=2').context['page_obj']
+                self.assertEqual(first.paginator.count,
+                                 HOT_POSTS + COLD_POSTS)
+                ids = [post.pk for post in [*first, *second]]
+                self.assertEqual(ids[HOT_POSTS:], self.cold_ids)
+                self.assertEqual(len(set(ids)), HOT_POSTS + COLD_POSTS)
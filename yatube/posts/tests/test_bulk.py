@@ -0,0 +1,206 @@
+import json
+import zlib
+from datetime import timedelta
+from unittest import mock
+
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import bulk
+from ..bulk import run_job
+from ..models import (ActivityStats, ArchivedPost, AuthorShard, BulkJob,
+                      Group, Post, User)
+from ..registry import group_registry
+from ..stats import refresh
+
+POSTS_COUNT = 5
+CHUNK_SIZE = 2
+
+
+@override_settings(BACKGROUND_WORKERS=0, BULK_JOB_PAUSE=0,
+                   BULK_JOB_CHUNK_SIZE=CHUNK_SIZE,
+                   ACTIVITY_STATS_LAG=timedelta(0))
+class BulkJobTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.author = User.objects.create_user(username='author')
+        # Список постов в админке читает только шард default.
+        AuthorShard.objects.create(author=cls.author, shard=DEFAULT_DB_ALIAS)
+        cls.group = Group.objects.create(
+            title='Старая группа', slug='old', description='Описание')
+        cls.target = Group.objects.create(
+            title='Новая группа', slug='new', description='Описание')
+
+    def setUp(self):
+        group_registry.clear()
+        self.client.force_login(self.admin)
+        self.posts = [
+            Post.objects.create(text=f'Тестовый пост номер {number}',
+                                author=self.author, group=self.group)
+            for number in range(POSTS_COUNT)
+        ]
+
+    def run_action(self, model, action, pks, **data):
+        return self.client.post(
+            reverse(f'admin:posts_{model}_changelist'),
+            {'action': action, '_selected_action': pks, **data},
+            follow=True,
+        )
+
+    def test_move_selected_posts(self):
+        """Выбранные посты переносятся в группу, ход виден в BulkJob."""
+        pks = [post.pk for post in self.posts[:3]]
+        for group in (self.group, self.target):
+            refresh(ActivityStats.GROUP, group.pk)
+        response = self.run_action('post', 'move_posts_in_background', pks,
+                                   target_group=self.target.pk)
+        job = BulkJob.objects.get()
+        self.assertContains(
+            response, reverse('admin:posts_bulkjob_change', args=(job.pk,)))
+        self.assertEqual(job.status, BulkJob.DONE)
+        self.assertEqual((job.done, job.total), (3, 3))
+        self.assertEqual(
+            set(Post.objects.filter(group=self.target)
+                .values_list('pk', flat=True)), set(pks))
+        # Счётчики групп пересчитаны, а не остались от прежних групп.
+        self.assertEqual(
+            refresh(ActivityStats.GROUP, self.group.pk).total,
+            POSTS_COUNT - 3)
+        self.assertEqual(refresh(ActivityStats.GROUP, self.target.pk).total, 3)
+
+    def test_delete_selected_posts(self):
+        """Выбранные посты удаляются в фоне."""
+        pks = [post.pk for post in self.posts[:3]]
+        self.run_action('post', 'delete_posts_in_background', pks)
+        self.assertEqual(Post.objects.count(), POSTS_COUNT - 3)
+        self.assertEqual(BulkJob.objects.get().status, BulkJob.DONE)
+
+    def test_move_without_target_reports_error(self):
+        """Без группы или с неверной группой перенос не запускается."""
+        pks = [post.pk for post in self.posts[:3]]
+        for target in ('', 'not-a-pk', 10 ** 6):
+            with self.subTest(target=target):
+                response = self.run_action(
+                    'post', 'move_posts_in_background', pks,
+                    target_group=target)
+                self.assertEqual(response.status_code, 200)
+                levels = [message.level_tag
+                          for message in response.context['messages']]
+                # Неверный id отсеивает ещё форма действий админки.
+                self.assertIn(levels, (['error'], ['warning']))
+        self.assertFalse(BulkJob.objects.exists())
+        self.assertFalse(Post.objects.filter(group=None).exists())
+
+    def test_delete_purges_pages(self):
+        """Удаление сбрасывает в прокси страницы постов и ленты."""
+        post = self.posts[0]
+        with mock.patch.object(bulk, 'purger') as purger:
+            self.run_action('post', 'delete_posts_in_background', [post.pk])
+        keys = {key for call in purger.purge.call_args_list
+                for key in call.args[0]}
+        self.assertLessEqual(
+            {f'post-{post.pk}', 'feed-index', 'feed-follow',
+             'feed-trending', f'feed-group-{self.group.slug}',
+             f'feed-author-{self.author.pk}'}, keys)
+
+    def test_move_purges_source_pages(self):
+        """Перенос сбрасывает и ленты прежней группы и автора."""
+        post = self.posts[0]
+        with mock.patch.object(bulk, 'purger') as purger:
+            self.run_action('post', 'move_posts_in_background', [post.pk],
+                            target_group=self.target.pk)
+        keys = {key for call in purger.purge.call_args_list
+                for key in call.args[0]}
+        self.assertLessEqual(
+            {f'post-{post.pk}', 'feed-index', f'feed-group-{self.group.slug}',
+             f'feed-group-{self.target.slug}',
+             f'feed-author-{self.author.pk}'}, keys)
+
+    def test_no_delete_selected(self):
+        """Обычного удаления выбранных постов в админке нет."""
+        response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertNotContains(response, 'delete_selected')
+        self.assertContains(response, 'delete_posts_in_background')
+
+    def test_move_group_posts(self):
+        """Посты группы, включая архивные, переезжают по UPDATE на пачку."""
+        ArchivedPost.objects.create(
+            id=10 ** 6, text_z=zlib.compress('Архивный пост'.encode()),
+            pub_date=timezone.now(), author=self.author, group=self.group)
+        with CaptureQueriesContext(connection) as queries:
+            self.run_action('group', 'move_group_posts_in_background',
+                            [self.group.pk], target_group=self.target.pk)
+        updates = [query['sql'] for query in queries
+                   if query['sql'].startswith('UPDATE "posts_post"')]
+        # UPDATE на пачку по готовому списку id, без подзапроса с LIMIT.
+        self.assertEqual(len(updates), -(-POSTS_COUNT // CHUNK_SIZE))
+        self.assertFalse([sql for sql in updates if 'LIMIT' in sql])
+        self.assertFalse(Post.objects.filter(group=self.group).exists())
+        self.assertEqual(
+            ArchivedPost.objects.get().group_id, self.target.pk)
+        job = BulkJob.objects.get()
+        self.assertEqual((job.done, job.total), (POSTS_COUNT + 1,) * 2)
+
+    def test_resume_job(self):
+        """Прерванная задача продолжает с первой необработанной пачки."""
+        pks = [post.pk for post in self.posts]
+        job = BulkJob.objects.create(
+            action=BulkJob.MOVE_POSTS, selection=json.dumps(pks),
+            target_group=self.target, total=len(pks), done=CHUNK_SIZE,
+            status=BulkJob.FAILED)
+        run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.done), (BulkJob.DONE, POSTS_COUNT))
+        self.assertEqual(
+            set(Post.objects.filter(group=self.target)
+                .values_list('pk', flat=True)), set(pks[CHUNK_SIZE:]))
+
+    def test_running_job_claimed_once(self):
+        """Выполняемую задачу второй запуск не трогает, брошенную — берёт."""
+        pks = [post.pk for post in self.posts]
+        job = BulkJob.objects.create(
+            action=BulkJob.MOVE_POSTS, selection=json.dumps(pks),
+            target_group=self.target, total=len(pks),
+            status=BulkJob.RUNNING, heartbeat=timezone.now())
+        run_job(job.pk)
+        self.assertFalse(Post.objects.filter(group=self.target).exists())
+        BulkJob.objects.filter(pk=job.pk).update(
+            heartbeat=timezone.now() - timedelta(days=1))
+        run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.done), (BulkJob.DONE, POSTS_COUNT))
+
+    def test_lost_lease_stops_worker(self):
+        """Обработчик, у которого задачу забрали, останавливается."""
+        pks = [post.pk for post in self.posts]
+        job = BulkJob.objects.create(
+            action=BulkJob.MOVE_POSTS, selection=json.dumps(pks),
+            target_group=self.target, total=len(pks))
+
+        def take_over(pause):
+            # Пока этот обработчик «спал», задачу забрал другой.
+            BulkJob.objects.filter(pk=job.pk).update(
+                heartbeat=timezone.now() + timedelta(seconds=1))
+
+        with mock.patch.object(bulk.time, 'sleep', take_over):
+            run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.done),
+                         (BulkJob.RUNNING, CHUNK_SIZE))
+        self.assertEqual(Post.objects.filter(group=self.target).count(),
+                         2 * CHUNK_SIZE)
+
+    def test_progress_in_admin(self):
+        """Список фоновых действий показывает ход выполнения."""
+        BulkJob.objects.create(action=BulkJob.DELETE_POSTS, selection='[]',
+                               total=4, done=1)
+        response = self.client.get(reverse('admin:posts_bulkjob_changelist'))
+        self.assertContains(response, '1 из 4 (25%)')
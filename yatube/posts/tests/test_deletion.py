@@ -0,0 +1,121 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..deletion import delete_group, delete_posts, delete_user
+from ..duplicates import index_post
+from ..models import (Follow, Group, Post, PostBucket, PostScore,
+                      PostSignature, TimelineEntry, User)
+from ..registry import group_registry
+from ..timeline import follow
+
+POSTS_COUNT = 5
+
+
+@override_settings(BACKGROUND_WORKERS=0)
+class ChunkedDeletionTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        group_registry.clear()
+        follow(self.reader, self.author)
+        for number in range(POSTS_COUNT):
+            Post.objects.create(
+                text=f'Тестовый пост {number}',
+                author=self.author,
+                group=self.group,
+            )
+
+    def test_delete_user(self):
+        """Пользователь удаляется вместе с постами, лентами и подписками."""
+        stages = []
+        delete_user(
+            User.objects.get(pk=self.author.pk),
+            chunk_size=2,
+            progress=lambda stage, done, total: stages.append(
+                (stage, done, total)),
+        )
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(self.author.posts.exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertIn(('Посты', 2, POSTS_COUNT), stages)
+        self.assertIn(('Посты', POSTS_COUNT, POSTS_COUNT), stages)
+
+    def test_references_deleted_once_per_chunk(self):
+        """Ссылки на посты удаляются одним запросом на пачку."""
+        with CaptureQueriesContext(connection) as queries:
+            delete_posts(self.author.posts.all(), chunk_size=2,
+                         progress=lambda *args: None)
+        deletes = [query['sql'] for query in queries
+                   if query['sql'].startswith('DELETE FROM "posts_postscore"')]
+        self.assertEqual(len(deletes), -(-POSTS_COUNT // 2))
+        self.assertFalse(self.author.posts.exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_delete_group(self):
+        """Посты группы остаются, но отвязываются от неё."""
+        delete_group(Group.objects.get(pk=self.group.pk), chunk_size=2,
+                     progress=lambda *args: None)
+        self.assertFalse(Group.objects.filter(pk=self.group.pk).exists())
+        self.assertEqual(
+            self.author.posts.filter(group__isnull=True).count(), POSTS_COUNT)
+
+    def test_command(self):
+        """Команда удаляет группу по slug."""
+        out = StringIO()
+        call_command('delete_chunked', '--group', self.group.slug,
+                     '--chunk-size', '3', stdout=out)
+        self.assertFalse(Group.objects.filter(pk=self.group.pk).exists())
+        self.assertIn('Посты группы: 3 из 5', out.getvalue())
+
+    def test_cascade_deletes_references(self):
+        """Обычное удаление автора удаляет и ссылки на его посты."""
+        with override_settings(DUPLICATE_MIN_LENGTH=0):
+            for post in self.author.posts.all():
+                index_post(post)
+        models = (TimelineEntry, PostScore, PostSignature, PostBucket)
+        for model in models:
+            self.assertTrue(model.objects.exists())
+        User.objects.get(pk=self.author.pk).delete()
+        for model in models:
+            with self.subTest(model=model.__name__):
+                self.assertFalse(model.objects.exists())
+
+    def test_admin_deletes_in_chunks(self):
+        """Админка удаляет пользователей и группы только порциями."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        for changelist in ('admin:auth_user_changelist',
+                           'admin:posts_group_changelist'):
+            with self.subTest(changelist=changelist):
+                response = self.client.get(reverse(changelist))
+                actions = dict(response.context['action_form']
+                               .fields['action'].choices)
+                self.assertNotIn('delete_selected', actions)
+        url = reverse('admin:auth_user_delete', args=(self.author.pk,))
+        # Подтверждение показывает только число связанных строк.
+        response = self.client.get(url)
+        self.assertEqual(response.context['deleted_objects'],
+                         [str(self.author)])
+        self.assertIn(('Посты', POSTS_COUNT), response.context['model_count'])
+        self.client.post(url, {'post': 'yes'})
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(self.author.posts.exists())
+        self.assertFalse(TimelineEntry.objects.exists())
@@ -0,0 +1,126 @@
+from contextlib import ExitStack
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..duplicates import (bucket_keys, find_duplicate, pack, signature,
+                          similarity)
+from ..models import Post, PostBucket, PostSignature, User
+from ..sharding import is_sharded, sharded
+
+TEXT = ('Только сегодня скидки на все товары нашего магазина, '
+        'переходите по ссылке и получите подарок к каждому заказу')
+
+
+class SignatureTest(SimpleTestCase):
+    def test_similarity_estimate(self):
+        """Оценка сходства высокая для правок, низкая для другого текста."""
+        values = signature(TEXT)
+        self.assertEqual(
+            similarity(values, signature(TEXT.upper() + '!!!')), 1)
+        self.assertGreaterEqual(
+            similarity(values, signature(TEXT + ' и бонусы')), 0.8)
+        other = ('Сегодня гуляли в парке с собакой, погода была '
+                 'чудесная, а вечером пили чай на веранде')
+        self.assertLess(similarity(values, signature(other)), 0.2)
+
+    def test_short_text_skipped(self):
+        """Короткие тексты не подписываются и не проверяются."""
+        self.assertIsNone(signature('Привет!'))
+
+    def test_text_without_words_skipped(self):
+        """Текст из одних знаков и эмодзи не подписывается."""
+        self.assertIsNone(signature('!' * 100))
+        self.assertIsNone(signature('🙂 ' * 50))
+
+    def test_long_text_signed_by_sample(self):
+        """У длинного текста подписывается выборка шинглов."""
+        words = [f'слово{number}' for number in range(20000)]
+        values = signature(' '.join(words))
+        edited = signature(' '.join(words[:-100]))
+        self.assertGreaterEqual(similarity(values, edited), 0.9)
+
+
+class DuplicatePostsTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.spammer = User.objects.create_user(username='spammer')
+        cls.post = Post.objects.create(text=TEXT, author=cls.user)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.spammer)
+
+    def test_duplicate_rejected(self):
+        """Почти такой же текст другого автора не публикуется."""
+        response = self.client.post(reverse('posts:create'), {
+            'text': 'ТОЛЬКО СЕГОДНЯ ' + TEXT[15:] + '!'})
+        self.assertFormError(response, 'form', 'text',
+                             'Почти такой же пост уже опубликован')
+        self.assertEqual(sharded(Post.objects.all()).count(), 1)
+
+    def test_short_and_own_posts_allowed(self):
+        """Короткие повторы и правка своего поста проходят."""
+        Post.objects.create(text='Привет!', author=self.user)
+        self.client.post(reverse('posts:create'), {'text': 'Привет!'})
+        self.assertEqual(
+            sharded(Post.objects.filter(text='Привет!')).count(), 2)
+        owner = Client()
+        owner.force_login(self.user)
+        owner.post(reverse('posts:post_edit', args=(self.post.pk,)), {
+            'text': TEXT + ' и бонусы'})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, TEXT + ' и бонусы')
+
+    def test_form_signature_reused_on_save(self):
+        """Подпись, посчитанная формой, при сохранении не считается снова."""
+        signed = mock.Mock(wraps=signature)
+        with mock.patch('posts.forms.signature', signed):
+            with mock.patch('posts.duplicates.signature', signed):
+                self.client.post(reverse('posts:create'), {
+                    'text': 'Совсем другой текст: ' + TEXT[::-1]})
+        self.assertEqual(signed.call_count, 1)
+        self.assertTrue(PostSignature.objects.filter(
+            post_id=self.spammer.posts.get().pk).exists())
+
+    def test_lookup_is_single_query(self):
+        """Проверка текста — один запрос к индексу корзин."""
+        with ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in settings.POST_SHARDS]
+            self.assertEqual(find_duplicate(TEXT), self.post.pk)
+        # С шардами пост проверяется отдельным запросом к его шарду.
+        self.assertEqual(sum(len(queries) for queries in captured),
+                         2 if is_sharded() else 1)
+
+    def test_text_of_deleted_post_allowed(self):
+        """Текст удалённого поста можно опубликовать снова."""
+        # Подпись, оставшаяся от поста, удалённого в обход сигналов.
+        values = signature(TEXT)
+        PostSignature.objects.create(post_id=10 ** 6, signature=pack(values))
+        PostBucket.objects.bulk_create(
+            PostBucket(post_id=10 ** 6, bucket=key)
+            for key in bucket_keys(values))
+        self.user.posts.filter(pk=self.post.pk).delete()
+        self.assertIsNone(find_duplicate(TEXT))
+        self.client.post(reverse('posts:create'), {'text': TEXT})
+        self.assertTrue(self.spammer.posts.filter(text=TEXT).exists())
+
+    def test_index_command(self):
+        """Команда подписывает посты, опубликованные до индекса."""
+        PostSignature.objects.all().delete()
+        PostBucket.objects.all().delete()
+        self.assertIsNone(find_duplicate(TEXT))
+        call_command('index_duplicates', stdout=StringIO())
+        self.assertEqual(find_duplicate(TEXT), self.post.pk)
@@ -1,12 +1,32 @@
+import shutil
+import tempfile
 from http import HTTPStatus
 
-from django.test import Client, TestCase
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
+from ..forms import PostForm
+from ..images import image_storage, thumbnail_name
 from ..models import Group, Post, User
+from ..registry import group_registry
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 class PostFormTest(TestCase):
+    databases = '__all__'
+
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -23,12 +43,13 @@ class PostFormTest(TestCase):
         )
 
     def setUp(self):
+        group_registry.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
     def test_create_post_by_user(self):
         """Работа формы зарегистрирванного пользователя."""
-        posts_count = Post.objects.count()
+        posts_count = self.user.posts.count()
         self.assertEqual(posts_count, 1)
         form_data = {
             'text': 'Какой-то текст',
@@ -44,8 +65,8 @@ class PostFormTest(TestCase):
             response.status_code, HTTPStatus.OK)
 
         self.assertEqual(
-            Post.objects.count(), posts_count + 1)
-        post = Post.objects.first()
+            self.user.posts.count(), posts_count + 1)
+        post = self.user.posts.first()
         self.assertEqual(post.author, self.user)
         self.assertEqual(post.group.id, form_data['group'])
         self.assertEqual(post.text, form_data['text'])
@@ -53,17 +74,17 @@ class PostFormTest(TestCase):
     def test_create_post_by_guest(self):
         """Работа формы незарегистрированного пользователя."""
 
-        posts_count = Post.objects.count()
+        posts_count = self.user.posts.count()
         post_text_form = {'text': 'Не текст'}
         response = self.client.post(
             reverse('posts:create'), data=post_text_form, follow=True)
 
         self.assertFalse(
-            Post.objects.filter(text='Не текст').exists())
+            self.user.posts.filter(text='Не текст').exists())
         self.assertEqual(
             response.status_code, HTTPStatus.OK)
         self.assertEqual(
-            Post.objects.count(), posts_count)
+            self.user.posts.count(), posts_count)
 
     def test_post_edit_author(self):
         """Изменение поста зарегистрированным пользователем."""
@@ -72,7 +93,7 @@ class PostFormTest(TestCase):
             slug='new-group',
             description='описание группы' * 5,
         )
-        posts_count = Post.objects.count()
+        posts_count = self.user.posts.count()
         form_data = {
             'text': 'тестовый текст',
             'group': group_new.id,
@@ -82,13 +103,13 @@ class PostFormTest(TestCase):
                     kwargs={'post_id': self.create_post.id}),
             data=form_data)
 
-        edit_post = Post.objects.first()
+        edit_post = self.user.posts.first()
 
         self.assertEqual(response.status_code, 302)
         self.assertEqual(self.user, edit_post.author)
         self.assertEqual(edit_post.text, form_data['text'])
         self.assertEqual(edit_post.group.pk, form_data['group'])
-        self.assertEqual(Post.objects.count(), posts_count)
+        self.assertEqual(self.user.posts.count(), posts_count)
 
     def test_post_edit_guest(self):
         """Изменение поста не зарегистрированным пользователем."""
@@ -105,11 +126,138 @@ class PostFormTest(TestCase):
             reverse('posts:post_edit',
                     kwargs={'post_id': self.create_post.id}),
             data=form_data)
-        edit_post = Post.objects.first()
-        self.assertFalse(Post.objects.filter(
+        edit_post = self.user.posts.first()
+        self.assertFalse(self.user.posts.filter(
             text='Уникальный проверочный текст',
             group=self.group).exists())
 
         self.assertEqual(response.status_code, 302)
         self.assertNotEqual(edit_post.text, form_data['text'])
         self.assertNotEqual(edit_post.group.pk, form_data['group'])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, BACKGROUND_WORKERS=0)
+class PostImageFormTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='HasImage')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create_post(self, text):
+        uploaded = SimpleUploadedFile(
+            name='small.gif', content=SMALL_GIF, content_type='image/gif')
+        self.authorized_client.post(
+            reverse('posts:create'),
+            data={'text': text, 'image': uploaded},
+        )
+        return self.user.posts.get(text=text)
+
+    def test_create_post_with_image(self):
+        """Картинка сохраняется по адресу, зависящему от содержимого."""
+        first = self.create_post('Пост с картинкой')
+        second = self.create_post('Та же картинка ещё раз')
+        self.assertTrue(first.image.name.startswith('posts/'))
+        self.assertEqual(first.image.name, second.image.name)
+
+    def test_thumbnails_generated(self):
+        """Воркер готовит все размеры превью и отмечает пост."""
+        post = self.create_post('Пост для превью')
+        self.assertTrue(post.thumbnails_ready)
+        for size_name in settings.POST_THUMBNAIL_SIZES:
+            with self.subTest(size_name=size_name):
+                self.assertTrue(image_storage.exists(
+                    thumbnail_name(post.image.name, size_name)))
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, post.thumbnails['card'])
+
+    def test_clear_image(self):
+        """Без картинки флаг превью сбрасывается, превью не выводится."""
+        post = self.create_post('Пост без картинки после правки')
+        thumbnail = post.thumbnails['card']
+        self.authorized_client.post(
+            reverse('posts:post_edit', args=(post.pk,)),
+            data={'text': post.text, 'image-clear': 'on'},
+        )
+        post.refresh_from_db()
+        self.assertFalse(post.image)
+        self.assertFalse(post.thumbnails_ready)
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, thumbnail)
+        self.assertNotContains(response, 'card-img')
+
+
+@override_settings(GROUP_LOOKUP_PAGE_SIZE=2)
+class GroupLookupTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.groups = [
+            Group.objects.create(title=title, slug=slug,
+                                 description='Тестовое описание')
+            for title, slug in (
+                ('Ёжики  в тумане', 'hedgehogs'),
+                ('Ежевика', 'blackberry'),
+                ('Ежедневник', 'diary'),
+                ('Котики', 'cats'),
+            )
+        ]
+
+    def setUp(self):
+        group_registry.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def lookup(self, **params):
+        return self.authorized_client.get(
+            reverse('posts:group_lookup'), params).json()
+
+    def test_prefix_search(self):
+        """Поиск по началу названия без учёта регистра и «ё» или по slug."""
+        cases = (
+            ({'q': 'ёжики в'}, ['Ёжики  в тумане'], False),
+            ({'q': 'ЕЖ'}, ['Ежевика', 'Ежедневник'], True),
+            ({'q': 'еж', 'page': 2}, ['Ёжики  в тумане'], False),
+            ({'q': 'cat'}, ['Котики'], False),
+            ({'q': 'тума'}, [], False),
+        )
+        for params, titles, more in cases:
+            with self.subTest(params=params):
+                data = self.lookup(**params)
+                self.assertEqual(
+                    [group['text'] for group in data['results']], titles)
+                self.assertEqual(data['more'], more)
+
+    def test_lookup_requires_login(self):
+        """Поиск групп доступен только авторизованным."""
+        response = self.client.get(reverse('posts:group_lookup'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    def test_form_renders_selected_group_only(self):
+        """В форму попадает только выбранная группа, проверка — по pk."""
+        post = Post.objects.create(
+            text='Тестовый текст', author=self.user, group=self.groups[3])
+        response = self.authorized_client.get(
+            reverse('posts:post_edit', args=(post.pk,)))
+        self.assertContains(response, 'Котики')
+        self.assertNotContains(response, 'Ежевика')
+        self.assertContains(response, reverse('posts:group_lookup'))
+        form = PostForm(data={'text': 'Текст', 'group': self.groups[1].pk})
+        # Выборка по pk в поле формы и проверка ForeignKey в модели.
+        with self.assertNumQueries(2):
+            self.assertTrue(form.is_valid())
+        form = PostForm(data={'text': 'Текст', 'group': 10 ** 6})
+        self.assertFalse(form.is_valid())
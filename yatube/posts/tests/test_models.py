@@ -1,10 +1,17 @@
-from django.test import TestCase
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.conf import settings
 
 from ..models import Group, Post, User
+from ..registry import group_registry
+from ..sharding import bulk_create_posts
 
 
 class PostModelTest(TestCase):
+    databases = '__all__'
+
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -19,9 +26,42 @@ class PostModelTest(TestCase):
             text='Тестовый пост, который должен быть больше тридцати символов',
         )
 
+    def setUp(self):
+        group_registry.clear()
+
     def test_models_have_correct_object_names(self):
         """Проверяем, что у моделей корректно работает __str__."""
         post = PostModelTest.post
         group = PostModelTest.group
         self.assertEqual(post.text[:settings.THIRTY], post.__str__())
         self.assertEqual(group.title, group.__str__())
+
+    def test_rendered_text_stored_on_save(self):
+        """HTML текста сохраняется при записи поста."""
+        post = Post.objects.create(
+            author=self.user, text='Первая строка\nвторая <b>строка</b>')
+        self.assertEqual(
+            post.excerpt_html,
+            '<p>Первая строка<br>вторая &lt;b&gt;строка&lt;/b&gt;</p>')
+        self.assertFalse(post.is_truncated)
+        self.assertEqual(
+            post.text_html_br,
+            'Первая строка<br>вторая &lt;b&gt;строка&lt;/b&gt;')
+        post.text = 'Новый текст'
+        post.save(update_fields=('text',))
+        post.refresh_from_db()
+        self.assertEqual(post.excerpt_html, '<p>Новый текст</p>')
+
+    def test_render_posts_command(self):
+        """Команда заполняет HTML у постов, записанных в обход save()."""
+        bulk_create_posts(
+            [Post(author=self.user, text=f'Пост {i}') for i in range(3)])
+        call_command('render_posts', batch_size=2, stdout=StringIO())
+        self.assertFalse(self.user.posts.filter(excerpt_html='').exists())
+
+    @override_settings(POST_EXCERPT_LENGTH=20)
+    def test_long_text_excerpt(self):
+        """Для длинного текста хранится только начало."""
+        post = Post.objects.create(author=self.user, text='слово ' * 100)
+        self.assertTrue(post.is_truncated)
+        self.assertEqual(len(post.excerpt), 20)
@@ -0,0 +1,98 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from ..forms import PostForm
+from ..models import Group
+from ..registry import VERSION_KEY, group_registry
+
+
+class GroupRegistryTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+
+    def setUp(self):
+        group_registry.clear()
+
+    @override_settings(GROUP_CACHE_CHECK_INTERVAL=60)
+    def test_lookups_served_from_memory(self):
+        """После загрузки группы отдаются без запросов к базе."""
+        group_registry.get_by_slug(self.group.slug)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                group_registry.get_by_slug(self.group.slug), self.group)
+            self.assertEqual(
+                group_registry.label(self.other_group.pk),
+                str(self.other_group))
+            self.assertIsNone(group_registry.get_by_slug('missing'))
+            field = str(PostForm(initial={'group': self.group.pk})['group'])
+            self.assertIn(self.group.title, field)
+
+    def commit(self, func, *args):
+        """Вызывает func и затем колбэки on_commit, как при фиксации."""
+        with mock.patch.object(transaction, 'on_commit') as on_commit:
+            func(*args)
+        for call in on_commit.call_args_list:
+            call[0][0]()
+        return on_commit
+
+    @override_settings(GROUP_CACHE_CHECK_INTERVAL=60)
+    def test_invalidated_on_save_and_delete(self):
+        """Сохранение и удаление группы сбрасывают реестр после фиксации."""
+        group = group_registry.get_by_slug(self.group.slug)
+        group.title = 'Новое название'
+        on_commit = self.commit(group.save)
+        on_commit.assert_any_call(group_registry.clear)
+        self.assertEqual(
+            group_registry.label(self.group.pk), 'Новое название')
+        self.commit(Group.objects.get(pk=self.other_group.pk).delete)
+        self.assertIsNone(group_registry.get_by_slug('other-slug'))
+
+    @override_settings(GROUP_CACHE_CHECK_INTERVAL=60)
+    def test_not_invalidated_before_commit(self):
+        """До фиксации транзакции реестр отдаёт прежнюю группу."""
+        group_registry.get_by_slug(self.group.slug)
+        with mock.patch.object(transaction, 'on_commit'):
+            group = Group.objects.get(pk=self.group.pk)
+            group.title = 'Новое название'
+            group.save()
+            with self.assertNumQueries(0):
+                self.assertEqual(
+                    group_registry.label(self.group.pk), self.group.title)
+
+    @override_settings(GROUP_CACHE_CHECK_INTERVAL=0)
+    def test_invalidated_by_other_process(self):
+        """Реестр сбрасывается, когда группу изменил другой процесс."""
+        self.assertEqual(
+            group_registry.label(self.group.pk), self.group.title)
+        # Другой процесс меняет группу и записывает новую версию.
+        Group.objects.filter(pk=self.group.pk).update(title='Из воркера')
+        cache.set(VERSION_KEY, 'other-process', None)
+        self.assertEqual(group_registry.label(self.group.pk), 'Из воркера')
+
+    @override_settings(GROUP_CACHE_CHECK_INTERVAL=60, GROUP_CACHE_MAX_SIZE=1)
+    def test_size_cap(self):
+        """При превышении лимита реестр работает как LRU."""
+        self.assertEqual(
+            group_registry.get_by_slug(self.group.slug), self.group)
+        self.assertEqual(
+            group_registry.get_by_slug('other-slug'), self.other_group)
+        with self.assertNumQueries(0):
+            group_registry.get_by_slug('other-slug')
+        with self.assertNumQueries(1):
+            group_registry.get_by_slug(self.group.slug)
@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import tempfile
+from contextlib import closing
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..deletion import delete_post_references
+from ..models import Post, RelatedPost, User
+from .. import related
+from ..related import build_related, related_posts, tokenize
+
+TEXTS = (
+    'Кошка спит на подоконнике, кошка мурлычет',
+    'Кошка поймала мышку и мурлычет',
+    'Котёнок и кошка играют с клубком',
+    'Футбол: команда забила гол в финале',
+    'Вратарь команды отбил пенальти, футбол',
+    'Финал футбольного турнира и новый гол',
+)
+
+
+# В шести постах слово темы есть в половине из них.
+@override_settings(RELATED_INDEX_LAG=timedelta(0), RELATED_MAX_DF=0.5)
+class RelatedPostsTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.cats, cls.football = [], []
+        for number, text in enumerate(TEXTS):
+            post = Post.objects.create(text=text, author=cls.user)
+            (cls.cats if number < 3 else cls.football).append(post)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(RELATED_INDEX_PATH=os.path.join(
+            directory.name, 'related.sqlite3'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        build_related(full=True)
+
+    def related_ids(self, post):
+        return set(RelatedPost.objects.filter(post=post)
+                   .values_list('related_id', flat=True))
+
+    def test_neighbours_share_topic(self):
+        """Соседи поста — посты на ту же тему, ближайший первый."""
+        cat = self.cats[0]
+        self.assertEqual(self.related_ids(cat),
+                         {post.pk for post in self.cats[1:]})
+        related = related_posts(cat)
+        self.assertEqual(related[0], self.cats[1])
+        response = self.client.get(
+            reverse('posts:post_detail', args=(cat.pk,)))
+        self.assertEqual(response.context['related_posts'], related)
+        self.assertIn(f'post-{self.cats[1].pk}',
+                      response['Surrogate-Key'].split())
+
+    def test_incremental_update(self):
+        """Новый пост получает соседей и попадает в списки старых."""
+        new = Post.objects.create(
+            text='Кошка мурлычет на подоконнике', author=self.user)
+        removed = self.football[0]
+        self.user.posts.filter(pk=removed.pk).delete()
+        self.assertEqual(build_related(), 1)
+        self.assertIn(self.cats[0].pk, self.related_ids(new))
+        self.assertIn(new.pk, self.related_ids(self.cats[0]))
+        self.assertFalse(RelatedPost.objects.filter(
+            related_id=removed.pk).exists())
+        self.assertEqual(build_related(), 0)
+
+    def test_incremental_reads_only_new_posts(self):
+        """Без --full читаются тексты только новых постов."""
+        Post.objects.create(text='Кошка мурлычет на подоконнике',
+                            author=self.user)
+        with mock.patch.object(related, 'tokenize',
+                               wraps=related.tokenize) as tokenize:
+            self.assertEqual(build_related(), 1)
+        tokenize.assert_called_once_with('Кошка мурлычет на подоконнике')
+
+    def test_deleted_neighbour_leaves_index(self):
+        """Удалённый пост не попадает в соседи новых постов."""
+        removed = self.cats[1]
+        self.user.posts.filter(pk=removed.pk).delete()
+        new = Post.objects.create(
+            text='Кошка поймала мышку и мурлычет', author=self.user)
+        build_related()
+        self.assertNotIn(removed.pk, self.related_ids(new))
+        self.assertIn(self.cats[0].pk, self.related_ids(new))
+
+    def test_full_rebuild_in_short_transactions(self):
+        """Полная пересборка меняет соседей транзакциями по пачке постов."""
+        with CaptureQueriesContext(connection) as queries:
+            build_related(full=True, batch_size=2)
+        savepoints = [query for query in queries
+                      if query['sql'].startswith('SAVEPOINT')]
+        self.assertEqual(len(savepoints), len(TEXTS) // 2)
+        self.assertEqual(self.related_ids(self.cats[0]),
+                         {post.pk for post in self.cats[1:]})
+
+    def test_stop_words_skipped(self):
+        """Служебные слова не попадают в векторы постов."""
+        self.assertEqual(tokenize('Это кошка, и она мурлычет'),
+                         {'кошка': 1, 'мурлычет': 1})
+
+    @override_settings(RELATED_POSTINGS_WALKED=1)
+    def test_postings_walk_capped(self):
+        """Из списка постов по слову читаются только самые весомые."""
+        with closing(sqlite3.connect(settings.RELATED_INDEX_PATH)) as index:
+            postings = related._read_postings(index, {'кошка'})
+            heaviest = index.execute(
+                'SELECT post_id, weight FROM postings WHERE word = ? '
+                'ORDER BY weight DESC LIMIT 1', ('кошка',)).fetchone()
+        self.assertEqual(postings['кошка'], [heaviest])
+        build_related(full=True)
+        for post in self.cats:
+            with self.subTest(post=post.pk):
+                self.assertLessEqual(len(self.related_ids(post)),
+                                     len(tokenize(post.text)))
+
+    def test_deleted_post_references(self):
+        """Удаление поста убирает его из списков похожих."""
+        delete_post_references([self.cats[1].pk])
+        self.assertEqual(self.related_ids(self.cats[0]), {self.cats[2].pk})
@@ -0,0 +1,50 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import Group, Post, User
+from ..sharding import sharded
+
+SEED_OPTIONS = {
+    'users': 20,
+    'groups': 5,
+    'posts': 200,
+    'batch_size': 64,
+    'end': '2026-01-01',
+}
+
+
+class SeedCommandTest(TestCase):
+    databases = '__all__'
+
+    def seed(self, prefix, seed=1):
+        call_command('seed', prefix=prefix, seed=seed, stdout=StringIO(),
+                     **SEED_OPTIONS)
+        author_ids = User.objects.filter(
+            username__startswith=prefix).values_list('pk', flat=True)
+        posts = sharded(Post.objects.filter(author_id__in=list(author_ids)))
+        return [
+            (post.author.username.split('_')[1],
+             post.group.slug.split('-')[-1] if post.group else None,
+             post.text, post.pub_date)
+            for post in sorted(posts, key=lambda post: post.pk)
+        ]
+
+    def test_counts(self):
+        """Создаётся заданное число пользователей, групп и постов."""
+        self.seed('first')
+        self.assertEqual(User.objects.count(), SEED_OPTIONS['users'])
+        self.assertEqual(Group.objects.count(), SEED_OPTIONS['groups'])
+        self.assertEqual(sharded(Post.objects.all()).count(),
+                         SEED_OPTIONS['posts'])
+        self.assertEqual(
+            sharded(Post.objects.filter(excerpt_html='')).count(), 0)
+
+    def test_reproducible(self):
+        """Одинаковый seed даёт одинаковые данные, другой — другие."""
+        first = self.seed('first')
+        second = self.seed('second')
+        third = self.seed('third', seed=2)
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, third)
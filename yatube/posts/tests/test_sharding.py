@@ -0,0 +1,216 @@
+from contextlib import contextmanager
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from .. import sharding
+from ..models import Group, Post, TimelineEntry, User
+from ..registry import group_registry
+from ..sharding import SHARD_SLOTS, hash_shard, post_shards, sharded
+from ..timeline import follow
+
+SHARDS = ['default', 'posts_1', 'posts_2']
+
+
+@override_settings(POST_SHARDS=SHARDS)
+class ShardPlacementTest(SimpleTestCase):
+    def test_post_shards_start_with_home_shard(self):
+        """Пост ищется сначала в шарде, номер которого записан в id."""
+        cases = (
+            (5 * SHARD_SLOTS, SHARDS),
+            (5 * SHARD_SLOTS + 2, ['posts_2', 'default', 'posts_1']),
+            (5 * SHARD_SLOTS + 7, SHARDS),
+        )
+        for post_id, expected in cases:
+            with self.subTest(post_id=post_id):
+                self.assertEqual(post_shards(post_id), expected)
+
+    def test_hash_shard_is_stable(self):
+        """Шард автора зависит только от id и покрывает все шарды."""
+        placements = [hash_shard(author_id) for author_id in range(100)]
+        self.assertEqual(placements,
+                         [hash_shard(author_id) for author_id in range(100)])
+        self.assertEqual(set(placements), set(SHARDS))
+
+
+@skipUnless(len(settings.POST_SHARDS) > 1,
+            'Нужно несколько шардов: запустите с POST_SHARDS=3')
+@override_settings(BACKGROUND_WORKERS=0)
+class ShardedPostsTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+            description='Тестовое описание')
+        cls.authors = {}
+        number = 0
+        while len(cls.authors) < 2:
+            user = User.objects.create_user(username=f'author{number}')
+            cls.authors.setdefault(hash_shard(user.pk), user)
+            number += 1
+        (cls.first_shard, cls.first), (cls.second_shard, cls.second) = (
+            cls.authors.items())
+
+    def setUp(self):
+        group_registry.clear()
+        cache.clear()
+        self.clients = {}
+        for author in self.authors.values():
+            self.clients[author] = Client()
+            self.clients[author].force_login(author)
+
+    def publish(self, author, text):
+        self.clients[author].post(reverse('posts:create'), {
+            'text': text, 'group': self.group.pk})
+        return Post.objects.using(hash_shard(author.pk)).get(text=text)
+
+    def other_shards(self, shard):
+        return [alias for alias in settings.POST_SHARDS if alias != shard]
+
+    def other_post_shards(self, shard):
+        # В default кроме постов лежат пользователи, группы и прочее.
+        return [alias for alias in self.other_shards(shard)
+                if alias != DEFAULT_DB_ALIAS]
+
+    def test_posts_placed_by_author(self):
+        """Пост пишется в шард автора, номер шарда записан в id."""
+        for shard, author in self.authors.items():
+            with self.subTest(shard=shard):
+                post = self.publish(author, f'Пост в {shard}')
+                self.assertEqual(post_shards(post.pk)[0], shard)
+                for alias in self.other_shards(shard):
+                    self.assertFalse(
+                        Post.objects.using(alias).filter(pk=post.pk).exists())
+
+    def test_feeds_merge_shards(self):
+        """Главная и группа собирают посты всех шардов по дате."""
+        posts = [self.publish(author, f'Пост {number}')
+                 for number in range(3)
+                 for author in (self.first, self.second)]
+        expected = [post.pk for post in reversed(posts)]
+        for url in (reverse('posts:index'),
+                    reverse('posts:group_list', args=(self.group.slug,))):
+            with self.subTest(url=url):
+                page = self.client.get(url).context['page_obj']
+                self.assertEqual([post.pk for post in page], expected)
+                self.assertEqual(page.paginator.count, len(posts))
+                self.assertEqual(page[0].author, self.second)
+                self.assertEqual(page[0].group, self.group)
+
+    def test_profile_and_detail_read_one_shard(self):
+        """Профиль и страница поста обращаются только к шарду автора."""
+        post = self.publish(self.first, 'Пост автора')
+        for url in (reverse('posts:profile', args=(self.first.username,)),
+                    reverse('posts:post_detail', args=(post.pk,))):
+            with self.subTest(url=url):
+                for alias in self.other_post_shards(self.first_shard):
+                    with self.assertNumQueries(0, using=alias):
+                        response = self.client.get(url)
+                self.assertContains(response, 'Пост автора')
+
+    def test_rebalance_moves_author(self):
+        """Перенос автора сохраняет id постов, новые пишутся в новый шард."""
+        old = self.publish(self.first, 'Старый пост')
+        call_command('rebalance_posts', author=self.first.username,
+                     to=self.second_shard, pause=0, stdout=StringIO())
+        self.assertFalse(
+            Post.objects.using(self.first_shard).filter(pk=old.pk).exists())
+        moved = Post.objects.using(self.second_shard).get(pk=old.pk)
+        self.assertEqual(moved.text, 'Старый пост')
+        self.clients[self.first].post(reverse('posts:create'), {
+            'text': 'Новый пост'})
+        new = Post.objects.using(self.second_shard).get(text='Новый пост')
+        self.assertEqual(post_shards(new.pk)[0], self.second_shard)
+        response = self.client.get(
+            reverse('posts:profile', args=(self.first.username,)))
+        self.assertEqual([post.pk for post in response.context['page_obj']],
+                         [new.pk, old.pk])
+        self.assertContains(
+            self.client.get(reverse('posts:post_detail', args=(old.pk,))),
+            'Старый пост')
+
+    def test_rebalance_rerun_after_interrupt(self):
+        """Перенос повторяется после сбоя, ссылки на посты сохраняются."""
+        follow(self.second, self.first)
+        post = self.publish(self.first, 'Пост до сбоя')
+        # Прерванный запуск успел записать копию, но не удалить оригинал.
+        Post.objects.using(self.second_shard).bulk_create(
+            [Post.objects.using(self.first_shard).get(pk=post.pk)])
+        call_command('rebalance_posts', author=self.first.username,
+                     to=self.second_shard, pause=0, stdout=StringIO())
+        self.assertFalse(
+            Post.objects.using(self.first_shard).filter(pk=post.pk).exists())
+        self.assertEqual(
+            Post.objects.using(self.second_shard).get(pk=post.pk).text,
+            'Пост до сбоя')
+        self.assertTrue(
+            TimelineEntry.objects.filter(post_id=post.pk).exists())
+
+    def test_edit_during_move_not_lost(self):
+        """Правка и удаление поста во время переноса не теряются."""
+        edited = self.publish(self.first, 'Пост до правки')
+        deleted = self.publish(self.first, 'Пост на удаление')
+        moving_posts = sharding.moving_posts
+        entered = []
+
+        @contextmanager
+        def edit_after_copy():
+            entered.append(True)
+            if len(entered) == 2:
+                # Пачка уже скопирована, оригиналы ещё не перечитаны.
+                Post.objects.using(self.first_shard).filter(
+                    pk=edited.pk).update(text='Пост после правки')
+                Post.objects.using(self.first_shard).get(
+                    pk=deleted.pk).delete()
+            with moving_posts():
+                yield
+
+        posts = Post.objects.using(self.first_shard).filter(
+            author=self.first)
+        with mock.patch.object(sharding, 'moving_posts', edit_after_copy):
+            sharding.move_author(self.first.pk, self.second_shard)
+        self.assertFalse(posts.exists())
+        self.assertEqual(
+            Post.objects.using(self.second_shard).get(pk=edited.pk).text,
+            'Пост после правки')
+        self.assertFalse(Post.objects.using(self.second_shard).filter(
+            pk=deleted.pk).exists())
+
+    def test_deep_page_reads_ids_only(self):
+        """Глубокая страница читает полные строки только своих постов."""
+        for number in range(6):
+            self.publish(self.first if number % 2 else self.second,
+                         f'Пост {number}')
+        posts = sharded(Post.objects.all())
+        self.assertEqual([post.text for post in posts[4:6]],
+                         ['Пост 1', 'Пост 0'])
+        with mock.patch.object(Post, 'from_db',
+                               wraps=Post.from_db) as from_db:
+            posts[4:6]
+        self.assertEqual(from_db.call_count, 2)
+
+    def test_seed_takes_ids_from_sequence(self):
+        """Посты seed берут id из счётчика и лежат в шардах авторов."""
+        call_command('seed', prefix='seeded', users=10, groups=2, posts=50,
+                     stdout=StringIO())
+        seeded = list(User.objects.filter(username__startswith='seeded_')
+                      .values_list('pk', flat=True))
+        for alias in settings.POST_SHARDS:
+            with self.subTest(alias=alias):
+                posts = Post.objects.using(alias).filter(
+                    author_id__in=seeded)
+                for post in posts:
+                    self.assertEqual(post_shards(post.pk)[0], alias)
+                    self.assertEqual(hash_shard(post.author_id), alias)
+        # Следующий id из счётчика не совпадает с уже созданными.
+        post = self.publish(self.first, 'Пост после seed')
+        self.assertEqual(post_shards(post.pk)[0], self.first_shard)
@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import ActivityStats, ArchivedPost, Group, Post, User
+from ..registry import group_registry
+from ..stats import refresh, summarize
+
+
+@override_settings(ACTIVITY_STATS_LAG=timedelta(0))
+class ActivityStatsTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+            description='Тестовое описание')
+        cls.today = timezone.localtime().replace(
+            hour=10, minute=0, second=0, microsecond=0)
+        if cls.today > timezone.now():
+            cls.today -= timedelta(days=1)
+        for days_ago, hour in ((0, 10), (0, 10), (1, 10), (3, 22)):
+            cls.publish(cls.today - timedelta(days=days_ago)
+                        + timedelta(hours=hour - 10))
+
+    def setUp(self):
+        group_registry.clear()
+
+    @classmethod
+    def publish(cls, pub_date):
+        post = Post.objects.create(
+            text='Тестовый текст', author=cls.user, group=cls.group)
+        cls.user.posts.filter(pk=post.pk).update(pub_date=pub_date)
+        return post
+
+    def test_bins_and_streaks(self):
+        """Посты считаются по дням и часам, серия — дни подряд."""
+        ArchivedPost.from_post(Post(
+            pk=10 ** 6, text='Архив', author=self.user,
+            pub_date=self.today - timedelta(days=30))).save()
+        stats = summarize(refresh(ActivityStats.AUTHOR, self.user.pk),
+                          today=self.today.date())
+        self.assertEqual(stats['total'], 5)
+        hours = {hour: count for hour, count, _ in stats['hours']}
+        self.assertEqual((hours[10], hours[22]), (4, 1))
+        self.assertEqual(stats['per_day'][:4], [
+            (self.today.date() - timedelta(days=days_ago), count)
+            for days_ago, count in ((0, 2), (1, 1), (2, 0), (3, 1))
+        ])
+        self.assertEqual(sum(count for _, count in stats['per_week']), 5)
+        self.assertEqual(
+            (stats['longest_streak'], stats['current_streak']), (2, 2))
+
+    def test_refresh_reads_only_new_posts(self):
+        """Обновление учитывает только посты новее отметки."""
+        first = refresh(ActivityStats.GROUP, self.group.pk)
+        self.assertEqual(first.total, 4)
+        # Пост задним числом старше отметки уже не попадёт в статистику.
+        self.publish(first.watermark - timedelta(days=1))
+        Post.objects.create(text='Новый пост', author=self.user,
+                            group=self.group)
+        second = refresh(ActivityStats.GROUP, self.group.pk)
+        self.assertEqual(second.total, 5)
+        self.assertEqual(ActivityStats.objects.count(), 1)
+
+    def test_deleted_and_moved_posts_leave_stats(self):
+        """Удалённый и перенесённый посты больше не учитываются."""
+        other = Group.objects.create(
+            title='Другая группа', slug='other', description='Описание')
+        self.assertEqual(refresh(ActivityStats.GROUP, self.group.pk).total, 4)
+        self.assertEqual(refresh(ActivityStats.AUTHOR, self.user.pk).total, 4)
+        self.assertEqual(refresh(ActivityStats.GROUP, other.pk).total, 0)
+        first, second = self.user.posts.order_by('pk')[:2]
+        first.delete()
+        second.group = other
+        second.save()
+        self.assertEqual(refresh(ActivityStats.GROUP, self.group.pk).total, 2)
+        self.assertEqual(refresh(ActivityStats.GROUP, other.pk).total, 1)
+        self.assertEqual(refresh(ActivityStats.AUTHOR, self.user.pk).total, 3)
+
+    def test_stats_pages(self):
+        """Страницы статистики автора и группы открываются."""
+        for url in (reverse('posts:author_stats', args=(self.user.username,)),
+                    reverse('posts:group_stats', args=(self.group.slug,))):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.context['stats']['total'], 4)
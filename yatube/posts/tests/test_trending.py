@@ -0,0 +1,136 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import (Group, GroupScore, Post, PostScore, TrendingEpoch,
+                      User)
+from ..registry import group_registry
+from ..trending import (_post_groups, rebase, record_post_viewed,
+                        view_buffer)
+
+
+@override_settings(BACKGROUND_WORKERS=0, TRENDING_VIEW_FLUSH_INTERVAL=0)
+class TrendingTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.quiet_post = Post.objects.create(
+            text='Тихий пост', author=cls.user)
+        cls.hot_post = Post.objects.create(
+            text='Популярный пост', author=cls.user, group=cls.group)
+
+    def setUp(self):
+        group_registry.clear()
+
+    def test_views_raise_score(self):
+        """Просмотры поднимают пост и его группу в тренды."""
+        for _ in range(3):
+            self.client.get(
+                reverse('posts:post_detail', args=(self.hot_post.id,)))
+        response = self.client.get(reverse('posts:trending'))
+        self.assertEqual(
+            response.context['posts'], [self.hot_post, self.quiet_post])
+        self.assertContains(
+            response, reverse('posts:group_list', args=(self.group.slug,)))
+
+    @override_settings(TRENDING_VIEW_FLUSH_INTERVAL=3600)
+    def test_views_buffered(self):
+        """Просмотры копятся в процессе и пишутся одним UPDATE на пост."""
+        view_buffer.clear()
+        self.addCleanup(view_buffer.clear)
+        PostScore.objects.all().delete()
+        for _ in range(5):
+            self.client.get(
+                reverse('posts:post_detail', args=(self.hot_post.id,)))
+        self.assertFalse(PostScore.objects.exists())
+        with CaptureQueriesContext(connection) as queries:
+            view_buffer.flush()
+        updates = [query for query in queries.captured_queries
+                   if query['sql'].startswith('UPDATE "posts_postscore"')]
+        self.assertEqual(len(updates), 1)
+        epoch = TrendingEpoch.objects.get()
+        factor = 2 ** ((timezone.now() - epoch.started)
+                       / settings.TRENDING_HALF_LIFE)
+        self.assertAlmostEqual(
+            PostScore.objects.get(post=self.hot_post).score / factor,
+            5 * settings.TRENDING_VIEW_WEIGHT, places=3)
+
+    def test_rebase_keeps_order(self):
+        """Сдвиг начала отсчёта сохраняет порядок и соотношение."""
+        record_post_viewed(self.hot_post.pk)
+        before = dict(PostScore.objects.values_list('post_id', 'score'))
+        epoch = TrendingEpoch.objects.get()
+        rebase(epoch.started + timedelta(hours=6))
+        after = dict(PostScore.objects.values_list('post_id', 'score'))
+        for post_id, score in before.items():
+            with self.subTest(post_id=post_id):
+                self.assertAlmostEqual(after[post_id], score / 2)
+
+    @override_settings(TRENDING_REBASE_AFTER=timedelta(0))
+    def test_rebase_on_bump(self):
+        """Устаревшее начало отсчёта сдвигается при очередном событии."""
+        epoch = TrendingEpoch.objects.get()
+        epoch.started = timezone.now() - timedelta(days=30)
+        epoch.save()
+        record_post_viewed(self.hot_post.pk)
+        self.assertGreater(TrendingEpoch.objects.get().started,
+                           epoch.started)
+
+    def test_rebase_once(self):
+        """Из двух сдвигов на один момент пересчитывает только первый."""
+        record_post_viewed(self.hot_post.pk)
+        score = PostScore.objects.get(post=self.hot_post).score
+        now = TrendingEpoch.objects.get().started + timedelta(hours=6)
+        self.assertTrue(rebase(now))
+        self.assertFalse(rebase(now))
+        self.assertAlmostEqual(
+            PostScore.objects.get(post=self.hot_post).score, score / 2)
+
+    def test_bump_during_rebase(self):
+        """Событие во время сдвига считается от нового начала отсчёта."""
+        PostScore.objects.all().delete()
+        started = TrendingEpoch.objects.get().started
+
+        def rebase_meanwhile(*args, **kwargs):
+            rebase(started + timedelta(hours=6))
+            return _post_groups(*args, **kwargs)
+
+        with mock.patch('posts.trending.timezone.now', return_value=started):
+            with mock.patch('posts.trending._post_groups', rebase_meanwhile):
+                record_post_viewed(self.hot_post.pk)
+        self.assertAlmostEqual(
+            PostScore.objects.get(post=self.hot_post).score,
+            settings.TRENDING_VIEW_WEIGHT / 2)
+
+    def test_rebase_while_writing(self):
+        """Сдвиг, пока рейтинги пишутся, — вклад пересчитывается заново."""
+        PostScore.objects.all().delete()
+        GroupScore.objects.all().delete()
+        started = TrendingEpoch.objects.get().started
+        old = TrendingEpoch(pk=1, started=started)
+        new = TrendingEpoch(pk=1, started=started + timedelta(hours=6))
+        # Проверка на сдвиг, чтение, проверка после записи — и повтор.
+        epochs = [old, old, new, new, new]
+        with mock.patch('posts.trending.timezone.now', return_value=started):
+            with mock.patch('posts.trending.get_epoch', side_effect=epochs):
+                record_post_viewed(self.hot_post.pk)
+        self.assertAlmostEqual(
+            PostScore.objects.get(post=self.hot_post).score,
+            settings.TRENDING_VIEW_WEIGHT / 2)
+        self.assertAlmostEqual(
+            GroupScore.objects.get(group=self.group).score,
+            settings.TRENDING_VIEW_WEIGHT / 2)
@@ -4,9 +4,12 @@ from http import HTTPStatus
 
 
 from ..models import Group, Post, User
+from ..registry import group_registry
 
 
 class PostModelTest(TestCase):
+    databases = '__all__'
+
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -24,6 +27,7 @@ class PostModelTest(TestCase):
         )
 
     def setUp(self):
+        group_registry.clear()
         self.not_author = Client()
         self.not_author.force_login(self.user1)
         self.authorized_client = Client()
@@ -1,15 +1,22 @@
-from django.test import Client, TestCase
-from django.urls import reverse
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse, set_script_prefix
 from django import forms
 from django.conf import settings
+from django.template import Context, Template
+from django.template.loader import render_to_string
 
 from ..forms import PostForm
-from ..models import Post, Group, User
+from ..models import Follow, Post, PullAuthor, Group, TimelineEntry, User
+from ..registry import group_registry
+from ..sharding import bulk_create_posts
+from ..utils import WindowedPaginator, feed_cache
 
 NUMBER_OF_PAGINATOR_POSTS = 20
 
 
 class PostModelTest(TestCase):
+    databases = '__all__'
 
     @classmethod
     def setUpClass(cls):
@@ -39,6 +46,7 @@ class PostModelTest(TestCase):
         self.assertEqual(page_obj.pub_date, self.post.pub_date)
 
     def setUp(self):
+        group_registry.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
@@ -111,6 +119,8 @@ class PostModelTest(TestCase):
 
 
 class PaginatorViewTest(TestCase):
+    databases = '__all__'
+
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -132,9 +142,12 @@ class PaginatorViewTest(TestCase):
                     author=cls.user,
                     group=cls.group,
                 ))
-        Post.objects.bulk_create(list_of_posts)
+        bulk_create_posts(list_of_posts)
 
     def setUp(self):
+        group_registry.clear()
+        # bulk_create не шлёт сигналов и не сбрасывает кэш лент.
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
@@ -159,3 +172,292 @@ class PaginatorViewTest(TestCase):
                         self.assertEqual(
                             len(response.context['page_obj']),
                             quantity)
+
+
+@override_settings(PAGINATOR_ON_EACH_SIDE=2, PAGINATOR_ON_ENDS=1)
+class WindowedPaginatorTest(TestCase):
+    def test_window_range(self):
+        """Окно страниц: края, соседи текущей и многоточия."""
+        ellipsis = WindowedPaginator.ELLIPSIS
+        paginator = WindowedPaginator(range(1000), settings.POSTS_ON_PAGE)
+        cases = (
+            (1, [1, 2, 3, ellipsis, 100]),
+            (5, [1, 2, 3, 4, 5, 6, 7, ellipsis, 100]),
+            (50, [1, ellipsis, 48, 49, 50, 51, 52, ellipsis, 100]),
+            (100, [1, ellipsis, 98, 99, 100]),
+        )
+        for number, expected in cases:
+            with self.subTest(number=number):
+                self.assertEqual(
+                    list(paginator.get_window_range(number)), expected)
+        short = WindowedPaginator(range(50), settings.POSTS_ON_PAGE)
+        self.assertEqual(list(short.page(3).window_range), [1, 2, 3, 4, 5])
+
+    def test_rendered_links_do_not_grow(self):
+        """Число ссылок в пагинаторе не зависит от длины ленты."""
+        link_counts = set()
+        for length in (10 ** 3, 10 ** 6):
+            paginator = WindowedPaginator(range(length),
+                                          settings.POSTS_ON_PAGE)
+            page = paginator.page(paginator.num_pages // 2)
+            html = render_to_string(
+                'posts/includes/paginator.html', {'page_obj': page})
+            link_counts.add(html.count('<li'))
+        self.assertEqual(len(link_counts), 1)
+
+
+@override_settings(BACKGROUND_WORKERS=0)
+class FollowViewsTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.old_post = Post.objects.create(
+            text='Пост до подписки', author=cls.author)
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def follow_page(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_follow_and_unfollow(self):
+        """Подписка добавляет посты автора в ленту, отписка убирает."""
+        self.reader_client.get(
+            reverse('posts:profile_follow', args=(self.author.username,)))
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.author).exists())
+        new_post = Post.objects.create(
+            text='Пост после подписки', author=self.author)
+        self.assertEqual(self.follow_page(), [new_post, self.old_post])
+
+        self.reader_client.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,)))
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(self.follow_page(), [])
+
+    def test_cannot_follow_self(self):
+        """Нельзя подписаться на самого себя."""
+        self.reader_client.get(
+            reverse('posts:profile_follow', args=(self.reader.username,)))
+        self.assertFalse(Follow.objects.exists())
+
+    def test_not_in_feed_of_non_followers(self):
+        """Пост не появляется в ленте тех, кто не подписан."""
+        Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(self.follow_page(), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_pull_author(self):
+        """Посты авторов сверх лимита подтягиваются при чтении."""
+        self.reader_client.get(
+            reverse('posts:profile_follow', args=(self.author.username,)))
+        new_post = Post.objects.create(
+            text='Пост популярного автора', author=self.author)
+        self.assertTrue(
+            PullAuthor.objects.filter(author=self.author).exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.follow_page(), [new_post, self.old_post])
+
+    def test_pages_merge_pushed_and_pulled(self):
+        """Страницы ленты сливают записи ленты и посты «тяжёлых» авторов."""
+        pull_author = User.objects.create_user(username='popular')
+        for author in (self.author, pull_author):
+            self.reader_client.get(
+                reverse('posts:profile_follow', args=(author.username,)))
+        posts = [Post.objects.create(text=f'Пост {number}',
+                                     author=(self.author, pull_author)[
+                                         number % 3 == 0])
+                 for number in range(12)]
+        # Автор стал «тяжёлым» после раскладки: его записи ленты остаются.
+        PullAuthor.objects.create(author=pull_author)
+        posts.append(Post.objects.create(text='Без раскладки',
+                                         author=pull_author))
+        expected = sorted([*posts, self.old_post],
+                          key=lambda post: (post.pub_date, post.pk),
+                          reverse=True)
+        pages = []
+        for number in (1, 2):
+            response = self.reader_client.get(
+                reverse('posts:follow_index'), {'page': number})
+            pages.extend(response.context['page_obj'])
+        self.assertEqual(pages, expected)
+
+
+class FeedExcerptTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.post = Post.objects.create(
+            text='Очень длинный текст. ' * 1000, author=cls.user)
+
+    def test_feed_renders_excerpt_only(self):
+        """Лента выводит начало текста и ссылку на полный пост."""
+        detail_url = reverse('posts:post_detail', args=(self.post.id,))
+        for name, args in (
+            ('posts:index', None),
+            ('posts:profile', (self.user.username,)),
+        ):
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name, args=args))
+                self.assertLess(len(response.content), 5000)
+                self.assertContains(response, 'читать дальше')
+                self.assertContains(response, detail_url)
+                page_post = response.context['page_obj'][0]
+                self.assertIn('text', page_post.get_deferred_fields())
+
+
+class FeedCacheTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(text='Первый текст', author=self.user)
+
+    def test_feed_served_from_cache(self):
+        """Лента берётся из кэша и сбрасывается при сохранении поста."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        self.user.posts.filter(pk=self.post.pk).update(text='Скрытая правка')
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, 'Первый текст')
+        post = self.user.posts.get(pk=self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        self.assertContains(self.client.get(url), 'Новый текст')
+
+
+class FeedFragmentTest(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+            description='Тестовое описание')
+        bulk_create_posts([
+            Post(text=f'Пост {number}', author=cls.user, group=cls.group)
+            for number in range(settings.POSTS_ON_PAGE + 3)])
+
+    def setUp(self):
+        group_registry.clear()
+        # bulk_create не шлёт сигналов и не сбрасывает кэш лент.
+        cache.clear()
+
+    def test_fragment_has_posts_only(self):
+        """Фрагмент — посты страницы без макета и кнопка следующей."""
+        cases = (
+            ('posts:index', 'posts:index_fragment', None),
+            ('posts:group_list', 'posts:group_list_fragment',
+             (self.group.slug,)),
+            ('posts:profile', 'posts:profile_fragment',
+             (self.user.username,)),
+        )
+        for name, fragment_name, args in cases:
+            with self.subTest(name=name):
+                fragment_url = reverse(fragment_name, args=args)
+                page = self.client.get(reverse(name, args=args))
+                self.assertContains(page, f'{fragment_url}?before=')
+                first = self.client.get(fragment_url)
+                self.assertNotContains(first, '<html')
+                self.assertEqual(list(first.context['page_obj']),
+                                 list(page.context['page_obj']))
+                last = self.client.get(fragment_url + '?page=2')
+                self.assertEqual(len(last.context['page_obj']), 3)
+                self.assertNotContains(last, 'data-feed-more')
+                self.assertLess(len(last.content), len(page.content) / 2)
+
+    def test_cursor_fragment_skips_new_posts(self):
+        """Новый пост между подгрузками не сдвигает следующую порцию."""
+        page = self.client.get(reverse('posts:index'))
+        cursor = page.context['page_obj'].next_cursor
+        Post.objects.create(text='Свежий пост', author=self.user)
+        response = self.client.get(
+            reverse('posts:index_fragment') + f'?before={cursor}')
+        shown = {post.pk for post in page.context['page_obj']}
+        loaded = {post.pk for post in response.context['page_obj']}
+        self.assertEqual(len(loaded), 3)
+        self.assertFalse(shown & loaded)
+        self.assertNotContains(response, 'data-feed-more')
+
+    def test_fragment_uses_feed_cache(self):
+        """Фрагмент берёт страницу из того же кэша, что и лента."""
+        self.client.get(reverse('posts:index') + '?page=2')
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                reverse('posts:index_fragment') + '?page=2')
+        self.assertEqual(len(response.context['page_obj']), 3)
+
+    def test_post_resets_only_its_feeds(self):
+        """Новый пост сбрасывает кэш своих лент, а не чужого профиля."""
+        other = User.objects.create_user(username='other')
+        keys = {scope: feed_cache.make_key('1', scope) for scope in (
+            'index', f'group:{self.group.pk}', f'profile:{self.user.pk}')}
+        Post.objects.create(text='Пост без группы', author=other)
+        self.assertNotEqual(feed_cache.make_key('1', 'index'), keys['index'])
+        for scope in (f'group:{self.group.pk}', f'profile:{self.user.pk}'):
+            with self.subTest(scope=scope):
+                self.assertEqual(feed_cache.make_key('1', scope),
+                                 keys[scope])
+
+    def test_cursor_fragment_cached(self):
+        """Порция за курсором тоже берётся из кэша лент."""
+        page = self.client.get(reverse('posts:index'))
+        url = (reverse('posts:index_fragment')
+               + f'?before={page.context["page_obj"].next_cursor}')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(list(second.context['page_obj']),
+                         list(first.context['page_obj']))
+
+
+class AbsoluteUrlTest(TestCase):
+    databases = '__all__'
+
+    def test_urls_match_reverse(self):
+        """get_absolute_url совпадает с reverse, в том числе с префиксом."""
+        user = User(username='lev.tolstoy@yasnaya+1')
+        group = Group(slug='test-slug')
+        post = Post(pk=42, author=user)
+        cases = (
+            (user, 'posts:profile', user.username),
+            (group, 'posts:group_list', group.slug),
+            (post, 'posts:post_detail', post.pk),
+        )
+        for prefix in ('/', '/yatube/'):
+            set_script_prefix(prefix)
+            self.addCleanup(set_script_prefix, '/')
+            for obj, name, arg in cases:
+                with self.subTest(prefix=prefix, name=name):
+                    self.assertEqual(obj.get_absolute_url(),
+                                     reverse(name, args=(arg,)))
+
+    def test_feed_posts_renders_cards(self):
+        """feed_posts выводит карточки со ссылками, разделёнными <hr>."""
+        user = User.objects.create_user(username='HasNoName')
+        posts = [Post.objects.create(text=f'Пост {number}', author=user)
+                 for number in range(3)]
+        html = Template('{% load feed %}{% feed_posts posts %}').render(
+            Context({'posts': posts}))
+        self.assertEqual(html.count('<article'), 3)
+        self.assertEqual(html.count('<hr>'), 2)
+        for post in posts:
+            self.assertIn(f'href="{post.get_absolute_url()}"', html)
+        self.assertIn(f'href="{user.get_absolute_url()}"', html)
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.template.defaultfilters import linebreaks_filter, linebreaksbr
+from django.utils.text import Truncator
+
+RENDERED_FIELDS = ('excerpt', 'excerpt_html', 'is_truncated', 'text_html_br')
+
+
+def normalize_title(title):
+    """Название для поиска по префиксу: без регистра, «ё» и лишних пробелов."""
+    return ' '.join(title.casefold().replace('ё', 'е').split())
+
+
+def render_text(text):
+    """Те же фильтры, что раньше применялись в шаблонах при каждом показе."""
+    length = settings.POST_EXCERPT_LENGTH
+    if len(text) <= length:
+        excerpt = text
+    else:
+        # Truncator перебирает строку посимвольно целиком: отдаём ему
+        # только начало с запасом на комбинируемые символы.
+        excerpt = Truncator(text[:length * 2]).chars(length)
+    return {
+        'excerpt': excerpt,
+        'excerpt_html': linebreaks_filter(excerpt, autoescape=True),
+        'is_truncated': excerpt != text,
+        'text_html_br': linebreaksbr(text, autoescape=True),
+    }
+
+
+def backfill_rendered_text(model, batch_size, stdout=None, using=None):
+    """Заполняет сохранённый HTML постов пачками по batch_size строк."""
+    last_pk = 0
+    total = 0
+    while True:
+        batch = list(
+            model.objects.using(using).filter(pk__gt=last_pk)
+            .order_by('pk').only('pk', 'text')[:batch_size]
+        )
+        if not batch:
+            return total
+        for post in batch:
+            rendered = render_text(post.text)
+            for field in RENDERED_FIELDS:
+                setattr(post, field, rendered[field])
+        model.objects.using(using).bulk_update(batch, RENDERED_FIELDS)
+        last_pk = batch[-1].pk
+        total += len(batch)
+        if stdout is not None:
+            stdout.write(f'Обработано постов: {total}')
@@ -0,0 +1,163 @@
+import copy
+import heapq
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Follow, Post, PullAuthor, TimelineEntry
+from .sharding import author_shards, find_post, is_sharded, posts_in_bulk
+from .utils import before_q
+
+
+def _insert_entries(entries):
+    for start in range(0, len(entries), settings.TIMELINE_BATCH_SIZE):
+        with transaction.atomic():
+            TimelineEntry.objects.bulk_create(
+                entries[start:start + settings.TIMELINE_BATCH_SIZE],
+                ignore_conflicts=True,
+            )
+
+
+def is_pull_author(author_id):
+    """
+    Проверяет, что у автора больше TIMELINE_FANOUT_LIMIT подписчиков.
+    Отметка остаётся навсегда: посты, опубликованные без раскладки,
+    иначе пропали бы из лент после отписок.
+    """
+    if PullAuthor.objects.filter(author_id=author_id).exists():
+        return True
+    followers = Follow.objects.filter(author_id=author_id)
+    if not followers[settings.TIMELINE_FANOUT_LIMIT:].exists():
+        return False
+    PullAuthor.objects.get_or_create(author_id=author_id)
+    return True
+
+
+def fan_out(post_id):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    post = find_post(post_id, Post.objects.values('author_id', 'pub_date'))
+    if post is None:
+        return
+    author_id = post['author_id']
+    if is_pull_author(author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    _insert_entries([
+        TimelineEntry(user_id=user_id, post_id=post_id,
+                      pub_date=post['pub_date'])
+        for user_id in follower_ids
+    ])
+
+
+def follow(user, author):
+    _, created = Follow.objects.get_or_create(user=user, author=author)
+    if not created or is_pull_author(author.pk):
+        return
+    # Недавние посты автора сразу попадают в ленту нового подписчика.
+    recent = []
+    for using in author_shards(author.pk):
+        recent.extend(
+            author.posts.using(using).order_by('-pub_date')
+            .values_list('pk', 'pub_date')[:settings.TIMELINE_BACKFILL])
+    _insert_entries([
+        TimelineEntry(user=user, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in recent
+    ])
+
+
+def unfollow(user, author):
+    Follow.objects.filter(user=user, author=author).delete()
+    entries = TimelineEntry.objects.filter(user=user)
+    if not is_sharded():
+        entries.filter(post__author=author).delete()
+        return
+    # Посты автора в другой базе: их id выбираем пачками.
+    for using in author_shards(author.pk):
+        post_ids = author.posts.using(using).order_by('pk').values_list(
+            'pk', flat=True)
+        last = 0
+        while True:
+            batch = list(post_ids.filter(
+                pk__gt=last)[:settings.TIMELINE_BATCH_SIZE])
+            if not batch:
+                break
+            entries.filter(post_id__in=batch).delete()
+            last = batch[-1]
+
+
+class Timeline:
+    """
+    Лента подписок для Paginator. Срез [start:stop] читает первые stop
+    записей ленты по индексу (user, -pub_date) и первые stop постов каждого
+    «тяжёлого» автора — только id и даты, — сливает их по (pub_date, id)
+    и загружает по id лишь посты среза.
+    """
+    # (pub_date, id) поста, за которым начинается лента (см. before).
+    cursor = None
+
+    def __init__(self, user, queryset):
+        self.user = user
+        self.queryset = queryset
+        self.pulled = list(PullAuthor.objects.filter(
+            author__following__user=user).values_list('author_id', flat=True))
+        self._count = None
+
+    def before(self, pub_date, pk):
+        """Та же лента за постом (pub_date, pk) — для курсора."""
+        timeline = copy.copy(self)
+        timeline.cursor = (pub_date, pk)
+        timeline._count = None
+        return timeline
+
+    def _entries(self):
+        entries = TimelineEntry.objects.filter(user=self.user)
+        if self.cursor is not None:
+            entries = entries.filter(before_q(*self.cursor, 'post_id'))
+        return entries.order_by('-pub_date', '-post_id')
+
+    def _pulled_posts(self):
+        for author_id in self.pulled:
+            for alias in author_shards(author_id):
+                posts = Post.objects.using(alias).filter(author_id=author_id)
+                if self.cursor is not None:
+                    posts = posts.filter(before_q(*self.cursor))
+                yield posts.order_by('-pub_date', '-pk')
+
+    def count(self):
+        # Записи, разложенные до того, как автор стал «тяжёлым», совпадают
+        # с его постами и в срезе показываются один раз, но здесь
+        # считаются дважды: последняя страница может оказаться короче.
+        if self._count is None:
+            self._count = self._entries().count() + sum(
+                posts.count() for posts in self._pulled_posts())
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = self.count() if index.stop is None else index.stop
+        if stop <= start:
+            return []
+        parts = [
+            self._entries().values_list('pub_date', 'post_id')[:stop],
+            *(posts.values_list('pub_date', 'pk')[:stop]
+              for posts in self._pulled_posts()),
+        ]
+        merged = (key for key, _ in groupby(heapq.merge(*parts,
+                                                        reverse=True)))
+        window = [pk for _, pk in islice(merged, start, stop)]
+        found = posts_in_bulk(window, self.queryset)
+        return [found[pk] for pk in window if pk in found]
+
+
+def timeline_posts(user, queryset=None):
+    """Лента подписок: разложенные записи плюс посты «тяжёлых» авторов."""
+    if queryset is None:
+        queryset = Post.objects.all()
+    return Timeline(user, queryset)
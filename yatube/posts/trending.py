@@ -0,0 +1,228 @@
+"""
+Рейтинги «в тренде» с экспоненциальным затуханием.
+
+Вклад события с весом w в момент t хранится как w * exp((t - t0) / tau),
+где t0 — общее для всех рейтингов начало отсчёта. Затухание тогда
+не требует пересчёта: все рейтинги в любой момент умножены на один и тот
+же множитель, и порядок между ними верный. Чтобы числа не росли без
+предела, начало отсчёта периодически сдвигается вперёд (rebase) одним
+UPDATE на таблицу.
+
+Просмотры не пишутся в базу по одному: процесс копит их в view_buffer и
+раз в TRENDING_VIEW_FLUSH_INTERVAL добавляет одним UPDATE на пост.
+"""
+import math
+import os
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.tasks import submit
+
+from .models import GroupScore, Post, PostScore, TrendingEpoch
+from .sharding import is_sharded, posts_in_bulk
+
+# Сколько раз пересчитать события, если начало отсчёта сдвинули, пока
+# они записывались.
+EPOCH_RETRIES = 3
+
+
+class EpochMoved(Exception):
+    pass
+
+
+def get_tau():
+    return settings.TRENDING_HALF_LIFE.total_seconds() / math.log(2)
+
+
+def get_epoch():
+    epoch = TrendingEpoch.objects.first()
+    if epoch is None:
+        epoch, _ = TrendingEpoch.objects.get_or_create(
+            pk=1, defaults={'started': timezone.now()})
+    return epoch
+
+
+def _lock_epoch():
+    """
+    Начало отсчёта, заблокированное до конца текущей транзакции: его
+    сдвигает только rebase(), события его не блокируют.
+    """
+    pk = get_epoch().pk
+    # Пустой UPDATE берёт блокировку строки, а в SQLite — записи в базу,
+    # где select_for_update() ничего не блокирует.
+    TrendingEpoch.objects.filter(pk=pk).update(started=F('started'))
+    return TrendingEpoch.objects.get(pk=pk)
+
+
+def rebase(now=None, older_than=None):
+    """
+    Переносит начало отсчёта на now, пересчитывая рейтинги. С older_than
+    сдвигает, только если отсчёту больше older_than: из одновременных
+    вызовов пересчёт выполнит один. Возвращает, был ли сдвиг.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        epoch = _lock_epoch()
+        if now - epoch.started <= (older_than or timedelta(0)):
+            return False
+        factor = math.exp(-(now - epoch.started).total_seconds() / get_tau())
+        for model in (PostScore, GroupScore):
+            model.objects.update(score=F('score') * factor)
+            model.objects.filter(
+                score__lt=settings.TRENDING_MIN_SCORE).delete()
+        epoch.started = now
+        epoch.save(update_fields=('started',))
+    return True
+
+
+def _add(model, key, pk, boost):
+    updated = model.objects.filter(**{key: pk}).update(
+        score=F('score') + boost)
+    if not updated:
+        _, created = model.objects.get_or_create(
+            **{key: pk}, defaults={'score': boost})
+        if not created:
+            model.objects.filter(**{key: pk}).update(
+                score=F('score') + boost)
+
+
+def _post_groups(post_ids):
+    """Группы постов из их шардов: {id поста: id группы}."""
+    groups = {}
+    for alias in settings.POST_SHARDS:
+        missing = [pk for pk in post_ids if pk not in groups]
+        if not missing:
+            break
+        groups.update(Post.objects.using(alias).filter(pk__in=missing)
+                      .values_list('pk', 'group_id'))
+    return groups
+
+
+def add_events(weights, now=None):
+    """
+    Добавляет события к рейтингам: weights — {id поста: суммарный вес}.
+    Один UPDATE на пост и на группу.
+
+    Начало отсчёта не блокируется: если rebase() сдвинул его, пока
+    рейтинги обновлялись, транзакция откатывается и вклады считаются
+    заново от нового начала.
+    """
+    now = now or timezone.now()
+    if now - get_epoch().started > settings.TRENDING_REBASE_AFTER:
+        rebase(now, older_than=settings.TRENDING_REBASE_AFTER)
+    group_weights = Counter()
+    for post_id, group_id in _post_groups(list(weights)).items():
+        if group_id is not None:
+            group_weights[group_id] += weights[post_id]
+    for attempt in range(EPOCH_RETRIES):
+        try:
+            _write_events(weights, group_weights, now)
+            return
+        except EpochMoved:
+            if attempt == EPOCH_RETRIES - 1:
+                raise
+
+
+def _write_events(weights, group_weights, now):
+    started = get_epoch().started
+    factor = math.exp((now - started).total_seconds() / get_tau())
+    with transaction.atomic():
+        for post_id, weight in weights.items():
+            _add(PostScore, 'post_id', post_id, weight * factor)
+        for group_id, weight in group_weights.items():
+            _add(GroupScore, 'group_id', group_id, weight * factor)
+        # Сдвиг, зафиксированный после этой проверки, ждёт наших строк и
+        # пересчитает их вместе с остальными.
+        if get_epoch().started != started:
+            raise EpochMoved
+
+
+def bump(post_id, weight):
+    """Добавляет событие с весом weight к рейтингу поста и его группы."""
+    add_events({post_id: weight})
+
+
+class ViewBuffer:
+    """
+    Просмотры постов, накопленные в процессе. Первый просмотр после
+    TRENDING_VIEW_FLUSH_INTERVAL ставит запись накопленного в фоновый пул;
+    если пул переполнен, просмотры дождутся следующей записи.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._flushed_at = time.monotonic()
+
+    def add(self, post_id):
+        with self._lock:
+            self._counts[post_id] += 1
+            now = time.monotonic()
+            due = (now - self._flushed_at
+                   >= settings.TRENDING_VIEW_FLUSH_INTERVAL)
+            if due:
+                self._flushed_at = now
+        if due:
+            submit(self.flush)
+
+    def flush(self):
+        """Добавляет накопленные просмотры к рейтингам."""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return
+        weight = settings.TRENDING_VIEW_WEIGHT
+        try:
+            add_events({post_id: count * weight
+                        for post_id, count in counts.items()})
+        except Exception:
+            # Не теряем просмотры: их запишет следующий сброс.
+            with self._lock:
+                self._counts.update(counts)
+            raise
+
+    def clear(self):
+        with self._lock:
+            self._counts = Counter()
+            self._flushed_at = time.monotonic()
+
+
+view_buffer = ViewBuffer()
+
+# Просмотры, накопленные мастером до fork(), воркеры не записывают.
+os.register_at_fork(after_in_child=view_buffer.clear)
+
+
+def record_post_created(post_id):
+    bump(post_id, settings.TRENDING_CREATE_WEIGHT)
+
+
+def record_post_viewed(post_id):
+    view_buffer.add(post_id)
+
+
+def trending_posts(limit=None):
+    limit = limit or settings.TRENDING_SIZE
+    if is_sharded():
+        post_ids = list(PostScore.objects.order_by('-score')
+                        .values_list('post_id', flat=True)[:limit])
+        posts = posts_in_bulk(
+            post_ids, Post.objects.defer('text', 'text_html_br'))
+        return [posts[pk] for pk in post_ids if pk in posts]
+    scores = (PostScore.objects.order_by('-score')
+              .select_related('post__author', 'post__group')
+              .defer('post__text', 'post__text_html_br')[:limit])
+    return [score.post for score in scores]
+
+
+def trending_groups(limit=None):
+    limit = limit or settings.TRENDING_GROUPS_SIZE
+    scores = (GroupScore.objects.order_by('-score')
+              .select_related('group')[:limit])
+    return [score.group for score in scores]
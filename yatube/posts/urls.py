@@ -6,9 +6,29 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('fragments/index/', views.index, {'fragment': True},
+         name='index_fragment'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
+    path('group/<slug:slug>/fragment/', views.group_posts,
+         {'fragment': True}, name='group_list_fragment'),
+    path('group/<slug:slug>/stats/', views.group_stats, name='group_stats'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('profile/<str:username>/fragment/', views.profile,
+         {'fragment': True}, name='profile_fragment'),
+    path('profile/<str:username>/stats/', views.author_stats,
+         name='author_stats'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('create/', views.post_create, name='create'),
+    path('groups/lookup/', views.group_lookup, name='group_lookup'),
+    path('trending/', views.trending, name='trending'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path('follow/', views.follow_index, name='follow_index'),
+    path('follow/fragment/', views.follow_index, {'fragment': True},
+         name='follow_index_fragment'),
+    path('profile/<str:username>/follow/',
+         views.profile_follow,
+         name='profile_follow'),
+    path('profile/<str:username>/unfollow/',
+         views.profile_unfollow,
+         name='profile_unfollow'),
 ]
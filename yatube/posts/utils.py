@@ -1,9 +1,211 @@
-from django.core.paginator import Paginator
+from datetime import datetime, timedelta, timezone
+
+from django.core.paginator import Page, Paginator
 from django.conf import settings
+from django.db.models import Q
+
+from core.cache import TwoTierCache
+
+from .registry import group_registry
+
+# Страницы лент: сбрасывается сигналами при изменении постов и групп
+feed_cache = TwoTierCache('feeds')
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def post_keys(posts):
+    """Ключи прокси для показанных постов: пост, автор и группа."""
+    keys = []
+    for post in posts:
+        keys.extend((f'post-{post.pk}', f'author-{post.author_id}'))
+        group = (group_registry.get_by_pk(post.group_id)
+                 if post.group_id is not None else None)
+        if group is not None:
+            keys.append(f'group-{group.slug}')
+    return keys
+
+
+def feed_scopes(author_id, *group_ids):
+    """Области feed_cache (ключи лент в views), где показан пост."""
+    return ['index', f'profile:{author_id}',
+            *(f'group:{group_id}'
+              for group_id in sorted(set(group_ids) - {None}))]
+
+
+def post_purge_keys(post):
+    """Ключи страниц, которые меняются при изменении поста."""
+    keys = [f'post-{post.pk}', 'feed-index', 'feed-follow', 'feed-trending',
+            f'feed-author-{post.author_id}']
+    # Пост, перенесённый в другую группу, уходит и из ленты прежней.
+    group_ids = {post.group_id, post._loaded_values.get('group_id')}
+    for group_id in sorted(group_ids - {None}):
+        group = group_registry.get_by_pk(group_id)
+        if group is not None:
+            keys.append(f'feed-group-{group.slug}')
+    return keys
+
+
+def format_cursor(pub_date, pk):
+    """Курсор ленты: время публикации в микросекундах и id."""
+    micros = (pub_date - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}.{pk}'
+
+
+def feed_cursor(post):
+    """Курсор ленты за постом."""
+    return format_cursor(post.pub_date, post.pk)
+
+
+def parse_cursor(value):
+    """(pub_date, id) из курсора или None, если курсора нет или он испорчен."""
+    try:
+        micros, pk = map(int, value.split('.'))
+    except (AttributeError, ValueError):
+        return None
+    return EPOCH + timedelta(microseconds=micros), pk
+
+
+def before_q(pub_date, pk, pk_field='pk'):
+    """Посты, которые в ленте (-pub_date, -id) идут после (pub_date, pk)."""
+    return (Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, **{f'{pk_field}__lt': pk}))
+
+
+def posts_before(posts, pub_date, pk):
+    """Лента posts за постом (pub_date, pk)."""
+    if hasattr(posts, 'before'):
+        return posts.before(pub_date, pk)
+    return posts.filter(before_q(pub_date, pk)).order_by('-pub_date', '-pk')
+
+
+def group_purge_keys(group):
+    return [f'group-{group.slug}', f'feed-group-{group.slug}', 'groups']
+
+
+def prefix_q(field, prefix):
+    """
+    Условие «field начинается с prefix» в виде диапазона: в отличие от
+    LIKE, сравнения используют обычный индекс по полю в любой СУБД.
+    """
+    return Q(**{f'{field}__gte': prefix,
+                f'{field}__lt': prefix + '\U0010ffff'})
 
 
-def get_page_context(request, post_list):
-    paginator = Paginator(post_list, settings.POSTS_ON_PAGE)
+class WindowedPage(Page):
+
+    @property
+    def window_range(self):
+        return self.paginator.get_window_range(self.number)
+
+    @property
+    def next_cursor(self):
+        return feed_cursor(self.object_list[-1])
+
+
+class CursorPage:
+    """
+    Страница ленты за курсором (подгрузка «Показать ещё»): посты
+    отбираются условием на (pub_date, id), а не смещением, поэтому новые
+    и удалённые посты не сдвигают следующую страницу.
+    """
+    number = None
+
+    def __init__(self, object_list, has_next):
+        self.object_list = object_list
+        self._has_next = has_next
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    @property
+    def next_cursor(self):
+        return feed_cursor(self.object_list[-1])
+
+
+class WindowedPaginator(Paginator):
+    """
+    Пагинатор, который вместо всех номеров страниц отдаёт окно:
+    первые и последние страницы, соседей текущей и многоточия между ними.
+    """
+    ELLIPSIS = '…'
+
+    def get_window_range(self, number=1, on_each_side=None, on_ends=None):
+        if on_each_side is None:
+            on_each_side = settings.PAGINATOR_ON_EACH_SIDE
+        if on_ends is None:
+            on_ends = settings.PAGINATOR_ON_ENDS
+        number = self.validate_number(number)
+        num_pages = self.num_pages
+
+        if num_pages <= (on_each_side + on_ends) * 2 + 1:
+            yield from self.page_range
+            return
+
+        if number > on_each_side + on_ends + 2:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+
+        if number < num_pages - on_each_side - on_ends - 1:
+            yield from range(number + 1, number + on_each_side + 1)
+            yield self.ELLIPSIS
+            yield from range(num_pages - on_ends + 1, num_pages + 1)
+        else:
+            yield from range(number + 1, num_pages + 1)
+
+    def _get_page(self, *args, **kwargs):
+        return WindowedPage(*args, **kwargs)
+
+
+def get_page_context(request, post_list, cache_key=None):
+    """
+    Страница ленты. С cache_key число постов и посты страницы берутся
+    из feed_cache (cache_key — и область кэша, её сбрасывают изменения
+    постов ленты, см. feed_scopes), запросы к базе выполняются только
+    при пересчёте.
+    С курсором (?before=) — CursorPage: посты ленты за ним, в кэше под
+    тем же ключом с курсором.
+    """
+    cursor = parse_cursor(request.GET.get('before'))
+    if cursor is not None:
+        size = settings.POSTS_ON_PAGE
+
+        def compute_after():
+            posts = list(posts_before(post_list, *cursor)[:size + 1])
+            return posts[:size], len(posts) > size
+
+        if cache_key is None:
+            return CursorPage(*compute_after())
+        return CursorPage(*feed_cache.get_or_set(
+            f'{cache_key}:c:{format_cursor(*cursor)}', compute_after,
+            scope=cache_key))
+    paginator = WindowedPaginator(post_list, settings.POSTS_ON_PAGE)
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    if cache_key is None:
+        return paginator.get_page(page_number)
+
+    try:
+        number = max(int(page_number), 1)
+    except (TypeError, ValueError):
+        number = 1
+
+    def compute():
+        page = paginator.get_page(number)
+        return paginator.count, page.number, list(page.object_list)
+
+    count, number, posts = feed_cache.get_or_set(
+        f'{cache_key}:{number}', compute, scope=cache_key)
+    paginator.count = count
+    return paginator._get_page(posts, number, paginator)
@@ -1,55 +1,181 @@
+from django.conf import settings
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 
-from .models import Group, Post, User
+from core.surrogate import add_surrogate_keys
+
+from .archive import feed, get_post_or_archived
+from .models import ActivityStats, Follow, Group, Post, User
 from .forms import PostForm
-from .utils import get_page_context
+from .registry import group_registry
+from .related import related_posts
+from .sharding import author_shards, find_post, sharded
+from .stats import refresh, summarize
+from .timeline import follow, timeline_posts, unfollow
+from .trending import record_post_viewed, trending_posts
+from .text import normalize_title
+from .utils import get_page_context, post_keys, prefix_q
+
+# Ленты показывают только начало текста, полный текст им не нужен.
+FEED_DEFERRED_FIELDS = ('text', 'text_html_br')
+
+# Тот же порядок, что у курсора подгрузки (utils.feed_cursor) и у шардов.
+FEED_ORDERING = ('-pub_date', '-pk')
+
+# Только посты страницы ленты и кнопка следующей — для подгрузки без макета.
+FEED_FRAGMENT_TEMPLATE = 'posts/includes/feed_page.html'
+
+
+def render_feed(request, template, context, keys, fragment=False):
+    """Лента целиком или, для подгрузки (fragment), только посты страницы."""
+    if fragment:
+        template = FEED_FRAGMENT_TEMPLATE
+    return add_surrogate_keys(render(request, template, context),
+                              [*keys, *post_keys(context['page_obj'])])
 
 
-def index(request):
-    posts = Post.objects.select_related('group', 'author')
+def index(request, fragment=False):
+    posts = Post.objects.select_related('group', 'author').defer(
+        *FEED_DEFERRED_FIELDS).order_by(*FEED_ORDERING)
+    page_obj = get_page_context(request, feed(sharded(posts)), 'index')
     context = {
-        'page_obj': get_page_context(request, posts)
+        'page_obj': page_obj,
+        'fragment_url': reverse('posts:index_fragment'),
     }
-    return render(request, 'posts/index.html', context)
+    return render_feed(request, 'posts/index.html', context, ['feed-index'],
+                       fragment)
 
 
-def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('author')
+def group_posts(request, slug, fragment=False):
+    group = group_registry.get_by_slug(slug)
+    if group is None:
+        raise Http404('Группа не найдена')
+    posts = group.posts.select_related('author').defer(
+        *FEED_DEFERRED_FIELDS).order_by(*FEED_ORDERING)
+    page_obj = get_page_context(
+        request, feed(sharded(posts), group=group), f'group:{group.pk}')
     context = {
         'group': group,
-        'page_obj': get_page_context(request, posts),
+        'page_obj': page_obj,
+        'fragment_url': reverse('posts:group_list_fragment', args=(slug,)),
+        'group_link': True,
     }
-    return render(request, 'posts/group_list.html', context)
+    return render_feed(
+        request, 'posts/group_list.html', context,
+        [f'feed-group-{group.slug}', f'group-{group.slug}'], fragment)
 
 
-def profile(request, username):
+def profile(request, username, fragment=False):
     author = get_object_or_404(User, username=username)
-    posts = author.posts.select_related('group')
+    posts = Post.objects.filter(author=author).select_related(
+        'group').defer(*FEED_DEFERRED_FIELDS).order_by(*FEED_ORDERING)
+    posts = sharded(posts, author_shards(author.pk))
+    page_obj = get_page_context(
+        request, feed(posts, author=author), f'profile:{author.pk}')
     context = {
         'author': author,
-        'page_obj': get_page_context(request, posts),
+        'page_obj': page_obj,
+        'fragment_url': reverse('posts:profile_fragment', args=(username,)),
+        'profile_link': True,
+    }
+    if not fragment:
+        context['following'] = (
+            request.user.is_authenticated
+            and Follow.objects.filter(
+                user=request.user, author=author).exists()
+        )
+    return render_feed(
+        request, 'posts/profile.html', context,
+        [f'feed-author-{author.pk}', f'author-{author.pk}'], fragment)
+
+
+def author_stats(request, username):
+    author = get_object_or_404(User, username=username)
+    context = {
+        'author': author,
+        'title': f'Статистика {author.get_full_name() or author.username}',
+        'stats': summarize(refresh(ActivityStats.AUTHOR, author.pk)),
+    }
+    return add_surrogate_keys(
+        render(request, 'posts/stats.html', context),
+        [f'feed-author-{author.pk}', f'author-{author.pk}'])
+
+
+def group_stats(request, slug):
+    group = group_registry.get_by_slug(slug)
+    if group is None:
+        raise Http404('Группа не найдена')
+    context = {
+        'group': group,
+        'title': f'Статистика группы {group.title}',
+        'stats': summarize(refresh(ActivityStats.GROUP, group.pk)),
+    }
+    return add_surrogate_keys(
+        render(request, 'posts/stats.html', context),
+        [f'feed-group-{group.slug}', f'group-{group.slug}'])
+
+
+def trending(request):
+    posts = trending_posts()
+    context = {
+        'posts': posts,
     }
-    return render(request, 'posts/profile.html', context)
+    return add_surrogate_keys(
+        render(request, 'posts/trending.html', context),
+        ['feed-trending', *post_keys(posts)])
 
 
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_post_or_archived(post_id)
+    if not post.is_archived:
+        record_post_viewed(post.pk)
+    related = related_posts(post)
     context = {
-        'post': post
+        'post': post,
+        'related_posts': related,
     }
-    return render(request, 'posts/post_detail.html', context)
+    return add_surrogate_keys(
+        render(request, 'posts/post_detail.html', context),
+        post_keys([post, *related]))
+
+
+@login_required
+def group_lookup(request):
+    """Группы для выбора в форме поста: поиск по началу названия или slug."""
+    query = normalize_title(request.GET.get('q', ''))
+    page = request.GET.get('page', '')
+    page = int(page) if page.isdigit() and int(page) > 0 else 1
+    size = settings.GROUP_LOOKUP_PAGE_SIZE
+    groups = Group.objects.all()
+    if query:
+        groups = groups.filter(prefix_q('title_normalized', query)
+                               | prefix_q('slug', query))
+    offset = (page - 1) * size
+    # Лишняя строка показывает, есть ли следующая страница.
+    found = list(groups.order_by('title_normalized', 'pk')
+                 .values_list('pk', 'title')[offset:offset + size + 1])
+    response = JsonResponse({
+        'results': [{'id': pk, 'text': title} for pk, title in found[:size]],
+        'more': len(found) > size,
+    })
+    return add_surrogate_keys(response, ['groups'])
 
 
 @login_required
 def post_create(request):
-    form = PostForm(request.POST, None)
+    form = PostForm(
+        request.POST or None,
+        files=request.FILES or None,
+    )
     context = {
         'form': form,
     }
     if not form.is_valid():
-        return render(request, 'posts/create_post.html', context)
+        return add_surrogate_keys(
+            render(request, 'posts/create_post.html', context),
+            ['post-form'])
     post = form.save(commit=False)
     post.author = request.user
     post.save()
@@ -58,7 +184,9 @@ def post_create(request):
 
 @login_required
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = find_post(post_id)
+    if post is None:
+        raise Http404('Пост не найден')
     if post.author != request.user:
         return redirect('posts:post_detail', post_id=post_id)
 
@@ -71,4 +199,34 @@ def post_edit(request, post_id):
         form.save()
         return redirect('posts:post_detail', post_id=post_id)
     context = {'form': form, 'post_id': post_id}
-    return render(request, 'posts/create_post.html', context)
+    return add_surrogate_keys(
+        render(request, 'posts/create_post.html', context),
+        ['post-form', *post_keys([post])])
+
+
+@login_required
+def follow_index(request, fragment=False):
+    posts = Post.objects.select_related('group', 'author').defer(
+        *FEED_DEFERRED_FIELDS)
+    page_obj = get_page_context(request, timeline_posts(request.user, posts))
+    context = {
+        'page_obj': page_obj,
+        'fragment_url': reverse('posts:follow_index_fragment'),
+    }
+    return render_feed(request, 'posts/follow.html', context,
+                       ['feed-follow'], fragment)
+
+
+@login_required
+def profile_follow(request, username):
+    author = get_object_or_404(User, username=username)
+    if author != request.user:
+        follow(request.user, author)
+    return redirect('posts:profile', username=username)
+
+
+@login_required
+def profile_unfollow(request, username):
+    author = get_object_or_404(User, username=username)
+    unfollow(request.user, author)
+    return redirect('posts:profile', username=username)
@@ -0,0 +1,83 @@
+// Подгрузка ленты: кнопка «Показать ещё» ([data-feed-more]) заменяется
+// HTML-фрагментом следующей страницы — её постами и новой кнопкой.
+// Фрагмент берётся по курсору (после последнего показанного поста), а
+// посты, которые уже есть в ленте, всё равно отбрасываются по data-post-id.
+// Без JavaScript кнопка и пагинатор работают как обычные ссылки.
+(function () {
+  'use strict';
+
+  var observer = null;
+
+  // Убирает из фрагмента посты, уже показанные в ленте, вместе с <hr>
+  // перед ними.
+  function dropShown(fragment, feed) {
+    fragment.querySelectorAll('[data-post-id]').forEach(function (post) {
+      var selector = '[data-post-id="' + post.dataset.postId + '"]';
+      if (!feed.querySelector(selector)) {
+        return;
+      }
+      var previous = post.previousElementSibling;
+      if (previous && previous.tagName === 'HR') {
+        previous.remove();
+      }
+      post.remove();
+    });
+  }
+
+  function load(button) {
+    if (button.dataset.loading) {
+      return;
+    }
+    button.dataset.loading = '1';
+    fetch(button.dataset.fragmentUrl, {credentials: 'same-origin'})
+      .then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.statusText);
+        }
+        return response.text();
+      })
+      .then(function (html) {
+        var feed = button.closest('[data-feed]');
+        var template = document.createElement('template');
+        template.innerHTML = html;
+        dropShown(template.content, feed);
+        button.parentNode.insertBefore(template.content, button);
+        button.remove();
+        // Номера страниц после подгрузки уже не соответствуют ленте.
+        document.querySelectorAll('[data-feed-paginator]')
+          .forEach(function (paginator) { paginator.remove(); });
+        setup(feed);
+      })
+      .catch(function () {
+        delete button.dataset.loading;  // повторит следующий клик
+      });
+  }
+
+  function setup(feed) {
+    var button = feed.querySelector('[data-feed-more]:not([data-ready])');
+    if (!button) {
+      return;
+    }
+    button.dataset.ready = '1';
+    button.addEventListener('click', function (event) {
+      event.preventDefault();
+      load(button);
+    });
+    if (observer) {
+      observer.observe(button);
+    }
+  }
+
+  if ('IntersectionObserver' in window) {
+    observer = new IntersectionObserver(function (entries) {
+      entries.forEach(function (entry) {
+        if (entry.isIntersecting) {
+          observer.unobserve(entry.target);
+          load(entry.target);
+        }
+      });
+    }, {rootMargin: '600px'});
+  }
+
+  document.querySelectorAll('[data-feed]').forEach(setup);
+})();
@@ -0,0 +1,72 @@
+// Поиск групп для <select data-lookup-url>: варианты подгружаются
+// с сервера по началу названия, а не встраиваются в страницу целиком.
+(function () {
+  'use strict';
+
+  var DELAY = 250;
+
+  function option(value, text, selected) {
+    var element = document.createElement('option');
+    element.value = value;
+    element.textContent = text;
+    element.selected = selected;
+    return element;
+  }
+
+  function setup(select) {
+    var url = select.dataset.lookupUrl;
+    var search = document.createElement('input');
+    search.type = 'search';
+    search.className = 'form-control mb-2';
+    search.placeholder = 'Начните вводить название группы';
+    search.setAttribute('aria-controls', select.id);
+    select.parentNode.insertBefore(search, select);
+
+    var timer = null;
+    var request = 0;
+
+    function load(query, page) {
+      var current = ++request;
+      var params = new URLSearchParams({q: query, page: page});
+      fetch(url + '?' + params, {credentials: 'same-origin'})
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          if (current !== request) {
+            return;  // пришёл ответ на устаревший запрос
+          }
+          var selected = select.options[select.selectedIndex];
+          var empty = select.options[0];
+          select.innerHTML = '';
+          select.appendChild(empty);
+          if (selected && selected.value) {
+            select.appendChild(selected);
+          }
+          data.results.forEach(function (group) {
+            if (!selected || String(group.id) !== selected.value) {
+              select.appendChild(option(group.id, group.text, false));
+            }
+          });
+          if (data.more) {
+            var more = option('', 'Уточните запрос, чтобы увидеть остальные',
+                              false);
+            more.disabled = true;
+            select.appendChild(more);
+          }
+        });
+    }
+
+    search.addEventListener('input', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () { load(search.value, 1); }, DELAY);
+    });
+    select.addEventListener('focus', function () {
+      if (select.options.length <= 2 && !search.value) {
+        load('', 1);
+      }
+    }, {once: true});
+  }
+
+  document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('select[data-lookup-url]').forEach(setup);
+  });
+}());
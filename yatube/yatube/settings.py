@@ -1,4 +1,7 @@
 import os
+from datetime import timedelta
+
+from django.utils.module_loading import import_string
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -26,7 +29,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.AccessLogMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.AdmissionMiddleware',
+    # Сжатие должно стоять выше всего, что читает или меняет тело ответа,
+    # а UpdateCacheMiddleware (если появится) — выше сжатия.
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -39,7 +48,8 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.templates_backend.InstrumentedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [
             os.path.join(BASE_DIR, 'templates'),
         ],
@@ -63,9 +73,39 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+    },
+    # Общий кэш и версии кэшей (core.routers.CacheRouter): его записи
+    # не блокируют базу сайта. Схему создаёт migrate --database=cache.
+    'cache': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.cache.sqlite3'),
+    },
 }
 
+CACHE_DATABASE = 'cache'
+
+# Шарды постов (posts.sharding): POST_SHARDS=3 добавляет к default базы
+# posts_1 и posts_2. Схему в них создаёт migrate --database=posts_1.
+POST_SHARDS = ['default']
+
+for index in range(1, int(os.getenv('POST_SHARDS', 1))):
+    DATABASES[f'posts_{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, f'db.posts_{index}.sqlite3'),
+    }
+    POST_SHARDS.append(f'posts_{index}')
+
+DATABASE_ROUTERS = [
+    'core.routers.CacheRouter',
+    'posts.sharding.PostShardRouter',
+]
+
+# Сколько id постов процесс берёт из счётчика за раз
+POST_ID_BLOCK_SIZE = 100
+
+# Размер пачки при переносе постов автора в другой шард
+POST_SHARD_MOVE_BATCH_SIZE = 500
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -97,18 +137,293 @@ POSTS_ON_PAGE = 10
 
 POSTS_ON_SECOND_PAGE = 5
 
+# Сколько номеров страниц показывать вокруг текущей и по краям
+PAGINATOR_ON_EACH_SIDE = 2
+
+PAGINATOR_ON_ENDS = 1
+
+# Сколько групп отдаёт за раз поиск групп в форме поста
+GROUP_LOOKUP_PAGE_SIZE = 20
+
+# Статистика активности (posts.stats): отставание отметки от текущего
+# времени и сколько дней и недель показывать
+ACTIVITY_STATS_LAG = timedelta(minutes=1)
+
+ACTIVITY_STATS_DAYS = 30
+
+ACTIVITY_STATS_WEEKS = 12
+
+# Похожие посты (posts.related): файл индекса, отставание его отметки
+# от текущего времени, сколько соседей хранить и показывать, с какой доли
+# постов слово считается общим и не учитывается, сколько самых весомых
+# постов по слову просматривать, минимальная близость соседа и размер
+# пачки при записи
+RELATED_INDEX_PATH = os.path.join(BASE_DIR, 'related_index.sqlite3')
+
+RELATED_INDEX_LAG = timedelta(minutes=1)
+
+RELATED_POSTS_STORED = 10
+
+RELATED_POSTS_SHOWN = 5
+
+RELATED_MAX_DF = 0.1
+
+RELATED_POSTINGS_WALKED = 1000
+
+RELATED_MIN_SCORE = 0.05
+
+RELATED_BATCH_SIZE = 500
+
+# Поиск почти одинаковых постов (posts.duplicates): шинглы из скольких
+# слов, полосы и строки LSH, порог сходства, с какой длины текст
+# проверяется, сколько шинглов длинного текста подписывается и размер
+# пачки для index_duplicates
+DUPLICATE_SHINGLE_WORDS = 3
+
+DUPLICATE_BANDS = 16
+
+DUPLICATE_ROWS = 8
+
+DUPLICATE_THRESHOLD = 0.9
+
+DUPLICATE_MIN_LENGTH = 50
+
+DUPLICATE_MAX_SHINGLES = 500
+
+DUPLICATE_BATCH_SIZE = 1000
+
+# Длина начала текста поста, которое показывается в лентах
+POST_EXCERPT_LENGTH = 300
+
+# Архив старых постов (posts.archive)
+ARCHIVE_AFTER = timedelta(days=90)
+
+ARCHIVE_BATCH_SIZE = 500
+
+ARCHIVE_ZLIB_LEVEL = 6
+
+# Сколько секунд хранится число постов архива в ленте (archive_counts)
+ARCHIVE_COUNT_TIMEOUT = 3600
+
+# Размер пачки при удалении пользователей и групп (posts.deletion)
+DELETION_CHUNK_SIZE = 500
+
+# Фоновые действия админки (posts.bulk): размер пачки и пауза между
+# пачками в секундах, чтобы запись в SQLite доставалась и сайту
+BULK_JOB_CHUNK_SIZE = 500
+
+BULK_JOB_PAUSE = 0.05
+
+# Обработчик, не отмечавшийся дольше этого, считается упавшим: его задачу
+# можно продолжить (posts.bulk.claimable)
+BULK_JOB_LEASE = timedelta(minutes=5)
+
 NUMBER_ONE = 1
 
 ZERO = 0
 
 THIRTY = 30
 
+# Сжатие ответов (core.middleware.CompressionMiddleware)
+COMPRESSION_LEVEL = 6
+
+COMPRESSION_MIN_LENGTH = 200
+
+COMPRESSION_SKIP_TYPES = (
+    'image/',
+    'video/',
+    'audio/',
+    'font/woff',
+    'application/zip',
+    'application/gzip',
+    'application/x-gzip',
+    'application/octet-stream',
+)
+
 STATIC_URL = '/static/'
 
 STATICFILES_DIRS = (
     os.path.join(BASE_DIR, 'static'),
 )
 
+MEDIA_URL = '/media/'
+
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Логи: JSON Lines через очередь и фоновый поток (core.log), у каждого
+# процесса свой файл
+LOG_DIR = os.path.join(BASE_DIR, 'logs')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'core.log.JSONFormatter'},
+    },
+    'handlers': {
+        'jsonl': {
+            'class': 'core.log.BoundedQueueHandler',
+            'formatter': 'json',
+            'filename': os.path.join(LOG_DIR, 'yatube.{pid}.jsonl'),
+            'max_bytes': 50 * 1024 * 1024,
+            'backup_count': 5,
+            # Сверх этого записи отбрасываются, а не ждут диска
+            'queue_size': 10000,
+            'batch_size': 500,
+            'flush_interval': 1.0,
+        },
+    },
+    'root': {
+        'handlers': ['jsonl'],
+        'level': 'INFO',
+    },
+}
+
+# Метрики Prometheus (core.metrics): каталог общих файлов процессов,
+# None — подкаталог во временном каталоге системы
+METRICS_DIR = None
+
+# Как часто процесс сбрасывает свои счётчики в файл, секунды
+METRICS_FLUSH_INTERVAL = 5
+
+# /metrics отдаётся только с заголовком Authorization: Bearer <токен>;
+# без токена метрики не отдаются никому
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Ограничение нагрузки (core.middleware.AdmissionMiddleware) действует
+# между потоками воркера gthread, которых GUNICORN_THREADS (gunicorn.conf.py).
+# Ожидающий в очереди запрос тоже занимает поток: если лимит и очереди
+# вместе больше числа потоков, лишние запросы ждут в gunicorn, а не здесь.
+ADMISSION_THREADS = int(os.getenv('GUNICORN_THREADS', 16))
+
+ADMISSION_CONCURRENCY = ADMISSION_THREADS // 2
+
+# priority: меньше — раньше из очереди; timeout — ожидание, секунды.
+# Очереди классов в сумме — оставшаяся половина потоков.
+ADMISSION_CLASSES = {
+    'cheap': {'priority': 0, 'limit': ADMISSION_CONCURRENCY,
+              'queue': ADMISSION_THREADS // 4, 'timeout': 2.0},
+    'expensive': {'priority': 1, 'limit': ADMISSION_CONCURRENCY // 2,
+                  'queue': ADMISSION_THREADS // 8, 'timeout': 1.0},
+    # SQLite пишет в один поток, больше двух писателей только ждут
+    'write': {'priority': 2, 'limit': 2, 'queue': ADMISSION_THREADS // 8,
+              'timeout': 1.0},
+}
+
+# Классы маршрутов по имени URL или пространству имён. Небезопасные
+# методы всегда 'write', страницы лент дальше ADMISSION_DEEP_PAGE —
+# 'expensive', остальное — 'cheap'.
+ADMISSION_ROUTES = {
+    'posts:follow_index': 'expensive',
+    'posts:follow_index_fragment': 'expensive',
+    'admin': 'expensive',
+}
+
+ADMISSION_DEEP_PAGE = 10
+
+ADMISSION_RETRY_AFTER = 1
+
+# Ключи для кэширующего прокси (core.surrogate). Для Cloudflare:
+# заголовок 'Cache-Tag' и разделитель ','
+SURROGATE_KEY_HEADER = 'Surrogate-Key'
+
+SURROGATE_KEY_SEPARATOR = ' '
+
+# Адрес очистки ключей в прокси; None — очистка выключена
+SURROGATE_PURGE_URL = os.getenv('SURROGATE_PURGE_URL')
+
+SURROGATE_PURGE_METHOD = 'POST'
+
+# Дополнительные заголовки запроса очистки, например токен прокси
+SURROGATE_PURGE_HEADERS = {}
+
+# Сколько секунд копить ключи перед отправкой, сколько слать за раз
+SURROGATE_PURGE_DELAY = 0.5
+
+SURROGATE_PURGE_BATCH_SIZE = 256
+
+SURROGATE_PURGE_TIMEOUT = 5
+
+# Общий для всех процессов кэш: через него TwoTierCache блокирует
+# пересчёт, а реестр групп узнаёт об изменениях; версии TwoTierCache —
+# в таблице core.CacheVersion. Кэш в памяти процесса (по умолчанию
+# в Django) воркеры gunicorn не делят. Таблица лежит в базе CACHE_DATABASE,
+# её создаёт migrate --database=cache (миграция core).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'yatube_cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Двухуровневый кэш (core.cache.TwoTierCache), секунды
+TWO_TIER_CACHE_TIMEOUT = 60
+
+TWO_TIER_CACHE_STALE_TIMEOUT = 30
+
+TWO_TIER_CACHE_LOCAL_TIMEOUT = 5
+
+TWO_TIER_CACHE_MAX_SIZE = 500
+
+TWO_TIER_CACHE_LOCK_TIMEOUT = 10
+
+TWO_TIER_CACHE_WAIT = 2
+
+# Множитель досрочного пересчёта (XFetch); 0 — без досрочного пересчёта
+TWO_TIER_CACHE_BETA = 1.0
+
+# Фоновые задачи (core.tasks); 0 — выполнять сразу в текущем потоке
+BACKGROUND_WORKERS = 2
+
+# Сколько задач может ждать в очереди пула; лишние отбрасываются
+BACKGROUND_QUEUE_SIZE = 1000
+
+# Размеры превью картинок постов: имя -> (ширина, высота)
+POST_THUMBNAIL_SIZES = {
+    'card': (960, 339),
+    'detail': (1280, 720),
+}
+
+THUMBNAIL_QUALITY = 85
+
+# Сколько групп держать в памяти процесса (posts.registry)
+GROUP_CACHE_MAX_SIZE = 1000
+
+# Как часто реестр групп сверяет версию в общем кэше, секунды
+GROUP_CACHE_CHECK_INTERVAL = 1
+
+# Лента подписок (posts.timeline): у авторов с большим числом подписчиков
+# посты не раскладываются по лентам, а подтягиваются при чтении
+TIMELINE_FANOUT_LIMIT = 10000
+
+TIMELINE_BATCH_SIZE = 1000
+
+TIMELINE_BACKFILL = 100
+
+# Рейтинги «в тренде» (posts.trending)
+TRENDING_HALF_LIFE = timedelta(hours=6)
+
+TRENDING_REBASE_AFTER = timedelta(days=7)
+
+TRENDING_MIN_SCORE = 0.01
+
+TRENDING_CREATE_WEIGHT = 3.0
+
+TRENDING_VIEW_WEIGHT = 1.0
+
+# Как часто просмотры, накопленные в процессе, пишутся в рейтинги, секунды
+TRENDING_VIEW_FLUSH_INTERVAL = 5
+
+TRENDING_SIZE = 10
+
+TRENDING_GROUPS_SIZE = 5
+
+# user.get_absolute_url() — профиль автора (posts.links)
+ABSOLUTE_URL_OVERRIDES = {
+    'auth.user': lambda user: import_string('posts.links.author_url')(user),
+}
+
 LOGIN_URL = 'users:login'
 
 LOGIN_REDIRECT_URL = 'posts:index'